@@ -0,0 +1,3 @@
+"""
+    Benchmarks for keynoteapi (not installed, run from the source tree)
+"""
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+    Single slot lookup from a cold process: JSON cache file (full parse)
+    against the mmap'ed binary cache.
+
+    python -m benchmarks.bench_binary_cache
+"""
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.keynoteapi import KeynoteApi
+
+
+def lookup(tmpdir, cache_format, alias, repeat):
+    """ time a fresh KeynoteApi answering one slot, best of repeat """
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        kapi = KeynoteApi('benchmark')
+        kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+        kapi.cache_format = cache_format
+        kapi.get_avail_data(alias)
+        kapi.get_perf_data(alias)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(slots, repeat=5):
+    tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+    try:
+        kapi = KeynoteApi('benchmark')
+        kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+        kapi.cache_format = 'binary'
+        kapi.write_cache(gen_dashboarddata(slots),
+                         kapi.cache_filename + 'getdashboarddata')
+        alias = 'SLOT_%06i' % (slots // 2)
+        sizes = [os.path.getsize(kapi.cache_filename + 'getdashboarddata' +
+                                 suffix) for suffix in ('', '.bin')]
+        return (sizes, lookup(tmpdir, 'json', alias, repeat),
+                lookup(tmpdir, 'binary', alias, repeat))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    print("%8s %12s %12s %12s %12s %9s" % ('slots', 'json [B]', 'bin [B]',
+                                           'json [s]', 'binary [s]',
+                                           'speedup'))
+    for slots in (10, 1000, 50000):
+        (json_size, bin_size), json_time, bin_time = run(slots)
+        print("%8i %12i %12i %12.6f %12.6f %8.1fx" % (
+            slots, json_size, bin_size, json_time, bin_time,
+            json_time / max(bin_time, 1e-9)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+    Read and write latency of the cache backends
+
+    python -m benchmarks.bench_cache_backends [--sizes 10,1000,10000]
+
+    Writes synthetic getdashboarddata responses to every backend and reads
+    them back through a new KeynoteApi each time, like a long-lived process
+    creating instances per request. "file+memory" is the default setup:
+    the JSON cache files with the process-wide memory tier in front.
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.cachebackend import MemoryBackend, SqliteBackend
+from keynoteapi.keynoteapi import KeynoteApi
+
+DEFAULT_SIZES = (10, 1000, 10000)
+BACKENDS = ('file', 'file+memory', 'sqlite', 'sqlite+memory', 'memory')
+
+
+def make_api(tmpdir, backend, memory_cache):
+    kapi = KeynoteApi('benchmark')
+    kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+    kapi.cache_backend = backend
+    kapi.memory_cache = memory_cache
+    return kapi
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_backend(name, tmpdir, response, repeat):
+    """ (write seconds, read seconds) of one backend, best of repeat """
+    backend = None
+    if name.startswith('sqlite'):
+        backend = SqliteBackend(os.path.join(tmpdir, 'cache.sqlite'))
+    elif name == 'memory':
+        backend = MemoryBackend(max_bytes=None)
+    memory_cache = MemoryBackend(max_bytes=None) \
+        if name.endswith('+memory') else None
+    writer = make_api(tmpdir, backend, memory_cache)
+    cache_filename = writer.cache_filename + 'getdashboarddata'
+    try:
+        write = best_of(lambda: writer.write_cache(response, cache_filename),
+                        repeat)
+        read = best_of(lambda: make_api(tmpdir, backend, memory_cache)
+                       .get_api_response('getdashboarddata'), repeat)
+    finally:
+        if isinstance(backend, SqliteBackend):
+            backend.close()
+    return write, read
+
+
+def run(sizes=DEFAULT_SIZES, backends=BACKENDS, repeat=5, report=None):
+    """ returns [{backend, slots, write, read}, ...] """
+    results = []
+    for slots in sizes:
+        response = gen_dashboarddata(slots)
+        for name in backends:
+            tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+            try:
+                write, read = run_backend(name, tmpdir, response, repeat)
+            finally:
+                shutil.rmtree(tmpdir)
+            result = {'backend': name, 'slots': slots, 'write': write,
+                      'read': read}
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated slot counts. Default: %(default)s')
+    argp.add_argument('--repeat', type=int, default=5)
+    args = argp.parse_args()
+
+    print("%-14s %8s %12s %12s" % ('backend', 'slots', 'write [ms]',
+                                   'read [ms]'))
+
+    def print_result(result):
+        print("%-14s %8i %12.3f %12.3f" % (
+            result['backend'], result['slots'], result['write'] * 1e3,
+            result['read'] * 1e3))
+
+    run([int(size) for size in args.sizes.split(',')], repeat=args.repeat,
+        report=print_result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+    Size and read/write cost of compressed cache files
+
+    python -m benchmarks.bench_compression [--sizes 1000,10000,100000]
+
+    Writes synthetic getdashboarddata responses plain, gzip and zlib
+    compressed through the FileBackend and reads them back with a new
+    KeynoteApi (without the memory tier): the whole response with
+    get_api_response and a single slot with the streaming
+    find_measurement. The bytes column is what a cache file (or the same
+    encoded transfer) costs on disk and on the wire.
+"""
+from __future__ import print_function
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.keynoteapi import KeynoteApi
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+COMPRESSIONS = (None, 'gzip', 'zlib')
+
+
+def make_api(tmpdir, compression):
+    kapi = KeynoteApi('benchmark')
+    kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+    kapi.cache_compression = compression
+    kapi.cache_maxage = 3600
+    kapi.memory_cache = None
+    return kapi
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_compression(compression, tmpdir, response, alias, repeat):
+    """ (bytes, write seconds, read seconds, find seconds) """
+    writer = make_api(tmpdir, compression)
+    cache_filename = writer.cache_filename + 'getdashboarddata'
+    write = best_of(lambda: writer.write_cache(response, cache_filename),
+                    repeat)
+    read = best_of(lambda: make_api(tmpdir, compression)
+                   .get_api_response('getdashboarddata'), repeat)
+    find = best_of(lambda: make_api(tmpdir, compression)
+                   .find_measurement(alias), repeat)
+    return os.path.getsize(cache_filename), write, read, find
+
+
+def run(sizes=DEFAULT_SIZES, compressions=COMPRESSIONS, repeat=3,
+        report=None):
+    """ returns [{compression, slots, bytes, write, read, find}, ...] """
+    results = []
+    for slots in sizes:
+        response = gen_dashboarddata(slots)
+        # the last slot, a streaming lookup has to decode the whole file
+        alias = response['product'][-1]['measurement'][-1]['alias']
+        for compression in compressions:
+            tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+            try:
+                size, write, read, find = run_compression(
+                    compression, tmpdir, response, alias, repeat)
+            finally:
+                shutil.rmtree(tmpdir)
+            result = {'compression': compression or 'plain', 'slots': slots,
+                      'bytes': size, 'write': write, 'read': read,
+                      'find': find}
+            results.append(result)
+            if report is not None:
+                report(result)
+    return results
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated slot counts. Default: %(default)s')
+    argp.add_argument('--repeat', type=int, default=3)
+    args = argp.parse_args()
+
+    print("%-6s %8s %12s %12s %12s %12s" % ('format', 'slots', 'bytes',
+                                            'write [ms]', 'read [ms]',
+                                            'find [ms]'))
+
+    def print_result(result):
+        print("%-6s %8i %12i %12.3f %12.3f %12.3f" % (
+            result['compression'], result['slots'], result['bytes'],
+            result['write'] * 1e3, result['read'] * 1e3,
+            result['find'] * 1e3))
+
+    run([int(size) for size in args.sizes.split(',')], repeat=args.repeat,
+        report=print_result)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+    JSON versus XML responses: payload size, parse time and peak memory
+
+    python -m benchmarks.bench_formats [--sizes 1000,10000] [--output FILE]
+
+    Both formats of the same synthetic getdashboarddata response are parsed
+    into the data model (json.load, xmlresponse.parse) and streamed slot by
+    slot (streaming.iter_measurements, xmlresponse.iter_measurements).
+    Peak memory needs tracemalloc (Python >= 3.4).
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata, write_xml
+from keynoteapi import streaming, xmlresponse
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+DEFAULT_SIZES = (1000, 10000)
+
+
+def measure(func, filename, repeat):
+    """ best seconds and peak bytes (None without tracemalloc) """
+    def run():
+        with open(filename, 'rb') as infile:
+            func(infile)
+
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        run()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def drain(iterator):
+    for _ in iterator:
+        pass
+
+
+CASES = (
+    ('json', 'load', json.load),
+    ('json', 'stream', lambda infile: drain(
+        streaming.iter_measurements(infile))),
+    ('xml', 'load', xmlresponse.parse),
+    ('xml', 'stream', lambda infile: drain(
+        xmlresponse.iter_measurements(infile))),
+)
+
+
+def run(sizes=DEFAULT_SIZES, layouts=('list', 'grid'), repeat=3,
+        report=None):
+    """ returns a list of result dicts """
+    results = []
+    tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+    try:
+        for layout in layouts:
+            for slots in sizes:
+                data = gen_dashboarddata(slots, products=4, layout=layout)
+                files = {'json': os.path.join(tmpdir, 'response.json'),
+                         'xml': os.path.join(tmpdir, 'response.xml')}
+                with open(files['json'], 'w') as outfile:
+                    json.dump(data, outfile)
+                write_xml(data, files['xml'])
+                for api_format, mode, func in CASES:
+                    best, peak = measure(func, files[api_format], repeat)
+                    result = {'format': api_format, 'mode': mode,
+                              'layout': layout, 'slots': slots,
+                              'bytes': os.path.getsize(files[api_format]),
+                              'best': best, 'peak_memory': peak}
+                    results.append(result)
+                    if report is not None:
+                        report(result)
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def print_result(result):
+    print("%-5s %-7s %-5s %8i %12i %10.4f %12s" % (
+        result['format'], result['mode'], result['layout'], result['slots'],
+        result['bytes'], result['best'],
+        '-' if result['peak_memory'] is None else result['peak_memory']),
+        file=sys.stderr)
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated slot counts. Default: %(default)s')
+    argp.add_argument('--repeat', type=int, default=3)
+    argp.add_argument('-o', '--output', help='write the results as JSON '
+                      'to this file')
+    args = argp.parse_args()
+
+    print("%-5s %-7s %-5s %8s %12s %10s %12s" % (
+        'fmt', 'mode', 'lay', 'slots', 'bytes', 'best [s]', 'peak [B]'),
+        file=sys.stderr)
+    results = run([int(size) for size in args.sizes.split(',')],
+                  repeat=args.repeat, report=print_result)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=1, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
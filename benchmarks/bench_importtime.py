@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+    Startup cost of a check answered from a warm cache: a fresh interpreter
+    imports keynoteapi and reads one slot from a cache file.
+
+    python -m benchmarks.bench_importtime [--budget-ms MS]
+
+    Exits non-zero if the best run exceeds the budget, so it can guard
+    against import time regressions.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.keynoteapi import KeynoteApi
+
+# modules a warm cache lookup must not need
+HEAVY_MODULES = ('ssl', 'http.client', 'httplib', 'socketserver',
+                 'SocketServer', 'tempfile', 'threading', 'mmap', 'zlib',
+                 'hashlib', 'email.parser', 'requesocks', 'urllib2')
+
+LOOKUP = """
+import json, sys
+from keynoteapi.keynoteapi import KeynoteApi
+kapi = KeynoteApi('benchmark')
+kapi.cache_filename = sys.argv[1]
+kapi.get_perf_data(sys.argv[2])
+print(json.dumps(sorted(name for name in sys.argv[3:]
+                        if name in sys.modules)))
+"""
+
+
+def run_lookup(cache_filename, alias, python=sys.executable):
+    """ run one cold lookup. returns (seconds, heavy modules imported) """
+    start = time.time()
+    output = subprocess.check_output(
+        [python, '-c', LOOKUP, cache_filename, alias] + list(HEAVY_MODULES),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return time.time() - start, json.loads(output.decode('utf-8'))
+
+
+def run_baseline(python=sys.executable):
+    """ time of a bare interpreter start, subtracted from the lookups """
+    start = time.time()
+    subprocess.check_call([python, '-c', 'pass'])
+    return time.time() - start
+
+
+def import_profile(python=sys.executable, top=5):
+    """ slowest modules (cumulative us) of '-X importtime', Python >= 3.7 """
+    if sys.version_info < (3, 7):
+        return []
+    output = subprocess.check_output(
+        [python, '-X', 'importtime', '-c', 'import keynoteapi.keynoteapi'],
+        stderr=subprocess.STDOUT).decode('utf-8')
+    modules = []
+    for line in output.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        modules.append((int(cumulative), name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def run(slots=100, repeat=10):
+    tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+    try:
+        kapi = KeynoteApi('benchmark')
+        kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+        kapi.write_cache(gen_dashboarddata(slots),
+                         kapi.cache_filename + 'getdashboarddata')
+        alias = 'SLOT_%06i' % (slots // 2)
+        baseline = min(run_baseline() for _ in range(repeat))
+        runs = [run_lookup(kapi.cache_filename, alias) for _ in range(repeat)]
+        return baseline, min(runs)[0], runs[0][1]
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--budget-ms', type=float, default=None,
+                      help='fail if the lookup takes more than MS '
+                      'milliseconds on top of the interpreter start')
+    argp.add_argument('--repeat', type=int, default=10)
+    args = argp.parse_args()
+
+    baseline, lookup, heavy = run(repeat=args.repeat)
+    cost = (lookup - baseline) * 1000
+    print("%-28s %8.1f ms" % ('interpreter start', baseline * 1000))
+    print("%-28s %8.1f ms" % ('warm cache lookup', lookup * 1000))
+    print("%-28s %8.1f ms" % ('keynoteapi cost', cost))
+    print("%-28s %s" % ('heavy modules imported', ', '.join(heavy) or '-'))
+    for cumulative, name in import_profile():
+        print("%-28s %8.1f ms" % ('  import ' + name, cumulative / 1000.0))
+    if args.budget_ms is not None and cost > args.budget_ms:
+        print("over budget: %.1f ms > %.1f ms" % (cost, args.budget_ms))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
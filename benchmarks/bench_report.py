@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+    Scaling of the slot listing (keynoteCli -l) with the number of slots
+
+    python -m benchmarks.bench_report [--sizes 1000,10000,100000]
+                                      [--max-exponent 1.3]
+
+    Renders the text and table listing of synthetic responses and prints
+    the time per slot. The scaling exponent is the slope of log(time) over
+    log(slots): 1 is linear, a listing rescanning the response per slot
+    would be 2. Exits non-zero if it exceeds --max-exponent.
+"""
+from __future__ import print_function
+import argparse
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from benchmarks.run import NullWriter
+from keynoteapi.keynoteapi import KeynoteApi
+from keynoteapi.keynotecli import KeynoteCli
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def time_listing(filename, report_format, sort, repeat):
+    """ best seconds of KeynoteCli.list_measurements on filename """
+    best = None
+    for _ in range(repeat):
+        kcli = KeynoteCli('benchmark', mockinput=filename)
+        start = time.time()
+        kcli.list_measurements(report_format, sort, outfile=NullWriter())
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(sizes=DEFAULT_SIZES, layouts=('list', 'grid'), repeat=3,
+        report=None):
+    """ returns [{layout, format, sort, slots, best, per_slot}, ...] """
+    results = []
+    tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+    try:
+        for layout in layouts:
+            for slots in sizes:
+                filename = os.path.join(tmpdir, 'getdashboarddata')
+                KeynoteApi.write_json_response(
+                    gen_dashboarddata(slots, products=4, layout=layout),
+                    filename)
+                for report_format, sort in (('text', 'slot'),
+                                            ('table', 'avail:last_one_hour')):
+                    best = time_listing(filename, report_format, sort,
+                                        repeat)
+                    result = {'layout': layout, 'format': report_format,
+                              'sort': sort, 'slots': slots, 'best': best,
+                              'per_slot': best / slots}
+                    results.append(result)
+                    if report is not None:
+                        report(result)
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+
+def exponents(results):
+    """ least squares slope of log(best) over log(slots), per series """
+    series = {}
+    for result in results:
+        series.setdefault((result['layout'], result['format']), []).append(
+            (math.log(result['slots']), math.log(max(result['best'], 1e-9))))
+    slopes = {}
+    for key, points in series.items():
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        var = sum((x - mean_x) ** 2 for x, _ in points)
+        slopes[key] = sum((x - mean_x) * (y - mean_y)
+                          for x, y in points) / var if var else float('nan')
+    return slopes
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated slot counts. Default: %(default)s')
+    argp.add_argument('--repeat', type=int, default=3)
+    argp.add_argument('--max-exponent', type=float, default=1.3,
+                      help='fail if the time grows faster than slots to '
+                      'this power. Default: %(default)s')
+    args = argp.parse_args()
+
+    def print_result(result):
+        print("%-5s %-6s %8i %10.4f s %8.2f us/slot" % (
+            result['layout'], result['format'], result['slots'],
+            result['best'], result['per_slot'] * 1e6))
+
+    results = run([int(size) for size in args.sizes.split(',')],
+                  repeat=args.repeat, report=print_result)
+    failed = False
+    for (layout, report_format), exponent in sorted(
+            exponents(results).items()):
+        linear = exponent <= args.max_exponent
+        failed = failed or not linear
+        print("%-5s %-6s scaling exponent %.2f%s" % (
+            layout, report_format, exponent, '' if linear else ' NOT LINEAR'))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
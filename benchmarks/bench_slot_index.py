@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+    Compare per-slot lookups on the alias index against rescanning the
+    whole dashboarddata (the behaviour before the index existed).
+
+    python -m benchmarks.bench_slot_index
+"""
+from __future__ import print_function
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.keynoteapi import KeynoteApi
+
+
+def scan_get_data(dashboarddata, measurement_slot, data_type):
+    """ reference implementation: full walk per lookup """
+    data = {}
+    for product in dashboarddata.get('product', []):
+        for type_ in product.get('measurement', []):
+            if type_['alias'] == measurement_slot:
+                for item in type_[data_type]:
+                    data[item['name']] = item['value']
+    return data
+
+
+def run(slots, max_lookups=2000):
+    """ time lookups of (up to) max_lookups slots with both strategies """
+    kapi = KeynoteApi('benchmark')
+    kapi.dashboarddata = gen_dashboarddata(slots, products=4)
+    aliases = sorted(kapi.get_measurement_slots())[:max_lookups]
+
+    start = time.time()
+    for alias in aliases:
+        scan_get_data(kapi.dashboarddata, alias, 'avail_data')
+        scan_get_data(kapi.dashboarddata, alias, 'perf_data')
+    scan = time.time() - start
+
+    start = time.time()
+    kapi.dashboarddata = dict(kapi.dashboarddata)  # force an index rebuild
+    for alias in aliases:
+        kapi.get_avail_data(alias)
+        kapi.get_perf_data(alias)
+    indexed = time.time() - start
+
+    return len(aliases), scan, indexed
+
+
+def main():
+    print("%8s %8s %12s %12s %9s" % ('slots', 'lookups', 'scan [s]',
+                                     'index [s]', 'speedup'))
+    for slots in (10, 1000, 50000):
+        lookups, scan, indexed = run(slots)
+        print("%8i %8i %12.6f %12.6f %8.1fx" % (
+            slots, lookups, scan, indexed, scan / max(indexed, 1e-9)))
+
+if __name__ == '__main__':
+    main()
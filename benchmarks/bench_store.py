@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+    Slot selection: walking the cached response in Python against the
+    indexed snapshot store
+
+    python -m benchmarks.bench_store [--sizes 1000,10000,100000]
+                                     [--snapshots 10]
+
+    Selects "all slots under 99% availability in the last hour" with a new
+    KeynoteApi from a warm cache, once by loading getdashboarddata and
+    looping over the measurements, once with KeynoteApi.select_slots on a
+    snapshot_db holding --snapshots snapshots. Also prints the time to
+    append one snapshot.
+"""
+from __future__ import print_function
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.keynoteapi import KeynoteApi
+from keynoteapi.snapshot import parse_value
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+
+
+def with_availability(dashboarddata, seed):
+    """ spread last_one_hour availability of all slots over 95-100% """
+    rnd = random.Random(seed)
+    for product in dashboarddata['product']:
+        for measurement in product['measurement']:
+            for cell in measurement['avail_data']:
+                cell['value'] = '%.3f' % rnd.uniform(95, 100)
+    return dashboarddata
+
+
+def make_api(tmpdir, snapshot_db=None):
+    kapi = KeynoteApi('benchmark')
+    kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+    kapi.memory_cache = None
+    kapi.cache_maxage = 3600
+    kapi.snapshot_db = snapshot_db
+    return kapi
+
+
+def select_in_python(kapi):
+    result = []
+    for measurement in kapi.iter_measurements():
+        for cell in measurement['avail_data']:
+            if cell['name'] == 'last_one_hour' and \
+                    parse_value(cell['value']) < 99:
+                result.append((measurement['alias'], float(cell['value'])))
+    return sorted(result, key=lambda row: row[1])
+
+
+def best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(slots, snapshots=10, repeat=3):
+    """ (append seconds, python seconds, store seconds, matching slots) """
+    tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+    try:
+        snapshot_db = os.path.join(tmpdir, 'snapshots.sqlite')
+        writer = make_api(tmpdir, snapshot_db)
+        for num in range(snapshots - 1):
+            writer.get_snapshot_store().append(
+                with_availability(gen_dashboarddata(slots), num),
+                KeynoteApi.key_namespace(writer.api_key),
+                time.time() - 60 * (snapshots - num))
+        response = with_availability(gen_dashboarddata(slots), snapshots)
+        start = time.time()
+        writer.write_cache(response,
+                           writer.cache_filename + 'getdashboarddata')
+        append = time.time() - start
+
+        python, expected = best_of(
+            lambda: select_in_python(make_api(tmpdir)), repeat)
+        store, rows = best_of(
+            lambda: make_api(tmpdir, snapshot_db).select_slots(below=99),
+            repeat)
+        assert [row[0] for row in rows] == [row[0] for row in expected]
+        writer.get_snapshot_store().close()
+        return append, python, store, len(rows)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated slot counts. Default: %(default)s')
+    argp.add_argument('--snapshots', type=int, default=10,
+                      help='snapshots in the store. Default: %(default)s')
+    argp.add_argument('--repeat', type=int, default=3)
+    args = argp.parse_args()
+
+    print("%8s %8s %12s %12s %12s %9s" % ('slots', 'matches', 'append [s]',
+                                          'python [s]', 'store [s]',
+                                          'speedup'))
+    for slots in [int(size) for size in args.sizes.split(',')]:
+        append, python, store, matches = run(slots, args.snapshots,
+                                             args.repeat)
+        print("%8i %8i %12.4f %12.4f %12.4f %8.1fx" % (
+            slots, matches, append, python, store,
+            python / max(store, 1e-9)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+    Generator for synthetic getdashboarddata responses in the list layout
+    ('product' -> 'measurement') and the grid layout ('grid-rows', one row
+    per slot and agent)
+"""
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+PERF_TIMERANGES = (('last_five_minute', '300'),
+                   ('last_fifteen_minute', '900'),
+                   ('last_one_hour', '3600'),
+                   ('last_24_hours', '86400'))
+GRID_TIMERANGES = (('last_one_hour', '3600'),
+                   ('last_24_hours', '86400'),
+                   ('last_7_days', '604800'),
+                   ('last_30_days', '2592000'))
+GRID_AGENTS = ('All', 'USA - GA', 'USA - West', 'AT&T', 'Europe - DE')
+THRESHOLDS = (('perfwarning', 'seconds'), ('perfcritical', 'seconds'),
+              ('availwarning', 'percent'), ('availcritical', 'percent'))
+
+
+def _cells(timeranges, unit, value):
+    """ build perf_data/avail_data cells for one measurement """
+    return [{'name': name, 'value': value(), 'duration': duration,
+             'unit': unit} for name, duration in timeranges]
+
+
+def _data(timeranges, rnd):
+    """ perf_data, avail_data and threshold_data of one measurement/row """
+    return {
+        'perf_data': _cells(timeranges, 'seconds',
+                            lambda: '%.3f' % rnd.uniform(0.1, 30)),
+        'avail_data': _cells(timeranges, 'percent',
+                             lambda: '%.3f' % rnd.uniform(90, 100)),
+        'threshold_data': [{'name': name, 'value': '-1.0', 'duration': '',
+                            'unit': unit} for name, unit in THRESHOLDS],
+    }
+
+
+def gen_measurement(num, rnd=random):
+    """ one measurement entry of the list layout """
+    measurement = {'id': str(100000 + num), 'alias': 'SLOT_%06i' % num}
+    measurement.update(_data(PERF_TIMERANGES, rnd))
+    return measurement
+
+
+def gen_grid_row(num, agent_num, rnd=random):
+    """ one grid row (slot num measured by agent agent_num) """
+    row = {'x-num': str(num + 1), 'y-num': str(agent_num + 1),
+           'x-alias': 'SLOT_%06i' % num,
+           'y-alias': GRID_AGENTS[agent_num % len(GRID_AGENTS)]}
+    row.update(_data(GRID_TIMERANGES, rnd))
+    return row
+
+
+def gen_grid_dashboarddata(slots, agents=3, seed=0):
+    """
+        getdashboarddata response (grid layout) with `agents` rows per
+        slot, the first one being the aggregated 'All' row
+    """
+    rnd = random.Random(seed)
+    rows = []
+    for num in range(slots):
+        for agent_num in range(agents):
+            rows.append(gen_grid_row(num, agent_num, rnd))
+    return {
+        'grid_dimension': {'x-axis': {'name': 'slot', 'rows': str(slots)},
+                           'y-axis': {'name': 'agent',
+                                      'rows': str(agents)}},
+        'grid-rows': rows,
+    }
+
+
+def gen_dashboarddata(slots, products=1, seed=0, layout='list'):
+    """
+        getdashboarddata response with `slots` measurements. The list
+        layout spreads them over `products` products, the grid layout uses
+        gen_grid_dashboarddata defaults
+    """
+    if layout == 'grid':
+        return gen_grid_dashboarddata(slots, seed=seed)
+    rnd = random.Random(seed)
+    product_list = [{'name': 'P%i' % num, 'id': 'P%i' % num,
+                     'measurement': []} for num in range(products)]
+    for num in range(slots):
+        product_list[num % products]['measurement'].append(
+            gen_measurement(num, rnd))
+    return {
+        'product': product_list,
+        'remaining_api_calls': {'hour_call_remaining': 3596,
+                                'day_call_remaining': 21596},
+    }
+
+
+def _xml_cells(item):
+    for data_type in ('avail_data', 'perf_data', 'threshold_data'):
+        yield '<%s>\n' % data_type
+        for cell in item.get(data_type, []):
+            yield '<data_cell %s />\n' % ' '.join(
+                '%s=%s' % (key, quoteattr(cell[key]))
+                for key in ('duration', 'name', 'unit', 'value'))
+        yield '</%s>\n' % data_type
+
+
+def iter_xml(dashboarddata):
+    """
+        the XML form (format=xml) of a generated response, in chunks. The
+        budget is written as <remaining_api_calls> element
+    """
+    yield '<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n'
+    if 'grid-rows' in dashboarddata:
+        dimension = dashboarddata['grid_dimension']
+        yield '<dashboard_grid_data>\n<grid_dimension>\n'
+        for axis in ('x-axis', 'y-axis'):
+            yield '<%s name=%s rows=%s />\n' % (
+                axis, quoteattr(dimension[axis]['name']),
+                quoteattr(dimension[axis]['rows']))
+        yield '</grid_dimension>\n<grid-rows>\n'
+        for row in dashboarddata['grid-rows']:
+            yield '<grid-row x-num=%s y-num=%s>\n' % (
+                quoteattr(row['x-num']), quoteattr(row['y-num']))
+            for chunk in _xml_cells(row):
+                yield chunk
+            yield '<x-alias>%s</x-alias>\n<y-alias>%s</y-alias>\n' % (
+                escape(row['x-alias']), escape(row['y-alias']))
+            yield '</grid-row>\n'
+        yield '</grid-rows>\n</dashboard_grid_data>\n'
+        return
+    yield '<dashboard_list_data>\n'
+    for product in dashboarddata['product']:
+        yield '<product id=%s>\n<name>%s</name>\n' % (
+            quoteattr(product['id']), escape(product['name']))
+        for measurement in product['measurement']:
+            yield '<measurement id=%s>\n<alias>%s</alias>\n' % (
+                quoteattr(measurement['id']), escape(measurement['alias']))
+            for chunk in _xml_cells(measurement):
+                yield chunk
+            yield '</measurement>\n'
+        yield '</product>\n'
+    remaining = dashboarddata.get('remaining_api_calls')
+    if remaining:
+        yield '<remaining_api_calls hour_call_remaining="%s" ' \
+            'day_call_remaining="%s" />\n' % (
+                remaining['hour_call_remaining'],
+                remaining['day_call_remaining'])
+    yield '</dashboard_list_data>\n'
+
+
+def write_xml(dashboarddata, filename):
+    """ write the XML form of a generated response to filename """
+    with open(filename, 'wb') as outfile:
+        for chunk in iter_xml(dashboarddata):
+            outfile.write(chunk.encode('utf-8'))
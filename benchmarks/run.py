@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+    Benchmark suite on synthetic getdashboarddata responses
+
+    python -m benchmarks.run [--sizes 10,1000,100000] [--output FILE]
+    python -m benchmarks.run --output new.json --compare old.json
+
+    Times the slot listing, the data getters, reading/writing the JSON
+    cache, KeynoteCli.list_measurements and a full check_keynote probe for
+    the list and grid layout. Results are written as JSON (one entry per
+    case, layout and size) to compare them across commits.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import gen_dashboarddata
+from keynoteapi.keynoteapi import KeynoteApi
+from keynoteapi.keynotecli import KeynoteCli
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SIZES = (10, 1000, 10000)
+LAYOUTS = ('list', 'grid')
+
+
+class NullWriter(object):
+    """ stdout replacement counting the written characters """
+    def __init__(self):
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+
+    def flush(self):
+        pass
+
+
+def load_check_keynote():
+    """ the check_keynote script as module, None without nagiosplugin """
+    try:
+        import nagiosplugin  # noqa
+    except ImportError:
+        return None
+    path = os.path.join(ROOT, 'check_keynote')
+    try:
+        import types
+        from importlib.machinery import SourceFileLoader
+        loader = SourceFileLoader('check_keynote', path)
+        module = types.ModuleType(loader.name)
+        loader.exec_module(module)
+    except ImportError:
+        import imp
+        module = imp.load_source('check_keynote', path)
+    return module
+
+
+def timed(func, setup, repeat):
+    """ best and mean seconds of func(setup()) over repeat runs """
+    times = []
+    for _ in range(repeat):
+        arg = setup()
+        start = time.time()
+        func(arg)
+        times.append(time.time() - start)
+    return min(times), sum(times) / len(times)
+
+
+class Suite(object):
+    """ all cases for one layout and size, sharing one generated payload """
+    def __init__(self, tmpdir, layout, slots):
+        self.layout = layout
+        self.slots = slots
+        self.data = gen_dashboarddata(slots, products=4, layout=layout)
+        self.filename = os.path.join(tmpdir, 'getdashboarddata_%s_%i' %
+                                     (layout, slots))
+        KeynoteApi.write_json_response(self.data, self.filename)
+        self.aliases = sorted(self.kapi().get_measurement_slots())
+
+    def kapi(self, compact=True):
+        kapi = KeynoteApi('benchmark', compact=compact)
+        kapi.dashboarddata = self.data
+        return kapi
+
+    def cases(self, check_keynote):
+        """ (name, func, setup) of the cases which apply to this layout """
+        def getters(kapi):
+            for alias in self.aliases:
+                kapi.get_perf_data(alias)
+                kapi.get_avail_data(alias)
+                kapi.get_threshold_data(alias)
+
+        def list_measurements(kcli):
+            saved_stdout = sys.stdout
+            sys.stdout = NullWriter()
+            try:
+                kcli.list_measurements()
+            finally:
+                sys.stdout = saved_stdout
+
+        def probe(keynote):
+            return list(keynote.probe())
+
+        def new_keynote():
+            keynote = check_keynote.Keynote('benchmark', [])
+            keynote.kapi.set_mockinput(self.filename)
+            return keynote
+
+        cases = [
+            ('get_measurement_slots',
+             lambda kapi: kapi.get_measurement_slots(), self.kapi),
+            ('getters', getters, self.kapi),
+            ('read_json_response_file', lambda kapi:
+             kapi.read_json_response_file(self.filename), self.kapi),
+            ('write_json_response', lambda data:
+             KeynoteApi.write_json_response(data, self.filename + '.out'),
+             lambda: self.data),
+            ('list_measurements', list_measurements, lambda: KeynoteCli(
+                'benchmark', mockinput=self.filename)),
+        ]
+        # the raw (non-compact) index and check_keynote's time ranges only
+        # cover the list layout
+        if self.layout == 'list':
+            cases.extend([
+                ('get_measurement_slots_raw',
+                 lambda kapi: kapi.get_measurement_slots(),
+                 lambda: self.kapi(compact=False)),
+                ('getters_raw', getters, lambda: self.kapi(compact=False)),
+            ])
+            if check_keynote is not None:
+                cases.append(('probe', probe, new_keynote))
+        return cases
+
+
+def git_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=ROOT, stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('utf-8').strip()
+
+
+def run(sizes=DEFAULT_SIZES, layouts=LAYOUTS, repeat=3, cases=None,
+        report=None):
+    """ run the suite. returns the result document """
+    check_keynote = load_check_keynote()
+    results = []
+    tmpdir = tempfile.mkdtemp(prefix='keynoteapi-bench-')
+    try:
+        for layout in layouts:
+            for slots in sizes:
+                suite = Suite(tmpdir, layout, slots)
+                for name, func, setup in suite.cases(check_keynote):
+                    if cases and name not in cases:
+                        continue
+                    best, mean = timed(func, setup, repeat)
+                    result = {'case': name, 'layout': layout,
+                              'slots': slots, 'repeat': repeat,
+                              'best': best, 'mean': mean}
+                    results.append(result)
+                    if report is not None:
+                        report(result)
+    finally:
+        shutil.rmtree(tmpdir)
+    return {
+        'meta': {'commit': git_commit(), 'timestamp': int(time.time()),
+                 'python': platform.python_version(),
+                 'platform': platform.platform(),
+                 'check_keynote': check_keynote is not None},
+        'results': results,
+    }
+
+
+def compare(results, baseline, max_slowdown, min_delta=0.001):
+    """
+        print the ratio to a previous run for every common result.
+        returns the results slower than max_slowdown times the baseline
+        (and by more than min_delta seconds, to ignore timer noise)
+    """
+    previous = {}
+    for result in baseline['results']:
+        previous[(result['case'], result['layout'], result['slots'])] = \
+            result['best']
+    regressions = []
+    for result in results['results']:
+        key = (result['case'], result['layout'], result['slots'])
+        if key not in previous:
+            continue
+        ratio = result['best'] / max(previous[key], 1e-9)
+        regression = ratio > max_slowdown and \
+            result['best'] - previous[key] > min_delta
+        print("%-28s %-5s %8i %12.6f %12.6f %7.2fx%s" % (
+            key + (previous[key], result['best'], ratio,
+                   ' REGRESSION' if regression else '')))
+        if regression:
+            regressions.append(result)
+    return regressions
+
+
+def print_result(result):
+    print("%-28s %-5s %8i %12.6f %12.6f" % (
+        result['case'], result['layout'], result['slots'], result['best'],
+        result['mean']), file=sys.stderr)
+
+
+def main():
+    argp = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    argp.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                      help='comma separated slot counts. Default: %(default)s')
+    argp.add_argument('--layouts', default=','.join(LAYOUTS),
+                      help='comma separated layouts. Default: %(default)s')
+    argp.add_argument('--cases', help='comma separated case names '
+                      '(default: all)')
+    argp.add_argument('--repeat', type=int, default=3,
+                      help='runs per case, the best one counts. '
+                      'Default: %(default)s')
+    argp.add_argument('-o', '--output', help='write the results as JSON '
+                      'to this file instead of stdout')
+    argp.add_argument('--compare', metavar='FILE',
+                      help='compare with the results of a previous run')
+    argp.add_argument('--max-slowdown', type=float, default=1.25,
+                      help='exit non-zero if a case got slower than this '
+                      'factor (with --compare). Default: %(default)s')
+    args = argp.parse_args()
+
+    print("%-28s %-5s %8s %12s %12s" % ('case', 'layout', 'slots',
+                                        'best [s]', 'mean [s]'),
+          file=sys.stderr)
+    results = run([int(size) for size in args.sizes.split(',')],
+                  args.layouts.split(','), args.repeat,
+                  args.cases.split(',') if args.cases else None,
+                  report=print_result)
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=1, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=1, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare) as infile:
+            baseline = json.load(infile)
+        print("%-28s %-5s %8s %12s %12s %8s" % (
+            'case', 'layout', 'slots', 'before [s]', 'now [s]', 'ratio'))
+        if compare(results, baseline, args.max_slowdown):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
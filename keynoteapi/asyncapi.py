@@ -0,0 +1,171 @@
+"""
+    Concurrent access to several Keynote API commands
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import sys
+import threading
+
+from .keynoteapi import KeynoteApi
+
+
+class ApiFuture(object):
+    """
+        Result of an API call running in a worker thread.
+        Use result() to block for it, or 'await' it on Python 3.
+    """
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def add_done_callback(self, callback):
+        """ call callback(future) once the call finished """
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def exception(self, timeout=None):
+        if not self._done.wait(timeout) and not self.done():
+            raise RuntimeError('API call did not finish in time')
+        return self._exc_info[1] if self._exc_info else None
+
+    def result(self, timeout=None):
+        """ wait for the call and return its result (or raise its error) """
+        error = self.exception(timeout)
+        if error is not None:
+            raise error
+        return self._result
+
+    def __await__(self):
+        import asyncio
+        loop = getattr(asyncio, 'get_running_loop',
+                       asyncio.get_event_loop)()
+        awaitable = loop.create_future()
+
+        def transfer(future):
+            """ hand the result over to the event loop thread """
+            def copy():
+                if awaitable.cancelled():
+                    return
+                if future._exc_info:
+                    awaitable.set_exception(future._exc_info[1])
+                else:
+                    awaitable.set_result(future._result)
+            loop.call_soon_threadsafe(copy)
+
+        self.add_done_callback(transfer)
+        return awaitable.__await__()
+
+
+class AsyncKeynoteApi(object):
+    """
+        Runs API commands and getters of a KeynoteApi concurrently, limited
+        to max_concurrency calls at once. The wrapped KeynoteApi instance
+        (and therefore its cache, budget and HTTP client) is shared.
+
+        (Thread based: asyncio is not available on all supported Pythons.
+        The returned futures are awaitable on Python 3.)
+    """
+    def __init__(self, api_key=None, proxies=None, kapi=None,
+                 max_concurrency=4):
+        self.kapi = kapi if kapi is not None \
+            else KeynoteApi(api_key, proxies=proxies)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.Semaphore(max_concurrency)
+
+    def submit(self, func, *args):
+        """ run func(*args) in a worker thread. returns an ApiFuture """
+        future = ApiFuture()
+
+        def run():
+            with self._slots:
+                try:
+                    future.set_result(func(*args))
+                except Exception:
+                    future.set_exception(sys.exc_info())
+
+        worker = threading.Thread(target=run)
+        worker.daemon = True
+        worker.start()
+        return future
+
+    def get_api_response(self, api_cmd):
+        """ future of KeynoteApi.get_api_response(api_cmd) """
+        return self.submit(self.kapi.get_api_response, api_cmd)
+
+    def get_api_responses(self, api_cmds):
+        """
+            fan out several commands at once.
+            returns a future of {api_cmd: response}
+        """
+        api_cmds = list(api_cmds)
+        combined = ApiFuture()
+        results = {}
+        lock = threading.Lock()
+
+        def collect(api_cmd, future):
+            """ finish the combined future with the last (or first failed) """
+            with lock:
+                if combined.done():
+                    return
+                if future._exc_info:
+                    combined.set_exception(future._exc_info)
+                    return
+                results[api_cmd] = future._result
+                if len(results) < len(api_cmds):
+                    return
+            combined.set_result(results)
+
+        if not api_cmds:
+            combined.set_result(results)
+        for api_cmd in api_cmds:
+            self.get_api_response(api_cmd).add_done_callback(
+                lambda future, api_cmd=api_cmd: collect(api_cmd, future))
+        return combined
+
+    def get_dashboarddata(self):
+        """ future of KeynoteApi.get_dashboarddata() """
+        return self.submit(self.kapi.get_dashboarddata)
+
+    def get_measurement_slots(self):
+        """ future of KeynoteApi.get_measurement_slots() """
+        return self.submit(self.kapi.get_measurement_slots)
+
+    def get_perf_data(self, measurement_slot):
+        """ future of KeynoteApi.get_perf_data() """
+        return self.submit(self.kapi.get_perf_data, measurement_slot)
+
+    def get_avail_data(self, measurement_slot):
+        """ future of KeynoteApi.get_avail_data() """
+        return self.submit(self.kapi.get_avail_data, measurement_slot)
+
+    def get_threshold_data(self, measurement_slot):
+        """ future of KeynoteApi.get_threshold_data() """
+        return self.submit(self.kapi.get_threshold_data, measurement_slot)
+
+    def get_remaining_api_calls(self):
+        """ budget of the shared KeynoteApi ([0]=hourly, [1]=daily) """
+        return self.kapi.get_remaining_api_calls()
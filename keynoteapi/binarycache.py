@@ -0,0 +1,217 @@
+"""
+    Pre-indexed binary cache of getdashboarddata responses
+
+    Readers mmap the file, binary search the sorted slot index and decode
+    only the record of the requested slot.
+
+    Layout (little endian):
+        header      magic, version, crc32 of everything after the header,
+                    remaining API calls, slot count, section offsets
+        names       data cell names (timeranges, thresholds)
+        index       slot_count x (alias offset, alias length,
+                                  record offset, record length), by alias
+        aliases     utf-8 aliases referenced by the index
+        records     per slot: id, then for perf/avail/threshold data
+                    count x (name number, value)
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import mmap
+import struct
+import zlib
+
+from .snapshot import DATA_TYPES
+
+MAGIC = b'KNBC'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIqqIIII')
+INDEX_ENTRY = struct.Struct('<IHII')
+COUNT = struct.Struct('<H')
+CELL = struct.Struct('<HH')
+
+
+class BinaryCacheError(ValueError):
+    """ missing, corrupt or incompatible binary cache file """
+
+
+def _pack_string(value):
+    data = (value or u'').encode('utf-8')
+    return COUNT.pack(len(data)) + data
+
+
+def encode(dashboarddata):
+    """ build the binary cache content of a getdashboarddata response """
+    slots = {}
+    for product in dashboarddata.get('product', []):
+        for item in product.get('measurement', []):
+            slot = slots.setdefault(item['alias'], [None, {}, {}, {}])
+            slot[0] = item.get('id')
+            for pos, data_type in enumerate(DATA_TYPES):
+                for cell in item.get(data_type, []):
+                    slot[pos + 1][cell['name']] = cell['value']
+
+    names = []
+    name_ids = {}
+    aliases = []
+    records = []
+    for alias in sorted(slots):
+        slot = slots[alias]
+        record = [_pack_string(slot[0])]
+        for values in slot[1:]:
+            record.append(COUNT.pack(len(values)))
+            for name, value in values.items():
+                if name not in name_ids:
+                    name_ids[name] = len(names)
+                    names.append(name)
+                value = (u'' if value is None else u'%s' % value).encode(
+                    'utf-8')
+                record.append(CELL.pack(name_ids[name], len(value)) + value)
+        aliases.append(alias.encode('utf-8'))
+        records.append(b''.join(record))
+
+    names_section = COUNT.pack(len(names)) + \
+        b''.join(_pack_string(name) for name in names)
+    index_offset = HEADER.size + len(names_section)
+    aliases_offset = index_offset + INDEX_ENTRY.size * len(aliases)
+    records_offset = aliases_offset + sum(len(alias) for alias in aliases)
+
+    index = []
+    alias_pos = aliases_offset
+    record_pos = records_offset
+    for alias, record in zip(aliases, records):
+        index.append(INDEX_ENTRY.pack(alias_pos, len(alias), record_pos,
+                                      len(record)))
+        alias_pos += len(alias)
+        record_pos += len(record)
+
+    body = names_section + b''.join(index) + b''.join(aliases) + \
+        b''.join(records)
+
+    remaining = dashboarddata.get('remaining_api_calls') or {}
+    header = HEADER.pack(MAGIC, VERSION, 0, zlib.crc32(body) & 0xffffffff,
+                         _budget(remaining.get('hour_call_remaining')),
+                         _budget(remaining.get('day_call_remaining')),
+                         len(aliases), index_offset, aliases_offset,
+                         records_offset)
+    return header + body
+
+
+def _budget(value):
+    return -1 if value is None else int(value)
+
+
+class BinaryCache(object):
+    """
+        Read-only view on a binary cache file. Raises BinaryCacheError if
+        the file is missing, of another version or fails its checksum.
+    """
+    def __init__(self, filename, verify=True):
+        try:
+            with open(filename, 'rb') as infile:
+                self.data = mmap.mmap(infile.fileno(), 0,
+                                      access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as err:
+            raise BinaryCacheError("unable to map %s: %s" % (filename, err))
+
+        if len(self.data) < HEADER.size:
+            self.close()
+            raise BinaryCacheError("%s: truncated header" % filename)
+        (magic, version, _, crc, hour, day, self.slot_count,
+         self.index_offset, self.aliases_offset, self.records_offset) = \
+            HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise BinaryCacheError("%s: unknown format %r v%s" %
+                                   (filename, magic, version))
+        if verify and self._checksum() != crc:
+            self.close()
+            raise BinaryCacheError("%s: checksum mismatch" % filename)
+
+        self.remaining_api_calls = [None if hour < 0 else hour,
+                                    None if day < 0 else day]
+        self.names = self._read_names()
+
+    def _checksum(self, chunk_size=1 << 20):
+        """ crc32 of everything after the header, without copying it all """
+        crc = 0
+        for offset in range(HEADER.size, len(self.data), chunk_size):
+            crc = zlib.crc32(self.data[offset:offset + chunk_size], crc)
+        return crc & 0xffffffff
+
+    def _read_string(self, offset):
+        length, = COUNT.unpack_from(self.data, offset)
+        start = offset + COUNT.size
+        return self.data[start:start + length].decode('utf-8'), \
+            start + length
+
+    def _read_names(self):
+        count, = COUNT.unpack_from(self.data, HEADER.size)
+        names = []
+        offset = HEADER.size + COUNT.size
+        for _ in range(count):
+            name, offset = self._read_string(offset)
+            names.append(name)
+        return names
+
+    def _entry(self, num):
+        return INDEX_ENTRY.unpack_from(
+            self.data, self.index_offset + num * INDEX_ENTRY.size)
+
+    def _alias(self, entry):
+        return self.data[entry[0]:entry[0] + entry[1]]
+
+    def _find(self, measurement_slot):
+        """ binary search the slot index. returns the entry or None """
+        wanted = measurement_slot.encode('utf-8')
+        low, high = 0, self.slot_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            alias = self._alias(entry)
+            if alias == wanted:
+                return entry
+            if alias < wanted:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def get_record(self, measurement_slot):
+        """
+            decode the record of one slot.
+            returns (id, {data_type: {name: value}}) or None
+        """
+        entry = self._find(measurement_slot)
+        if entry is None:
+            return None
+        id_, offset = self._read_string(entry[2])
+        record = {}
+        for data_type in DATA_TYPES:
+            count, = COUNT.unpack_from(self.data, offset)
+            offset += COUNT.size
+            values = {}
+            for _ in range(count):
+                name_id, length = CELL.unpack_from(self.data, offset)
+                offset += CELL.size
+                values[self.names[name_id]] = \
+                    self.data[offset:offset + length].decode('utf-8')
+                offset += length
+            record[data_type] = values
+        return id_, record
+
+    def get_data(self, measurement_slot, data_type):
+        """ {name: value} of one slot and data type, None if unknown """
+        record = self.get_record(measurement_slot)
+        return None if record is None else record[1][data_type]
+
+    def get_measurement_slots(self):
+        """ alias -> id of all slots (decodes the whole index) """
+        slots = {}
+        for num in range(self.slot_count):
+            entry = self._entry(num)
+            slots[self._alias(entry).decode('utf-8')] = \
+                self._read_string(entry[2])[0]
+        return slots
+
+    def close(self):
+        self.data.close()
@@ -0,0 +1,215 @@
+"""
+    Cross-process helpers for the local response cache
+
+    Cache files may be gzip or zlib compressed (see KeynoteApi.
+    cache_compression), open_response detects that from the magic bytes so
+    readers never need to know. zlib is only imported for compressed files.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # no advisory locking available (e.g. Windows), locks are no-ops
+    fcntl = None
+
+
+class CacheLock(object):
+    """
+        Exclusive advisory lock on '<filename>.lock' shared by all processes
+        using the same cache file. Usable as context manager.
+    """
+    def __init__(self, filename):
+        self.filename = filename + '.lock'
+        self.fd = None
+
+    def acquire(self, blocking=True, timeout=None):
+        """
+            get the lock, waiting for other processes if blocking is True
+            (at most timeout seconds if it is not None).
+            returns False if the lock is held elsewhere and blocking is False
+            or the timeout expired
+        """
+        if self.fd is not None:
+            return True
+        if blocking and timeout is not None:
+            end = time.time() + timeout
+            while not self.acquire(blocking=False):
+                if time.time() >= end:
+                    return False
+                time.sleep(min(0.05, max(0, end - time.time())))
+            return True
+        fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o666)
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking \
+                else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(fd, flags)
+            except (IOError, OSError):
+                os.close(fd)
+                if blocking:
+                    raise
+                return False
+        self.fd = fd
+        return True
+
+    def release(self):
+        """ give the lock back """
+        if self.fd is not None:
+            if fcntl is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+
+    def detach(self):
+        """
+            forget the lock without unlocking it, after a forked child
+            took it over
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def locked(self):
+        """ True if this instance holds the lock """
+        return self.fd is not None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+def atomic_write(filename, writer, mode='w'):
+    """
+        write a file via temp file and rename, readers either see the
+        previous or the complete new content - never a partial file.
+
+        writer is called with the open temp file object
+    """
+    import tempfile
+    directory = os.path.dirname(filename) or '.'
+    fd, tmp_filename = tempfile.mkstemp(
+        dir=directory, prefix='.%s.' % os.path.basename(filename))
+    try:
+        with os.fdopen(fd, mode) as outfile:
+            writer(outfile)
+        os.chmod(tmp_filename, 0o644)
+        os.rename(tmp_filename, filename)
+    except Exception:
+        os.remove(tmp_filename)
+        raise
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+COMPRESSIONS = ('gzip', 'zlib')
+
+
+def compression_of(head):
+    """ 'gzip', 'zlib' or None from the first two bytes of a file """
+    if head[:2] == GZIP_MAGIC:
+        return 'gzip'
+    # zlib header: deflate method, check bits making it a multiple of 31.
+    # JSON and XML never start with 'x'
+    if len(head) >= 2 and head[:1] == b'\x78' and \
+            (bytearray(head)[0] * 256 + bytearray(head)[1]) % 31 == 0:
+        return 'zlib'
+    return None
+
+
+def compress(data, compression, level=6):
+    """ gzip or zlib compress bytes (compression None: unchanged) """
+    if compression is None:
+        return data
+    import zlib
+    if compression not in COMPRESSIONS:
+        raise ValueError("%s not in valid compressions %s" % (
+            compression, ", ".join(COMPRESSIONS)))
+    compressor = zlib.compressobj(
+        level, zlib.DEFLATED,
+        16 + zlib.MAX_WBITS if compression == 'gzip' else zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+class DecompressingFile(object):
+    """
+        read-only binary file object over a gzip or zlib compressed file,
+        decompressed chunk by chunk while reading. Seeking backwards starts
+        over from the beginning (like gzip.GzipFile)
+    """
+    def __init__(self, raw, compression, chunk_size=65536):
+        self.raw = raw
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self._start = raw.tell()
+        self._reset()
+
+    def _reset(self):
+        import zlib
+        self.raw.seek(self._start)
+        self._decompressor = zlib.decompressobj(
+            16 + zlib.MAX_WBITS if self.compression == 'gzip'
+            else zlib.MAX_WBITS)
+        self._buffer = b''
+        self._pos = 0
+        self._eof = False
+
+    def read(self, size=-1):
+        parts = [self._buffer]
+        have = len(self._buffer)
+        while not self._eof and (size is None or size < 0 or have < size):
+            chunk = self.raw.read(self.chunk_size)
+            if chunk:
+                data = self._decompressor.decompress(chunk)
+            else:
+                data = self._decompressor.flush()
+                self._eof = True
+            parts.append(data)
+            have += len(data)
+        data = b''.join(parts)
+        if size is not None and size >= 0:
+            data, self._buffer = data[:size], data[size:]
+        else:
+            self._buffer = b''
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=0):
+        if whence != 0:
+            raise IOError("only absolute seeks are supported")
+        if pos < self._pos:
+            self._reset()
+        while self._pos < pos and self.read(min(pos - self._pos,
+                                                self.chunk_size)):
+            pass
+        return self._pos
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def open_response(filename):
+    """
+        open a cached (or mock) response for binary reading, gzip or zlib
+        compressed files are decompressed transparently
+    """
+    infile = open(filename, 'rb')
+    compression = compression_of(infile.read(2))
+    infile.seek(0)
+    if compression is None:
+        return infile
+    return DecompressingFile(infile, compression)
@@ -0,0 +1,346 @@
+"""
+    Storage backends of the response cache
+
+    A backend stores parsed API responses under a key and knows when each
+    was written:
+
+        stat(key)                 -> (version, written_at, size) or None
+        age(key)                  -> seconds since the write (inf if missing)
+        get(key)                  -> response or None
+        set(key, response)        -> stores and returns the new stat
+        load(key)                 -> (response, JSON size) or (None, 0)
+        store(key, response)      -> (new stat, JSON size)
+        keep_previous(key)        -> copies key to key + '.prev'
+        delete(key)
+
+    size in a stat is what the backend holds (a compressed file is much
+    smaller), load and store also tell the length of the response's JSON,
+    which sizes the entries of the memory tier without serializing again.
+
+    FileBackend keeps one JSON file per key (the classic cache files),
+    SqliteBackend one row per key in a single database and MemoryBackend
+    holds the parsed responses in process memory. A MemoryBackend is also
+    used as tier in front of the others (see KeynoteApi.memory_cache): it
+    remembers the response of every version it has seen, so reading a
+    fresh cache again in a long-lived process costs a stat() instead of
+    reading and parsing the whole response.
+
+    The responses handed out by the memory tier are shared, treat them as
+    read-only.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import json
+import os
+import time
+
+from .cache import atomic_write, compress, open_response
+
+try:
+    from _thread import allocate_lock
+except ImportError:
+    from thread import allocate_lock
+
+
+class CacheBackend(object):
+    """ base class, see the module docstring for the interface """
+    def name(self, key):
+        """ name of key unique across backends (memory tier key) """
+        raise NotImplementedError
+
+    def stat(self, key):
+        raise NotImplementedError
+
+    def age(self, key, now=None):
+        stat = self.stat(key)
+        if stat is None:
+            return float('inf')
+        return (time.time() if now is None else now) - stat[1]
+
+    def get(self, key):
+        return self.load(key)[0]
+
+    def set(self, key, response):
+        return self.store(key, response)[0]
+
+    def load(self, key):
+        raise NotImplementedError
+
+    def store(self, key, response):
+        raise NotImplementedError
+
+    def keep_previous(self, key):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class FileBackend(CacheBackend):
+    """
+        one JSON file per key named prefix + key, written atomically and
+        'gzip' or 'zlib' compressed if compression is set (reading detects
+        it). Files are evicted by nobody but the next write of the same key
+    """
+    def __init__(self, prefix, compression=None):
+        self.prefix = prefix
+        self.compression = compression
+
+    def name(self, key):
+        return self.prefix + key
+
+    def stat(self, key):
+        try:
+            stat = os.stat(self.prefix + key)
+        except OSError:
+            return None
+        # atomic_write renames a new file over the old one: a new inode
+        return ((stat.st_ino, stat.st_mtime, stat.st_size), stat.st_mtime,
+                stat.st_size)
+
+    def load(self, key):
+        try:
+            with open_response(self.prefix + key) as infile:
+                body = infile.read()
+        except (IOError, OSError):
+            return None, 0
+        return json.loads(body.decode('utf-8')), len(body)
+
+    def store(self, key, response):
+        # one write of the whole document, json.dump writes every chunk
+        body = json.dumps(response).encode('utf-8')
+        size = len(body)
+        body = compress(body, self.compression)
+        atomic_write(self.prefix + key, lambda outfile: outfile.write(body),
+                     'wb')
+        return self.stat(key), size
+
+    def keep_previous(self, key):
+        # hard link, only needed for diffs: never fail a write because of it
+        filename = self.prefix + key
+        try:
+            if os.path.exists(filename + '.prev'):
+                os.remove(filename + '.prev')
+            os.link(filename, filename + '.prev')
+        except OSError:
+            pass
+
+    def delete(self, key):
+        try:
+            os.remove(self.prefix + key)
+        except OSError:
+            pass
+
+
+class SqliteBackend(CacheBackend):
+    """
+        all keys in one SQLite database. With max_entries or max_bytes
+        (of serialized JSON) the oldest writes are evicted beyond them.
+        Several processes may share the database file
+    """
+    def __init__(self, filename, max_entries=None, max_bytes=None,
+                 timeout=10):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._connection = None
+        self._lock = allocate_lock()
+
+    def connection(self):
+        if self._connection is None:
+            import sqlite3
+            self._connection = sqlite3.connect(self.filename, self.timeout,
+                                               check_same_thread=False)
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY,'
+                ' written_at REAL NOT NULL, size INTEGER NOT NULL,'
+                ' body TEXT NOT NULL)')
+            self._connection.commit()
+        return self._connection
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self.connection().execute(sql, args).fetchone()
+
+    def name(self, key):
+        return '%s#%s' % (self.filename, key)
+
+    def stat(self, key):
+        row = self._query('SELECT written_at, size FROM responses'
+                          ' WHERE key = ?', (key,))
+        if row is None:
+            return None
+        return (row[0], row[0], row[1])
+
+    def load(self, key):
+        row = self._query('SELECT body FROM responses WHERE key = ?', (key,))
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), len(row[0])
+
+    def store(self, key, response):
+        body = json.dumps(response)
+        written_at = time.time()
+        with self._lock:
+            connection = self.connection()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                    (key, written_at, len(body), body))
+                self._evict(connection)
+        stat = (written_at, written_at, len(body))
+        return stat, stat[2]
+
+    def _evict(self, connection):
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        total = 0
+        expired = []
+        rows = connection.execute('SELECT key, size FROM responses'
+                                  ' ORDER BY written_at DESC').fetchall()
+        for num, (key, size) in enumerate(rows):
+            total += size
+            if (self.max_entries is not None and num >= self.max_entries) or \
+                    (self.max_bytes is not None and total > self.max_bytes):
+                expired.append((key,))
+        connection.executemany('DELETE FROM responses WHERE key = ?',
+                               expired)
+
+    def keep_previous(self, key):
+        with self._lock:
+            connection = self.connection()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses SELECT key || ?,'
+                    ' written_at, size, body FROM responses WHERE key = ?',
+                    ('.prev', key))
+
+    def delete(self, key):
+        with self._lock:
+            connection = self.connection()
+            with connection:
+                connection.execute('DELETE FROM responses WHERE key = ?',
+                                   (key,))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class MemoryBackend(CacheBackend):
+    """
+        parsed responses in process memory, least recently used ones are
+        evicted beyond max_entries or max_bytes (of serialized JSON),
+        entries older than ttl seconds are dropped.
+
+        As tier in front of another backend use lookup(name, version) and
+        remember(name, version, response, written_at, size): an entry only
+        answers for the version it was stored with
+    """
+    def __init__(self, max_entries=32, max_bytes=64 * 1024 * 1024,
+                 ttl=3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # name -> [version, written_at, size, response, last use, stored at]
+        self.entries = {}
+        self.size = 0
+        self._tick = 0
+        self._lock = allocate_lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def name(self, key):
+        return key
+
+    def _entry(self, name, now):
+        entry = self.entries.get(name)
+        if entry is not None and self.ttl is not None and \
+                now - entry[5] >= self.ttl:
+            self._drop(name)
+            return None
+        return entry
+
+    def _drop(self, name):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def lookup(self, name, version):
+        """ response remembered for this version of name, None otherwise """
+        with self._lock:
+            entry = self._entry(name, time.time())
+            if entry is None or entry[0] != version:
+                return None
+            self._tick += 1
+            entry[4] = self._tick
+            return entry[3]
+
+    def remember(self, name, version, response, written_at, size):
+        """
+            store response, evicting the least recently used entries.
+            size is the length of its JSON (see load and store of the
+            other backends)
+        """
+        with self._lock:
+            self._drop(name)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._tick += 1
+            self.entries[name] = [version, written_at, size, response,
+                                  self._tick, time.time()]
+            self.size += size
+            self._evict()
+
+    def _evict(self):
+        while len(self.entries) > 1 and (
+                (self.max_entries is not None and
+                 len(self.entries) > self.max_entries) or
+                (self.max_bytes is not None and self.size > self.max_bytes)):
+            self._drop(min(self.entries,
+                           key=lambda name: self.entries[name][4]))
+
+    def forget(self, name):
+        with self._lock:
+            self._drop(name)
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            self.size = 0
+
+    def stat(self, key):
+        with self._lock:
+            entry = self._entry(key, time.time())
+            return None if entry is None else tuple(entry[:3])
+
+    def load(self, key):
+        stat = self.stat(key)
+        response = None if stat is None else self.lookup(key, stat[0])
+        return response, 0 if response is None else stat[2]
+
+    def store(self, key, response):
+        written_at = time.time()
+        size = len(json.dumps(response))
+        self.remember(key, written_at, response, written_at, size)
+        return (written_at, written_at, size), size
+
+    def keep_previous(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self._drop(key + '.prev')
+                self.entries[key + '.prev'] = list(entry)
+                self.size += entry[2]
+                self._evict()
+
+    def delete(self, key):
+        self.forget(key)
+
+
+# tier shared by all KeynoteApi instances of a process
+MEMORY_CACHE = MemoryBackend()
@@ -0,0 +1,298 @@
+"""
+    Reusable HTTP(S) clients for the Keynote API with keep-alive connections
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import socket
+import threading
+import time
+import zlib
+
+from .metrics import Metrics
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urlsplit
+
+
+def decoder(content_encoding):
+    """
+        zlib decompressor of a gzip/deflate content-encoding, None if the
+        body is not encoded
+    """
+    content_encoding = (content_encoding or '').lower()
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        return zlib.decompressobj()
+    return None
+
+
+def decode_body(body, content_encoding):
+    """ decode a gzip/deflate content-encoded response body """
+    body_decoder = decoder(content_encoding)
+    if body_decoder is None:
+        return body
+    return body_decoder.decompress(body) + body_decoder.flush()
+
+
+def time_left(limit, deadline):
+    """
+        limit seconds, capped to the time left until deadline (None: no
+        deadline). raises socket.timeout if the deadline has passed
+    """
+    if deadline is None:
+        return limit
+    left = deadline - time.time()
+    if left <= 0:
+        raise socket.timeout('deadline exceeded')
+    return min(limit, left)
+
+
+def read_decoded(read, content_encoding, chunk_size=65536, deadline=None):
+    """
+        read a body with read(size) and decode it chunk by chunk while it
+        arrives, the whole encoded body is never held in memory. A body
+        trickling in past deadline raises socket.timeout.
+        returns (encoded bytes received, decoded body)
+    """
+    body_decoder = decoder(content_encoding)
+    received = 0
+    parts = []
+    while True:
+        if deadline is not None and time.time() >= deadline:
+            raise socket.timeout('deadline exceeded')
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        received += len(chunk)
+        parts.append(body_decoder.decompress(chunk)
+                     if body_decoder is not None else chunk)
+    if body_decoder is not None:
+        parts.append(body_decoder.flush())
+    return received, b''.join(parts)
+
+
+class HttpClient(object):
+    """
+        Minimal keep-alive HTTP(S) client with a small connection pool per
+        host, separate connect/read timeouts and gzip content-encoding.
+        Connections through an HTTPS proxy are tunnelled with CONNECT.
+
+        Timings (dns, connect, tls, wait, read) and bytes received are
+        recorded in metrics.
+    """
+    def __init__(self, https_proxy=None, connect_timeout=10, read_timeout=30,
+                 pool_size=4, metrics=None):
+        self.https_proxy = https_proxy
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.pool = {}
+        self.lock = threading.Lock()
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    def _new_connection(self, scheme, host, port, deadline=None):
+        """ open a new connection (tunnelled if a proxy is configured) """
+        connect_timeout = time_left(self.connect_timeout, deadline)
+        connection_class = httplib.HTTPSConnection if scheme == 'https' \
+            else httplib.HTTPConnection
+        if self.https_proxy is not None and scheme == 'https':
+            proxy_host, _, proxy_port = self.https_proxy.partition(':')
+            connection = connection_class(proxy_host, int(proxy_port or 3128),
+                                          timeout=connect_timeout)
+            set_tunnel = getattr(connection, 'set_tunnel', None) or \
+                getattr(connection, '_set_tunnel')
+            set_tunnel(host, port)
+        else:
+            connection = connection_class(host, port,
+                                          timeout=connect_timeout)
+            if scheme == 'http' or hasattr(connection, '_context'):
+                self._connect(connection, scheme, host, port,
+                              connect_timeout)
+        if connection.sock is None:
+            with self.metrics.timer('connect'):
+                connection.connect()
+        connection.sock.settimeout(self.read_timeout)
+        self.metrics.count('connections_opened')
+        return connection
+
+    def _connect(self, connection, scheme, host, port, connect_timeout):
+        """
+            connect a direct connection step by step (like
+            socket.create_connection and HTTPSConnection.connect do) to
+            time the DNS lookup, TCP connect and TLS handshake separately
+        """
+        with self.metrics.timer('dns'):
+            addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        sock = None
+        error = socket.error('no address for %s' % host)
+        with self.metrics.timer('connect'):
+            for family, socktype, proto, _, address in addresses:
+                sock = socket.socket(family, socktype, proto)
+                sock.settimeout(connect_timeout)
+                try:
+                    sock.connect(address)
+                    break
+                except socket.error as err:
+                    error = err
+                    sock.close()
+                    sock = None
+        if sock is None:
+            raise error
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if scheme == 'https':
+            with self.metrics.timer('tls'):
+                sock = connection._context.wrap_socket(
+                    sock, server_hostname=host)
+        connection.sock = sock
+
+    def _get_connection(self, key, deadline=None):
+        """
+            idle connection from the pool or a new one.
+            returns (connection, reused)
+        """
+        with self.lock:
+            idle = self.pool.get(key)
+            if idle:
+                return idle.pop(), True
+        return self._new_connection(*key, deadline=deadline), False
+
+    def _put_connection(self, key, connection):
+        """ return a connection to the pool (or close it if it is full) """
+        with self.lock:
+            idle = self.pool.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def get(self, url, headers=None, timeout=None):
+        """
+            GET url on a pooled connection, within timeout seconds overall
+            if it is not None (connect and read timeouts are capped to the
+            time left).
+            returns (status, decoded body as bytes)
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        request_headers = {'Accept-Encoding': 'gzip',
+                           'Connection': 'keep-alive'}
+        request_headers.update(headers or {})
+
+        connection, reused = self._get_connection(key, deadline)
+        try:
+            try:
+                response = self._send(connection, path, request_headers,
+                                      deadline)
+            except (httplib.BadStatusLine, socket.error) as err:
+                # resend once only if the server closed an idle keep-alive
+                # connection before answering, not if it is just slow
+                if not reused or isinstance(err, socket.timeout):
+                    raise
+                connection.close()
+                self.metrics.count('connections_stale')
+                connection = self._new_connection(*key, deadline=deadline)
+                reused = False
+                response = self._send(connection, path, request_headers,
+                                      deadline)
+            received, body = self._read(response, deadline)
+        except Exception:
+            # never pool a connection in an unknown state
+            connection.close()
+            raise
+        if reused:
+            self.metrics.count('connections_reused')
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._put_connection(key, connection)
+        self.metrics.count('bytes_received', received)
+        self.metrics.count('bytes_decoded', len(body))
+        return response.status, body
+
+    def _send(self, connection, path, headers, deadline=None):
+        """
+            send a GET and wait for the status line and headers.
+            returns the response with its body still unread
+        """
+        connection.sock.settimeout(time_left(self.read_timeout, deadline))
+        with self.metrics.timer('wait'):
+            connection.request('GET', path, headers=headers)
+            return connection.getresponse()
+
+    def _read(self, response, deadline=None):
+        """
+            read the body of a response, decoding it while it arrives.
+            returns (bytes received, decoded body)
+        """
+        with self.metrics.timer('read'):
+            return read_decoded(
+                response.read, response.getheader('content-encoding'),
+                deadline=deadline)
+
+    def close(self):
+        """ close all pooled connections """
+        with self.lock:
+            for idle in self.pool.values():
+                for connection in idle:
+                    connection.close()
+            self.pool = {}
+
+
+class SocksHttpClient(object):
+    """
+        Same interface as HttpClient for SOCKS5 proxies, backed by one
+        persistent requesocks session (which pools its connections and
+        decodes gzip itself).
+    """
+    def __init__(self, socks_proxy, connect_timeout=10, read_timeout=30,
+                 metrics=None):
+        try:
+            import requesocks
+        except ImportError as err:
+            raise ImportError("Unable to use SOCKS proxy server: %s" % err)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.session = requesocks.session()
+        self.session.proxies = {
+            'http': "socks5://%s" % socks_proxy,
+            'https': "socks5://%s" % socks_proxy,
+        }
+        self.session.headers['Accept-Encoding'] = 'gzip'
+
+    def get(self, url, headers=None, timeout=None):
+        """
+            GET url through the SOCKS proxy, timeout like HttpClient.get.
+            returns (status, decoded body as bytes)
+        """
+        # requesocks only knows a single timeout for connect and read
+        # (and no split of the request time)
+        request_timeout = max(self.connect_timeout, self.read_timeout)
+        if timeout is not None:
+            request_timeout = min(request_timeout, timeout)
+        with self.metrics.timer('request'):
+            resp = self.session.get(url, headers=headers or {},
+                                    timeout=request_timeout)
+        # requesocks decodes the body itself, the size on the wire is only
+        # known from the Content-Length
+        self.metrics.count('bytes_received',
+                           int(resp.headers.get('content-length') or
+                               len(resp.content)))
+        self.metrics.count('bytes_decoded', len(resp.content))
+        # using .content instead of .text because of
+        # binary (gzipped) response
+        return resp.status_code, resp.content
+
+    def close(self):
+        """ drop the session and its connections """
+        if hasattr(self.session, 'close'):
+            self.session.close()
@@ -0,0 +1,265 @@
+"""
+    Resident collector keeping the latest dashboarddata in memory and
+    answering slot queries over a local Unix socket (see keynoted)
+
+    Protocol: one JSON object per line in both directions.
+        {"cmd": "ping"}
+        {"cmd": "slots", "key": ...}
+        {"cmd": "data", "key": ..., "slot": ..., "data_type": ...}
+        {"cmd": "records", "key": ..., "slots": [...]}
+        {"cmd": "changes", "key": ..., "since": <sequence>}
+        {"cmd": "measurements", "key": ...}
+        {"cmd": "select", "key": ..., "data_type": ..., "timerange": ...,
+         "below": ..., ...}
+    Every answer carries "remaining_api_calls" or an "error".
+
+    "records" answers the data of all data types of several slots at once
+    as {slot: {data_type: data}}, "measurements" all raw measurements of
+    the snapshot (for listings and exports), "select" the rows of
+    KeynoteApi.select_slots with the given keyword arguments.
+
+    "changes" answers the diff events (see diff.SnapshotDiff.events) of
+    the refreshes after the given sequence number, each with its "seq".
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+from .keynoteapi import DEFAULT_DAEMON_SOCKET as DEFAULT_SOCKET
+from .snapshot import DATA_TYPES
+
+_log = logging.getLogger('keynoted')
+
+
+def key_digest(api_key):
+    """ clients prove they use the daemon's account without sending it """
+    return hashlib.sha1((api_key or '').encode('utf-8')).hexdigest()
+
+
+class DaemonUnavailable(Exception):
+    """ no daemon listening, or it can not answer for this request """
+
+
+class DaemonClient(object):
+    """ short lived client for a running keynoted """
+    def __init__(self, socket_path=DEFAULT_SOCKET, api_key=None, timeout=2):
+        self.socket_path = socket_path
+        self.key = key_digest(api_key)
+        self.timeout = timeout
+
+    def request(self, cmd, **params):
+        """ send one request. returns the answer dict """
+        params['cmd'] = cmd
+        params['key'] = self.key
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps(params).encode('utf-8') + b'\n')
+            infile = sock.makefile('rb')
+            line = infile.readline()
+            infile.close()
+        except (socket.error, OSError) as err:
+            raise DaemonUnavailable("keynoted at %s: %s" %
+                                    (self.socket_path, err))
+        finally:
+            sock.close()
+        try:
+            answer = json.loads(line.decode('utf-8'))
+        except ValueError:
+            raise DaemonUnavailable("keynoted sent an invalid answer")
+        if 'error' in answer:
+            raise DaemonUnavailable(answer['error'])
+        return answer
+
+    def get_data(self, measurement_slot, data_type):
+        """ returns ({name: value}, remaining_api_calls) """
+        answer = self.request('data', slot=measurement_slot,
+                              data_type=data_type)
+        return answer['data'], answer['remaining_api_calls']
+
+    def get_records(self, measurement_slots):
+        """
+            returns ({slot: {data_type: {name: value}}},
+            remaining_api_calls) of all given slots in one request
+        """
+        answer = self.request('records', slots=list(measurement_slots))
+        return answer['records'], answer['remaining_api_calls']
+
+    def get_measurement_slots(self):
+        """ returns ({alias: id}, remaining_api_calls) """
+        answer = self.request('slots')
+        return answer['slots'], answer['remaining_api_calls']
+
+    def get_measurements(self):
+        """ returns ([raw measurement, ...], remaining_api_calls) """
+        answer = self.request('measurements')
+        return answer['measurements'], answer['remaining_api_calls']
+
+    def select_slots(self, **params):
+        """
+            returns ([(alias, product, value, unit), ...],
+            remaining_api_calls), see KeynoteApi.select_slots
+        """
+        answer = self.request('select', **params)
+        return [tuple(row) for row in answer['rows']], \
+            answer['remaining_api_calls']
+
+    def get_changes(self, since=0):
+        """
+            returns (events after sequence since, latest sequence, truncated)
+            truncated is True if older events were already dropped
+        """
+        answer = self.request('changes', since=since)
+        return answer['events'], answer['sequence'], answer['truncated']
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    """ answers one JSON request line """
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            answer = self.server.daemon.answer(
+                json.loads(line.decode('utf-8')))
+        except Exception as err:
+            answer = {'error': "%s" % err}
+        self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+
+class DaemonServer(socketserver.ThreadingMixIn,
+                   socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class KeynoteDaemon(object):
+    """
+        Keeps the dashboarddata of one KeynoteApi in memory, refreshes it
+        when the (budget-aware) cache TTL expired and serves it on a Unix
+        socket.
+    """
+    data_types = DATA_TYPES
+    # keyword arguments of KeynoteApi.select_slots a client may pass
+    select_params = ('data_type', 'timerange', 'below', 'above', 'inclusive',
+                     'product', 'patterns', 'sort', 'reverse', 'limit')
+
+    def __init__(self, kapi, socket_path=DEFAULT_SOCKET, max_events=10000):
+        self.kapi = kapi
+        self.socket_path = socket_path
+        self.key = key_digest(kapi.api_key)
+        # diff events of the last refreshes, oldest first
+        self.events = collections.deque(maxlen=max_events)
+        self.sequence = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.server = None
+
+    def refresh(self):
+        """
+            replace the in-memory snapshot if the cache TTL expired and
+            record what changed
+        """
+        response = self.kapi.get_api_response('getdashboarddata')
+        with self.lock:
+            if response is self.kapi.dashboarddata:
+                return
+            self.kapi.dashboarddata = response
+            for event in self.kapi.iter_changes():
+                self.sequence += 1
+                event['seq'] = self.sequence
+                self.events.append(event)
+
+    def _refresh_loop(self):
+        while not self.stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as err:
+                _log.warning('refresh failed, serving last snapshot: %s', err)
+            self.stopped.wait(max(1, self.kapi.get_cache_maxage()))
+
+    def answer(self, request):
+        """ build the answer dict of one request """
+        cmd = request.get('cmd')
+        if cmd == 'ping':
+            return {'pong': True}
+        if request.get('key') != self.key:
+            return {'error': 'keynoted serves another API key'}
+        with self.lock:
+            if cmd == 'changes':
+                since = request.get('since') or 0
+                return {'events': [event for event in self.events
+                                   if event['seq'] > since],
+                        'sequence': self.sequence,
+                        'truncated': bool(self.events) and
+                        since + 1 < self.events[0]['seq'],
+                        'remaining_api_calls':
+                        self.kapi.get_remaining_api_calls()}
+            if self.kapi.dashboarddata is None:
+                return {'error': 'no dashboarddata yet'}
+            if cmd == 'slots':
+                answer = {'slots': self.kapi.get_measurement_slots()}
+            elif cmd == 'data' and request.get('data_type') in \
+                    self.data_types:
+                answer = {'data': self.kapi._get_data(
+                    request.get('slot'), request['data_type'])}
+            elif cmd == 'records':
+                records = {}
+                for slot in request.get('slots') or []:
+                    records[slot] = dict(
+                        (data_type, self.kapi._get_data(slot, data_type))
+                        for data_type in self.data_types)
+                answer = {'records': records}
+            elif cmd == 'measurements':
+                answer = {'measurements':
+                          list(self.kapi.iter_measurements())}
+            elif cmd == 'select':
+                params = dict((name, request[name])
+                              for name in self.select_params
+                              if name in request)
+                answer = {'rows': self.kapi.select_slots(**params)}
+            else:
+                return {'error': 'unknown request %s' % cmd}
+            answer['remaining_api_calls'] = \
+                self.kapi.get_remaining_api_calls()
+        return answer
+
+    def start(self):
+        """ load the first snapshot, then serve and refresh in threads """
+        self.refresh()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self.server = DaemonServer(self.socket_path, DaemonHandler)
+        self.server.daemon = self
+        for target in (self.server.serve_forever, self._refresh_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """ stop serving and remove the socket """
+        self.stopped.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    def serve_forever(self):
+        """ run until interrupted """
+        self.start()
+        try:
+            while not self.stopped.is_set():
+                self.stopped.wait(3600)
+        finally:
+            self.stop()
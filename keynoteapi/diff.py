@@ -0,0 +1,130 @@
+"""
+    Structural diff between two getdashboarddata snapshots
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+from .snapshot import DATA_TYPES
+
+
+def _same(old, new):
+    """ equal values, NaN (missing) equals NaN """
+    return old == new or (old != old and new != new)
+
+
+def _json_value(value):
+    """ NaN is not valid JSON, missing values become None """
+    return None if value != value else value
+
+
+def _merged(measurements):
+    """ {data_type: {name: value}} of all measurements of one alias """
+    data = {}
+    for data_type in DATA_TYPES:
+        values = {}
+        for measurement in measurements:
+            values.update(measurement.get_data(data_type))
+        data[data_type] = values
+    return data
+
+
+class SnapshotDiff(object):
+    """
+        Changes from one snapshot.Snapshot to the next:
+            added       aliases only in the new snapshot
+            removed     aliases only in the old snapshot
+            changed     {alias: {data_type: {name: (old, new)}}}, a
+                        missing old or new value is None
+    """
+    def __init__(self, added=None, removed=None, changed=None):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or {}
+
+    def changed_aliases(self):
+        """ aliases with added, removed or changed values, sorted """
+        return sorted(set(self.added) | set(self.changed))
+
+    def timeranges(self, alias, data_type):
+        """ changed timeranges (value names) of one slot and data type """
+        return sorted(self.changed.get(alias, {}).get(data_type, {}))
+
+    def thresholds(self):
+        """ {alias: {name: (old, new)}} of moved threshold_data values """
+        moved = {}
+        for alias, data in self.changed.items():
+            if data.get('threshold_data'):
+                moved[alias] = data['threshold_data']
+        return moved
+
+    def events(self):
+        """
+            the diff as a stream of JSON serializable dicts:
+                {"event": "slot_added"|"slot_removed", "alias": ...}
+                {"event": "value_changed"|"threshold_moved", "alias": ...,
+                 "data_type": ..., "name": ..., "old": ..., "new": ...}
+        """
+        for alias in self.added:
+            yield {'event': 'slot_added', 'alias': alias}
+        for alias in self.removed:
+            yield {'event': 'slot_removed', 'alias': alias}
+        for alias in sorted(self.changed):
+            for data_type in DATA_TYPES:
+                values = self.changed[alias].get(data_type, {})
+                for name in sorted(values):
+                    old, new = values[name]
+                    yield {'event': 'threshold_moved'
+                           if data_type == 'threshold_data'
+                           else 'value_changed',
+                           'alias': alias, 'data_type': data_type,
+                           'name': name, 'old': _json_value(old),
+                           'new': _json_value(new)}
+
+    def __len__(self):
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def __repr__(self):
+        return "<SnapshotDiff +%i -%i ~%i>" % (
+            len(self.added), len(self.removed), len(self.changed))
+
+
+def diff_snapshots(old, new):
+    """
+        compare two snapshot.Snapshot objects (old may be None: everything
+        was added). Grid slots are compared by their indexed row, like the
+        getters see them. returns a SnapshotDiff
+    """
+    old_index = old.index if old is not None else {}
+    result = SnapshotDiff(
+        added=sorted(alias for alias in new.index if alias not in old_index),
+        removed=sorted(alias for alias in old_index
+                       if alias not in new.index))
+
+    for alias, measurements in new.index.items():
+        if alias not in old_index:
+            continue
+        old_measurements = old_index[alias]
+        if len(old_measurements) == len(measurements) and all(
+                old_item.values == item.values and
+                old_item.names == item.names
+                for old_item, item in zip(old_measurements, measurements)):
+            # identical value arrays (and no NaN in them)
+            continue
+        old_data = _merged(old_measurements)
+        new_data = _merged(measurements)
+        changes = {}
+        for data_type in DATA_TYPES:
+            before = old_data[data_type]
+            after = new_data[data_type]
+            values = {}
+            for name in set(before) | set(after):
+                old_value = before.get(name)
+                new_value = after.get(name)
+                if old_value is None or new_value is None or \
+                        not _same(old_value, new_value):
+                    if old_value is not None or new_value is not None:
+                        values[name] = (old_value, new_value)
+            if values:
+                changes[data_type] = values
+        if changes:
+            result.changed[alias] = changes
+    return result
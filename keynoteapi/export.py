@@ -0,0 +1,188 @@
+"""
+    Streaming bulk export of all slots (avail, perf and threshold values)
+    as CSV, JSON Lines or a compact columnar file
+
+    Measurements are read one at a time (see KeynoteApi.iter_measurements)
+    and written in buffered chunks, the export never holds more than one
+    buffer or row group in memory.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import csv
+import fnmatch
+import json
+
+from .snapshot import DATA_TYPES, parse_value
+
+COLUMNS = ('slot', 'agent', 'id', 'data_type', 'name', 'value', 'unit')
+# columns of the columnar format stored as per-group dictionary + codes
+DICTIONARY_COLUMNS = ('slot', 'agent', 'id', 'data_type', 'name', 'unit')
+COLUMNAR_FORMAT = 'keynoteapi-columnar'
+FORMATS = ('csv', 'jsonl', 'columnar')
+
+
+def iter_rows(measurements, patterns=None):
+    """
+        yield one tuple per value (see COLUMNS) of raw measurements (list
+        layout) or grid rows, values stay strings as in the response.
+        patterns: fnmatch patterns of the slots to export (None: all)
+    """
+    for item in measurements:
+        if 'x-alias' in item:
+            slot, agent, id_ = item['x-alias'], item.get('y-alias'), \
+                item.get('x-num')
+        else:
+            slot, agent, id_ = item['alias'], None, item.get('id')
+        if patterns and not any(fnmatch.fnmatchcase(slot, pattern)
+                                for pattern in patterns):
+            continue
+        for data_type in DATA_TYPES:
+            for cell in item.get(data_type) or []:
+                yield (slot, agent, id_, data_type, cell['name'],
+                       cell.get('value'), cell.get('unit'))
+
+
+class BufferedWriter(object):
+    """
+        collects formatted chunks and writes them to outfile once
+        buffer_size characters are pending
+    """
+    def __init__(self, outfile, buffer_size=65536):
+        self.outfile = outfile
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.pending = 0
+        self.rows = 0
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+        self.pending += len(chunk)
+        if self.pending >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.outfile.write(''.join(self.chunks))
+            self.chunks = []
+            self.pending = 0
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class CsvWriter(BufferedWriter):
+    """ header line plus one line per value """
+    def __init__(self, outfile, buffer_size=65536):
+        BufferedWriter.__init__(self, outfile, buffer_size)
+        # csv formats into this writer's buffer (it only needs write())
+        self.csv = csv.writer(self, lineterminator='\n')
+        self.csv.writerow(COLUMNS)
+
+    def write_row(self, row):
+        row = ['' if field is None else field for field in row]
+        if str is bytes:
+            # the csv module of Python 2 only handles byte strings
+            row = [field.encode('utf-8')
+                   if isinstance(field, unicode)  # noqa: F821
+                   else field for field in row]
+        self.csv.writerow(row)
+        self.rows += 1
+
+
+class JsonLinesWriter(BufferedWriter):
+    """ one JSON object per value, missing values are null """
+    def write_row(self, row):
+        record = dict(zip(COLUMNS, row))
+        value = parse_value(row[5])
+        record['value'] = None if value != value else value
+        self.write(json.dumps(record, sort_keys=True) + '\n')
+        self.rows += 1
+
+
+class ColumnarWriter(BufferedWriter):
+    """
+        header line, then one JSON line per row group of up to group_size
+        values: {"rows": n, "columns": {column: values}}. String columns
+        are dictionary encoded per group ({"dict": [...], "codes": [...]}),
+        values are floats (null if missing). See read_columnar
+    """
+    def __init__(self, outfile, buffer_size=65536, group_size=10000):
+        BufferedWriter.__init__(self, outfile, buffer_size)
+        self.group_size = group_size
+        self.group = []
+        self.write(json.dumps({'format': COLUMNAR_FORMAT, 'version': 1,
+                               'columns': COLUMNS}) + '\n')
+
+    def write_row(self, row):
+        self.group.append(row)
+        self.rows += 1
+        if len(self.group) >= self.group_size:
+            self.write_group()
+
+    def write_group(self):
+        if not self.group:
+            return
+        columns = {}
+        for pos, column in enumerate(COLUMNS):
+            values = [row[pos] for row in self.group]
+            if column in DICTIONARY_COLUMNS:
+                dictionary = {}
+                codes = [dictionary.setdefault(value, len(dictionary))
+                         for value in values]
+                words = [None] * len(dictionary)
+                for value, code in dictionary.items():
+                    words[code] = value
+                columns[column] = {'dict': words, 'codes': codes}
+            else:
+                values = [parse_value(value) for value in values]
+                columns[column] = [None if value != value else value
+                                   for value in values]
+        self.write(json.dumps({'rows': len(self.group),
+                               'columns': columns}) + '\n')
+        self.group = []
+
+    def close(self):
+        self.write_group()
+        BufferedWriter.close(self)
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonLinesWriter,
+           'columnar': ColumnarWriter}
+
+
+def export(measurements, outfile, export_format='csv', patterns=None,
+           buffer_size=65536):
+    """
+        write all values of measurements to outfile in export_format.
+        returns the number of exported values
+    """
+    if export_format not in WRITERS:
+        raise ValueError("%s not in valid formats %s" % (
+            export_format, ", ".join(FORMATS)))
+    writer = WRITERS[export_format](outfile, buffer_size)
+    for row in iter_rows(measurements, patterns):
+        writer.write_row(row)
+    writer.close()
+    return writer.rows
+
+
+def read_columnar(infile):
+    """ yield the rows (tuples, see COLUMNS) of a columnar export """
+    header = json.loads(infile.readline())
+    if header.get('format') != COLUMNAR_FORMAT:
+        raise ValueError('not a %s file' % COLUMNAR_FORMAT)
+    columns = header['columns']
+    for line in infile:
+        group = json.loads(line)
+        decoded = []
+        for column in columns:
+            values = group['columns'][column]
+            if isinstance(values, dict):
+                words = values['dict']
+                values = [words[code] for code in values['codes']]
+            decoded.append(values)
+        for row in zip(*decoded):
+            yield row
@@ -0,0 +1,236 @@
+"""
+    Per-slot history of getdashboarddata values in fixed size ring files
+
+    Every fetched snapshot adds one sample per slot, data type and
+    timerange (the value name, e.g. last_one_hour). A series is kept in one
+    ring file per archive: an archive averages all samples of `step`
+    seconds into one record and keeps `retention` seconds of records, the
+    oldest ones get overwritten.
+
+    Layout of a ring file (little endian):
+        header      magic, version, step, capacity, next record, count
+        records     capacity x (bucket start, sample count, mean value)
+
+    Writers are serialized by the lock '<directory>.lock' of the store,
+    KeynoteApi appends after releasing the cache lock so other processes
+    never wait for the history.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import os
+import struct
+import time
+
+from .cache import CacheLock
+from .snapshot import Snapshot
+
+MAGIC = b'KNRH'
+VERSION = 1
+HEADER = struct.Struct('<4sHHIIII')
+RECORD = struct.Struct('<qId')
+
+# (step, retention) in seconds: minutely for a day, hourly for 30 days
+DEFAULT_ARCHIVES = ((60, 86400), (3600, 30 * 86400))
+DATA_TYPES = ('perf_data', 'avail_data')
+SAFE_CHARS = frozenset(bytearray(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                                 b'abcdefghijklmnopqrstuvwxyz0123456789-_'))
+
+
+class HistoryError(ValueError):
+    """ corrupt or incompatible ring file """
+
+
+def quote(alias):
+    """ file system safe form of a slot alias """
+    result = []
+    for byte in bytearray(alias.encode('utf-8')):
+        result.append(chr(byte) if byte in SAFE_CHARS else '%%%02X' % byte)
+    return ''.join(result)
+
+
+def unquote(name):
+    """ slot alias of a quoted directory name """
+    data = bytearray()
+    pos = 0
+    while pos < len(name):
+        if name[pos] == '%':
+            data.append(int(name[pos + 1:pos + 3], 16))
+            pos += 3
+        else:
+            data.append(ord(name[pos]))
+            pos += 1
+    return data.decode('utf-8')
+
+
+class RingFile(object):
+    """
+        One archive of one series. The file is created with capacity
+        records on first use and resized (keeping the newest records) if
+        the configured capacity changes.
+    """
+    def __init__(self, filename, step, capacity):
+        self.filename = filename
+        self.step = step
+        self.capacity = capacity
+
+    def _read_header(self, infile):
+        header = infile.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise HistoryError("%s: truncated header" % self.filename)
+        magic, version, _, step, capacity, head, count = \
+            HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise HistoryError("%s: unknown format %r v%s" %
+                               (self.filename, magic, version))
+        return step, capacity, head, count
+
+    def _read_records(self, infile, capacity, head, count):
+        """ all records, oldest first """
+        infile.seek(HEADER.size)
+        data = infile.read(capacity * RECORD.size)
+        records = []
+        for num in range(count):
+            pos = (head - count + num) % capacity
+            records.append(RECORD.unpack_from(data, pos * RECORD.size))
+        return records
+
+    def _create(self, records=()):
+        """ (re)write the whole file, keeping the newest records """
+        records = list(records)[-self.capacity:]
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.filename, 'wb') as outfile:
+            outfile.write(HEADER.pack(MAGIC, VERSION, 0, self.step,
+                                      self.capacity,
+                                      len(records) % self.capacity,
+                                      len(records)))
+            for record in records:
+                outfile.write(RECORD.pack(*record))
+            outfile.truncate(HEADER.size + self.capacity * RECORD.size)
+
+    def append(self, timestamp, value):
+        """
+            add one sample. Samples of the same step are averaged, samples
+            older than the newest record are dropped.
+        """
+        bucket = int(timestamp) - int(timestamp) % self.step
+        if not os.path.exists(self.filename):
+            self._create()
+        with open(self.filename, 'r+b') as outfile:
+            step, capacity, head, count = self._read_header(outfile)
+            if step != self.step or capacity != self.capacity:
+                records = self._read_records(outfile, capacity, head, count)
+                outfile.close()
+                self._create(records)
+                return self.append(timestamp, value)
+
+            if count:
+                last = (head - 1) % capacity
+                outfile.seek(HEADER.size + last * RECORD.size)
+                last_bucket, samples, mean = RECORD.unpack(
+                    outfile.read(RECORD.size))
+                if bucket < last_bucket:
+                    return False
+                if bucket == last_bucket:
+                    outfile.seek(HEADER.size + last * RECORD.size)
+                    outfile.write(RECORD.pack(
+                        bucket, samples + 1,
+                        mean + (value - mean) / (samples + 1)))
+                    return True
+
+            outfile.seek(HEADER.size + head * RECORD.size)
+            outfile.write(RECORD.pack(bucket, 1, value))
+            outfile.seek(0)
+            outfile.write(HEADER.pack(MAGIC, VERSION, 0, step, capacity,
+                                      (head + 1) % capacity,
+                                      min(count + 1, capacity)))
+        return True
+
+    def records(self, start=None, end=None):
+        """ [(bucket start, samples, mean), ...] within [start, end] """
+        if not os.path.exists(self.filename):
+            return []
+        with open(self.filename, 'rb') as infile:
+            step, capacity, head, count = self._read_header(infile)
+            records = self._read_records(infile, capacity, head, count)
+        return [record for record in records
+                if (start is None or record[0] >= start - step + 1) and
+                (end is None or record[0] <= end)]
+
+
+class HistoryStore(object):
+    """
+        Directory of ring files, one subdirectory per slot:
+            <directory>/<quoted alias>/<data type>.<name>.<step>
+    """
+    def __init__(self, directory, archives=DEFAULT_ARCHIVES):
+        self.directory = directory
+        self.archives = sorted(archives)
+
+    def ring(self, alias, data_type, name, step, retention):
+        filename = os.path.join(self.directory, quote(alias), '%s.%s.%i' %
+                                (data_type, name, step))
+        return RingFile(filename, step, max(1, retention // step))
+
+    def append(self, dashboarddata, timestamp=None):
+        """
+            add the values of all slots of a getdashboarddata response
+            under the store's lock. missing values ("-") are skipped
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        index = Snapshot(dashboarddata).index
+        with CacheLock(self.directory.rstrip(os.sep)):
+            for alias, measurements in index.items():
+                for data_type in DATA_TYPES:
+                    data = {}
+                    for measurement in measurements:
+                        data.update(measurement.get_data(data_type))
+                    for name, value in data.items():
+                        if value != value:
+                            continue
+                        for step, retention in self.archives:
+                            self.ring(alias, data_type, name, step,
+                                      retention).append(timestamp, value)
+
+    def slots(self):
+        """ aliases with recorded history """
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(unquote(name) for name in os.listdir(self.directory))
+
+    def names(self, alias, data_type):
+        """ recorded timeranges of a slot and data type """
+        directory = os.path.join(self.directory, quote(alias))
+        if not os.path.isdir(directory):
+            return []
+        names = set()
+        for filename in os.listdir(directory):
+            parts = filename.split('.')
+            if len(parts) == 3 and parts[0] == data_type:
+                names.add(parts[1])
+        return sorted(names)
+
+    def archive_for(self, start=None, step=None, now=None):
+        """
+            (step, retention) to answer a query: the given step, or the
+            finest archive still holding start, or the coarsest one
+        """
+        if step is not None:
+            for archive in self.archives:
+                if archive[0] >= step:
+                    return archive
+            return self.archives[-1]
+        now = time.time() if now is None else now
+        for archive in self.archives:
+            # one step of slack: a window of exactly the retention is fine
+            if start is None or start >= now - archive[1] - archive[0]:
+                return archive
+        return self.archives[-1]
+
+    def query(self, alias, data_type, name, start=None, end=None, step=None):
+        """ [(timestamp, value), ...] of one series, oldest first """
+        archive = self.archive_for(start, step)
+        ring = self.ring(alias, data_type, name, *archive)
+        return [(record[0], record[2])
+                for record in ring.records(start, end)]
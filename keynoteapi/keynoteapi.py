@@ -6,15 +6,22 @@
 """
 from __future__ import print_function
 
-try:
-    import urllib.request as request
-except ImportError:
-    import urllib2 as request
+import binascii
 import json
 import os
 import time
 import sys
 
+# everything not needed to answer from a warm cache (network stack, binary
+# cache, daemon client, streaming parser, threads) is imported on first use
+# to keep the startup of check_keynote cheap
+from .cache import CacheLock, atomic_write, open_response
+from .cachebackend import MEMORY_CACHE, FileBackend, MemoryBackend
+from .metrics import Metrics
+from .snapshot import Snapshot, parse_value
+
+DEFAULT_DAEMON_SOCKET = '/tmp/.keynoted.sock'
+
 
 class KeynoteApi(object):
     """
@@ -24,7 +31,7 @@ class KeynoteApi(object):
                   'last_one_hour': '1h', 'last_24_hours': '24h',
                   'last_one_week': '1week', 'last_one_month': '1month', }
 
-    def __init__(self, api_key=None, proxies=None):
+    def __init__(self, api_key=None, proxies=None, compact=False):
         if api_key is not None:
             self.api_key = api_key
         else:
@@ -36,31 +43,211 @@ class KeynoteApi(object):
             sys.exit(1)
 
         self.proxies = proxies
+        self.api_base = 'https://api.keynote.com/keynote/api'
+        self.connect_timeout = 10
+        self.read_timeout = 30
+        # time.time() by which API calls have to be answered (None: only
+        # the connect/read timeouts apply), see set_timeout
+        self.deadline = None
+        # retries of a failed API call while the deadline leaves time for
+        # them, first backoff and its cap in seconds (jittered, see retry)
+        self.api_retries = 2
+        self.retry_backoff = 0.5
+        self.retry_backoff_max = 5
+        # failed calls in a row opening the circuit breaker and seconds
+        # until its next trial call. The state is shared by all processes
+        # via breaker_file (None: next to the cache files)
+        self.breaker_threshold = 5
+        self.breaker_reset = 60
+        self.breaker_file = None
+        self.breaker = None
+        # why the last response was served from the expired cache
+        self.api_error = None
+        # response format requested from the API, 'json' or 'xml' (parsed
+        # incrementally by xmlresponse into the same data model)
+        self.api_format = 'json'
+        self.http_client = None
         self.api_remaining_hour = None
         self.api_remaining_day = None
         self.dashboarddata = None
+        self.compact = compact
+        # look up single slots by streaming through the cached response
+        # instead of loading all of it (see find_measurement)
+        self.streaming = False
+        self._streamed = {}
+        self.snapshot = None
+        self._snapshot_source = None
+        # snapshot replaced by the current one (see get_snapshot_diff)
+        self.previous_snapshot = None
+        self._slot_index = None
+        self._slot_index_source = None
         self.cache_usage = True
         self.cache_maxage = 60
-        self.cache_filename = os.path.join('/tmp',
-                                           '.cache_keynoteapi_response_')
+        # lower bound for the TTL if the API budget allows it (None: never
+        # refresh more often than cache_maxage)
+        self.cache_minage = None
+        # serve stale data up to this many seconds while refreshing
+        self.cache_grace = 0
+        # API calls per hour/day which are never spent by cache refreshes
+        self.api_calls_reserve = 0
+        # 'binary' additionally writes a pre-indexed binary cache which is
+        # preferred for single slot lookups (see get_binary_cache)
+        self.cache_format = 'json'
+        self.binary_cache = None
+        # 'gzip' or 'zlib' compress the cache files (None: plain JSON).
+        # Compressed files are detected on read whatever this is set to
+        self.cache_compression = None
+        # Unix socket of a running keynoted to ask first (None: disabled)
+        self.daemon_socket = None
+        # slot records answered by keynoted: (time of the first, {slot:
+        # {data_type: data}}), kept for the cache TTL
+        self._daemon_records = (0, {})
+        # directory of the per-slot value history (None: not recorded) and
+        # its (step, retention) archives (None: history.DEFAULT_ARCHIVES)
+        self.history_dir = None
+        self.history_archives = None
+        self.history = None
+        # SQLite database of all fetched snapshots for indexed slot queries
+        # (None: select_slots fills a private in-memory one), see store
+        self.snapshot_db = None
+        # seconds of snapshots kept in snapshot_db (None: all of them)
+        self.snapshot_retention = 30 * 86400
+        self.snapshot_store = None
+        self._stored_snapshot = None
+        # shared token bucket state spreading API calls over the budget
+        # (None: no scheduling), see scheduler.Scheduler
+        self.schedule_file = None
+        # seconds an interactive call may wait for its token
+        self.schedule_wait = 0
+        # 'interactive' or 'background' (refreshes are always background)
+        self.schedule_priority = 'interactive'
+        self.scheduler = None
+        # refresh and record the history in a detached child process
+        # instead of a thread or inline, so short-lived callers like
+        # check_keynote exit right away
+        self.refresh_detached = False
+        self.refresh_thread = None
+        self.refresh_error = None
+        # cache hits, fetch/parse timings, bytes and budget (see metrics)
+        self.metrics = Metrics()
+        # one cache namespace per API key, so several accounts can share a
+        # host (see pool.KeynoteApiPool)
+        self.cache_filename = os.path.join(
+            '/tmp', '.cache_keynoteapi_%s_response_' %
+            KeynoteApi.key_namespace(self.api_key))
+        # where responses are cached (None: one JSON file per command at
+        # cache_filename), see cachebackend
+        self.cache_backend = None
+        self._file_backend = None
+        # parsed responses shared in front of the cache backend by all
+        # instances of the process (None: always read the backend)
+        self.memory_cache = MEMORY_CACHE
         self.mockinput = None
 
+    @staticmethod
+    def key_namespace(api_key):
+        """ short, stable name of an API key for file names """
+        return '%08x' % (binascii.crc32(api_key.encode('utf-8')) &
+                         0xffffffff)
+
+    def get_cache_backend(self):
+        """ cache_backend or the JSON files at cache_filename """
+        if self.cache_backend is not None:
+            return self.cache_backend
+        if self._file_backend is None or \
+                self._file_backend.prefix != self.cache_filename or \
+                self._file_backend.compression != self.cache_compression:
+            self._file_backend = FileBackend(self.cache_filename,
+                                             self.cache_compression)
+        return self._file_backend
+
+    def cache_key(self, api_cmd):
+        """
+            key of api_cmd in the cache backend. Cache files are named by
+            cache_filename, other backends may be shared by many API keys
+        """
+        if self.cache_backend is None:
+            return api_cmd
+        return '%s_%s' % (KeynoteApi.key_namespace(self.api_key), api_cmd)
+
+    def _memory_tier(self, backend):
+        if isinstance(backend, MemoryBackend):
+            return None
+        return self.memory_cache
+
+    def read_cache(self, api_cmd, stat=None):
+        """
+            cached response of api_cmd (None if there is none), from the
+            memory tier if it holds the current version. stat is the
+            backend's stat of it if already known
+        """
+        backend = self.get_cache_backend()
+        key = self.cache_key(api_cmd)
+        tier = self._memory_tier(backend)
+        with self.metrics.timer('cache_read'):
+            if stat is None:
+                stat = backend.stat(key)
+            if stat is None:
+                return None
+            response = None
+            if tier is not None:
+                response = tier.lookup(backend.name(key), stat[0])
+            if response is not None:
+                self.metrics.count('cache_memory_hits')
+            else:
+                response, size = backend.load(key)
+                if response is not None and tier is not None:
+                    tier.remember(backend.name(key), stat[0], response,
+                                  stat[1], size)
+        self.set_remaining_api_calls(response)
+        return response
+
     def set_mockinput(self, mockinput):
         """
             setter for mock input which should only be used for testing
         """
         self.mockinput = mockinput
 
-    def check_cache_usable(self, filename):
+    def check_cache_usable(self, filename, cache_maxage=None):
         """
             check if the cache is still usable or not
             returns True if the cache is still warm enough
         """
-        file_mtime = os.path.getmtime(filename) if os.path.isfile(filename) \
-            else 0
+        if cache_maxage is None:
+            cache_maxage = self.get_cache_maxage()
+        return KeynoteApi.get_cache_age(filename) < cache_maxage
+
+    @staticmethod
+    def get_cache_age(filename):
+        """ seconds since the last write of a cache file (inf if missing) """
+        if not os.path.isfile(filename):
+            return float('inf')
+        return time.time() - os.path.getmtime(filename)
+
+    def get_cache_maxage(self, now=None):
+        """
+            effective cache TTL based on the remaining API budget.
+
+            The remaining hourly and daily calls are spread evenly over the
+            rest of the hour/day. A tight budget stretches the TTL beyond
+            cache_maxage, a generous one shrinks it down to cache_minage.
+        """
+        now = time.time() if now is None else now
+        cache_minage = self.cache_maxage if self.cache_minage is None \
+            else self.cache_minage
+
+        needed_interval = 0
+        for remaining, period in ((self.api_remaining_hour, 3600),
+                                  (self.api_remaining_day, 86400)):
+            if remaining is None:
+                continue
+            seconds_left = period - now % period
+            usable_calls = remaining - self.api_calls_reserve
+            interval = seconds_left / usable_calls if usable_calls >= 1 \
+                else seconds_left
+            needed_interval = max(needed_interval, interval)
 
-        cache_maxage = time.time() - self.cache_maxage
-        return file_mtime > cache_maxage
+        return max(cache_minage, needed_interval)
 
     @staticmethod
     def gen_api_url(api_cmd,
@@ -76,85 +263,663 @@ class KeynoteApi(object):
                                                   api_key, api_format)
         return api_url
 
-    def get_api_response(self, api_cmd):
+    def set_timeout(self, timeout, margin=1.0):
+        """
+            answer API calls within timeout seconds from now, minus margin
+            seconds (at most half the timeout) left to the caller
+        """
+        self.deadline = time.time() + timeout - min(margin, timeout / 2.0)
+
+    def get_api_response(self, api_cmd, deadline=None):
         """
             connect to the keynote api and consider the usage of a local cache
             to limit the needed requests (there is a hourly and daily limit).
 
+            Refreshing the cache is single-flight across processes: only the
+            holder of the cache lock calls the API, everybody else waits and
+            reads the fresh copy afterwards.
+            Within cache_grace seconds after expiry the stale copy is
+            returned right away while a background thread refreshes it.
+            With a schedule_file the call also needs the scheduler's
+            tokens; if it refuses, an expired copy is returned if there is
+            one (scheduler.BudgetExceeded is raised otherwise).
+            The call has to be answered by deadline (default: self.deadline):
+            failed API calls are retried only while there is time left (see
+            call_api), if the API keeps failing or the time is up the
+            expired copy is returned if there is one (retry.ApiError is
+            raised otherwise).
+
             returns the response only as json at the moment
         """
+        if deadline is None:
+            deadline = self.deadline
         if self.mockinput:
-            cache_filename = self.mockinput
-            use_cache = False
-        else:
-            cache_filename = self.cache_filename + api_cmd
-            use_cache = (
-                self.cache_usage and self.check_cache_usable(cache_filename)
-                )
+            return self.read_response_file(self.mockinput)
 
-        if use_cache or self.mockinput:
-            response = self.read_json_response_file(cache_filename)
-        else:
-            request_url = KeynoteApi.gen_api_url(api_cmd, self.api_key, 'json')
+        cache_filename = self.cache_filename + api_cmd
+        backend = self.get_cache_backend()
+        key = self.cache_key(api_cmd)
+        stat = backend.stat(key) if self.cache_usage else None
+        stale = None
+        # read first, the cached budget is needed for the effective TTL
+        response = self.read_cache(api_cmd, stat) if stat else None
+        if response is not None:
+            cache_age = time.time() - stat[1]
+            cache_maxage = self.get_cache_maxage()
+            if cache_age < cache_maxage:
+                self.metrics.count('cache_hits')
+                return response
+            if cache_age < cache_maxage + self.cache_grace:
+                self.metrics.count('cache_stale')
+                self.refresh_in_background(api_cmd)
+                return response
+            stale = response
+
+        from .retry import ApiError, DeadlineExceeded
+        lock = CacheLock(cache_filename)
+        if not lock.acquire(timeout=None if deadline is None
+                            else max(0, deadline - time.time())):
+            return self.fail_over(stale, DeadlineExceeded(
+                "deadline exceeded waiting for the refresh of %s" % api_cmd))
+        try:
+            # another process may have refreshed while we were waiting
+            if self.cache_usage and \
+                    backend.age(key) < self.get_cache_maxage():
+                self.metrics.count('cache_hits')
+                return self.read_cache(api_cmd)
+
+            self.metrics.count('cache_misses')
+            if not self.schedule_api_call(api_cmd, self.schedule_priority,
+                                          stale is None):
+                # over budget: an expired response beats no response
+                self.metrics.count('cache_stale')
+                return stale
+            try:
+                response = self.call_api(api_cmd, deadline)
+            except ApiError as err:
+                return self.fail_over(stale, err)
+            self.write_cache(response, cache_filename, history=False)
+        finally:
+            lock.release()
+
+        self.record_history(api_cmd, response)
+        self.set_remaining_api_calls(response)
+        return response
+
+    def fail_over(self, stale, error):
+        """ the expired response stale instead of raising error """
+        if stale is None:
+            raise error
+        self.metrics.count('cache_stale')
+        self.metrics.count('api_failovers')
+        self.api_error = error
+        return stale
+
+    def get_response_filename(self, api_cmd):
+        """
+            make sure there is a usable response of api_cmd on disk without
+            parsing it (unless it has to be fetched).
+            returns the filename of the cached (or mock) response, None if
+            the cache_backend does not keep files or the getdashboarddata
+            response had to be loaded anyway (it is kept as dashboarddata)
+        """
+        if self.mockinput:
+            return self.mockinput
+        if self.cache_backend is not None:
+            return None
+        cache_filename = self.cache_filename + api_cmd
+        if self.cache_usage:
+            # the cached budget stretches the TTL, know it before deciding
+            self._read_cached_budget(api_cmd)
+            if self.check_cache_usable(cache_filename):
+                return cache_filename
+        response = self.get_api_response(api_cmd)
+        if api_cmd != 'getdashboarddata':
+            return cache_filename
+        # fetched or the stale copy, both are parsed already
+        self.dashboarddata = response
+        return None
+
+    def _read_cached_budget(self, api_cmd):
+        """
+            take over the budget of the cached response of api_cmd from the
+            binary cache header or the .meta file write_cache keeps next to
+            the JSON, without parsing the response. Nothing is changed if
+            the budget is known already or neither of them is up to date
+        """
+        if self.api_remaining_hour is not None or \
+                self.api_remaining_day is not None:
+            return
+        if api_cmd == 'getdashboarddata' and self.cache_format == 'binary':
+            # sets the budget from the header even if it has expired
+            self.get_binary_cache()
+            if self.api_remaining_hour is not None or \
+                    self.api_remaining_day is not None:
+                return
+        cache_filename = self.cache_filename + api_cmd
+        try:
+            # older than the response: written by someone else
+            if os.path.getmtime(cache_filename + '.meta') < \
+                    os.path.getmtime(cache_filename):
+                return
+            with open(cache_filename + '.meta') as infile:
+                self.set_remaining_api_calls(json.load(infile))
+        except (IOError, OSError, ValueError):
+            pass
 
-            if self.proxies is not None and \
-                    self.proxies.get('socks') is not None:
+    def refresh_in_background(self, api_cmd):
+        """
+            refresh the cache of api_cmd in a separate thread (or detached
+            child process, see refresh_detached) unless another thread or
+            process is already doing it.
+            returns True if a refresh was started
+        """
+        if self.refresh_thread is not None and self.refresh_thread.is_alive():
+            return False
+
+        cache_filename = self.cache_filename + api_cmd
+        lock = CacheLock(cache_filename)
+        if not lock.acquire(blocking=False):
+            return False
 
+        def refresh(deadline):
+            """ fetch and write while holding the cache lock """
+            try:
                 try:
-                    import requesocks
-                except ImportError as err:
-                    raise ImportError("Unable to use SOCKS proxy server: %s" %
-                                      err)
-                else:
-                    session = requesocks.session()
-                    session.proxies = {
-                        'https': "socks5://%s" % self.proxies['socks']
-                    }
-
-                    try:
-                        resp = session.get(request_url)
-                    except Exception as ex:
-                        raise Exception("Error accessing API URL: %s" % ex)
-
-                    # TODO if resp.status_code < 300 ...
-                    # using .content instead of .text because of
-                    # binary (gzipped) response
-                    response = json.loads(resp.content)
+                    self.schedule_api_call(api_cmd, 'background')
+                    # no retries, the stale copy is served meanwhile
+                    response = self.call_api(api_cmd, deadline, 0)
+                    self.write_cache(response, cache_filename, history=False)
+                finally:
+                    lock.release()
+                self.record_history(api_cmd, response)
+            except Exception as ex:
+                self.refresh_error = ex
+
+        self.refresh_error = None
+        if self.refresh_detached and hasattr(os, 'fork'):
+            self._run_detached(lambda: refresh(None), lock)
+            return True
+        import threading
+        self.refresh_thread = threading.Thread(target=refresh,
+                                               args=(self.deadline,))
+        self.refresh_thread.start()
+        return True
+
+    def _run_detached(self, func, lock=None):
+        """
+            run func in a double forked child which inherits lock (if any)
+            and is not waited for. Its stdio goes to /dev/null, so a
+            caller reading our output (like Nagios) does not wait for it
+            either. The caller's deadline does not apply to it
+        """
+        pid = os.fork()
+        if pid:
+            os.waitpid(pid, 0)
+            if lock is not None:
+                # the child holds the lock now
+                lock.detach()
+            return
+        try:
+            if os.fork():
+                os._exit(0)
+            os.setsid()
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+            # never share the pooled connections of the parent
+            self.http_client = None
+            # the child is detached already
+            self.refresh_detached = False
+            func()
+        finally:
+            os._exit(0)
+
+    def wait_for_refresh(self, timeout=None):
+        """ wait for a running background refresh to finish """
+        if self.refresh_thread is not None:
+            self.refresh_thread.join(timeout)
+
+    def get_scheduler(self):
+        """ Scheduler of schedule_file, None if scheduling is disabled """
+        if self.schedule_file is None:
+            return None
+        if self.scheduler is None or \
+                self.scheduler.state_file != self.schedule_file:
+            from .scheduler import Scheduler
+            self.scheduler = Scheduler(self.schedule_file)
+        self.scheduler.reserve = self.api_calls_reserve
+        return self.scheduler
+
+    def schedule_api_call(self, api_cmd, priority='interactive',
+                          raise_refused=True):
+        """
+            take the scheduler's tokens for one call of api_cmd.
+            Interactive calls wait up to schedule_wait seconds for them.
+            returns False if the call was refused (raises
+            scheduler.BudgetExceeded instead if raise_refused is True)
+        """
+        scheduler = self.get_scheduler()
+        if scheduler is None:
+            return True
+        from .scheduler import BudgetExceeded
+        wait = self.schedule_wait if priority == 'interactive' else 0
+        try:
+            scheduler.acquire(api_cmd, priority, wait)
+        except BudgetExceeded:
+            self.metrics.count('api_calls_refused')
+            if raise_refused:
+                raise
+            return False
+        return True
+
+    def get_http_client(self):
+        """
+            reusable client for all API calls of this instance, so keep-alive
+            connections (and their TLS setup) are shared between requests
+        """
+        if self.http_client is None:
+            from .client import HttpClient, SocksHttpClient
+            proxies = self.proxies or {}
+            if proxies.get('socks') is not None:
+                self.http_client = SocksHttpClient(
+                    proxies['socks'], connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout, metrics=self.metrics)
             else:
-                if self.proxies is not None and \
-                        self.proxies.get('https') is not None:
+                self.http_client = HttpClient(
+                    https_proxy=proxies.get('https'),
+                    connect_timeout=self.connect_timeout,
+                    read_timeout=self.read_timeout, metrics=self.metrics)
+        return self.http_client
 
-                    proxy = request.ProxyHandler({
-                        'https': self.proxies['https']
-                    })
-                    opener = request.build_opener(proxy)
-                    request.install_opener(opener)
+    def get_breaker(self):
+        """ retry.CircuitBreaker of breaker_file (or next to the cache) """
+        state_file = self.breaker_file or self.cache_filename + 'breaker'
+        if self.breaker is None or self.breaker.state_file != state_file:
+            from .retry import CircuitBreaker
+            self.breaker = CircuitBreaker(state_file)
+        self.breaker.threshold = self.breaker_threshold
+        self.breaker.reset_timeout = self.breaker_reset
+        return self.breaker
 
-                # _continue_ with... OR
-                # _else_ open URL without proxy
-                try:
-                    request_cmd = request.urlopen(request_url)
-                except request.URLError, ex:
-                    raise Exception("Error accessing API URL: %s" % ex)
+    def call_api(self, api_cmd, deadline=None, retries=None):
+        """
+            fetch_api_response guarded by the circuit breaker, retried up to
+            retries (default: api_retries) times with jittered backoff as
+            long as the backoff fits before deadline.
+            raises retry.ApiError (CircuitOpen, DeadlineExceeded) if the
+            call failed
+        """
+        from .retry import ApiError, CircuitOpen, DeadlineExceeded, \
+            backoff_delays
+        breaker = self.get_breaker()
+        retry_after = breaker.retry_after()
+        if retry_after is not None:
+            self.metrics.count('api_calls_suspended')
+            raise CircuitOpen("API calls suspended for %.0fs after %i "
+                              "failures" % (retry_after,
+                                            self.breaker_threshold),
+                              retry_after)
+        if retries is None:
+            retries = self.api_retries
+        delays = backoff_delays(self.retry_backoff, self.retry_backoff_max)
+        attempt = 0
+        while True:
+            # the timeout is only passed if there is one, so overrides of
+            # fetch_api_response(api_cmd) keep working without a deadline
+            kwargs = {}
+            if deadline is not None:
+                kwargs['timeout'] = deadline - time.time()
+                if kwargs['timeout'] <= 0:
+                    raise DeadlineExceeded("deadline exceeded before calling"
+                                           " %s" % api_cmd)
+            try:
+                response = self.fetch_api_response(api_cmd, **kwargs)
+            except ApiError as err:
+                delay = next(delays)
+                if not err.retryable or attempt >= retries or \
+                        (deadline is not None and
+                         time.time() + delay >= deadline):
+                    breaker.record_failure()
+                    raise
+                self.metrics.count('api_retries')
+                time.sleep(delay)
+                attempt += 1
+            else:
+                breaker.record_success()
+                return response
 
-                # TODO if resp.status_code < 300 ...
-                response = json.load(request_cmd)
+    def fetch_api_response(self, api_cmd, timeout=None):
+        """
+            call the keynote api without any caching (and retries), within
+            timeout seconds if it is not None
+            returns the decoded response (JSON or XML, see api_format),
+            raises retry.ApiError if the call failed
+        """
+        from .retry import ApiError, status_error
+        request_url = KeynoteApi.gen_api_url(api_cmd, self.api_key,
+                                             self.api_format,
+                                             api_base=self.api_base)
+        client = self.get_http_client()
+        self.metrics.count('api_calls')
+        try:
+            with self.metrics.timer('fetch'):
+                status, body = client.get(request_url, timeout=timeout)
+        except Exception as ex:
+            self.metrics.count('api_errors')
+            raise ApiError("Error accessing API URL: %s" % ex)
 
-            KeynoteApi.write_json_response(response,
-                                           self.cache_filename + api_cmd)
-            self.set_remaining_api_calls(response)
-        return response
+        if status >= 300:
+            self.metrics.count('api_errors')
+            raise status_error(status)
+        with self.metrics.timer('parse'):
+            if self.api_format == 'xml':
+                import io
+                from . import xmlresponse
+                return xmlresponse.parse(io.BytesIO(body))
+            return json.loads(body.decode('utf-8'))
+
+    def write_cache(self, response, cache_filename, history=True):
+        """
+            write a fresh response in all configured cache formats and pass
+            it on to the history (unless history is False, callers holding
+            the cache lock record it after releasing, see record_history)
+            and the scheduler's budget.
+            cache_filename is self.cache_filename + api_cmd. The replaced
+            getdashboarddata response is kept as getdashboarddata.prev
+        """
+        api_cmd = cache_filename[len(self.cache_filename):]
+        backend = self.get_cache_backend()
+        key = self.cache_key(api_cmd)
+        if api_cmd == 'getdashboarddata' and backend.stat(key) is not None:
+            backend.keep_previous(key)
+        stat, size = backend.store(key, response)
+        tier = self._memory_tier(backend)
+        if tier is not None and stat is not None:
+            tier.remember(backend.name(key), stat[0], response, stat[1],
+                          size)
+        if self.cache_format == 'binary' and \
+                cache_filename.endswith('getdashboarddata'):
+            self.binary_cache = None
+            if 'product' in response:
+                KeynoteApi.write_binary_response(response,
+                                                 cache_filename + '.bin')
+            elif os.path.exists(cache_filename + '.bin'):
+                # only the list layout has a binary form
+                os.remove(cache_filename + '.bin')
+        remaining = response.get('remaining_api_calls')
+        if self.cache_backend is None:
+            # the budget for the TTL of a streamed response, see
+            # _read_cached_budget
+            KeynoteApi.write_json_response(
+                {'remaining_api_calls': remaining or {}},
+                cache_filename + '.meta')
+        if history:
+            self.record_history(api_cmd, response)
+        if self.snapshot_db is not None and api_cmd == 'getdashboarddata':
+            self.get_snapshot_store().append(
+                response, KeynoteApi.key_namespace(self.api_key))
+        if self.schedule_file is not None and remaining:
+            self.get_scheduler().update_budget(
+                remaining.get('hour_call_remaining'),
+                remaining.get('day_call_remaining'))
+
+    def record_history(self, api_cmd, response):
+        """
+            add a fresh getdashboarddata response to the history in
+            history_dir (if enabled). This touches a ring file per slot,
+            value and archive, so it never runs under the cache lock and
+            with refresh_detached not in the calling process either
+        """
+        if self.history_dir is None or api_cmd != 'getdashboarddata':
+            return
+        if self.refresh_detached and hasattr(os, 'fork'):
+            self._run_detached(lambda: self.record_history(api_cmd,
+                                                           response))
+            return
+        with self.metrics.timer('history'):
+            self.get_history_store().append(response)
+
+    def get_history_store(self):
+        """ HistoryStore in history_dir, None if history is disabled """
+        if self.history_dir is None:
+            return None
+        if self.history is None or \
+                self.history.directory != self.history_dir:
+            from .history import DEFAULT_ARCHIVES, HistoryStore
+            self.history = HistoryStore(
+                self.history_dir, self.history_archives or DEFAULT_ARCHIVES)
+        return self.history
+
+    def get_history(self, measurement_slot, data_type='perf_data', name=None,
+                    start=None, end=None, step=None):
+        """
+            recorded values of a slot between the unix timestamps start and
+            end, read from history_dir only (no API call).
+            step selects the archive resolution, by default the finest one
+            still covering start is used.
+
+            returns [(timestamp, value), ...] for one timerange name or
+            {name: [(timestamp, value), ...]} of all timeranges
+        """
+        store = self.get_history_store()
+        if store is None:
+            return [] if name is not None else {}
+        if name is not None:
+            return store.query(measurement_slot, data_type, name, start, end,
+                               step)
+        history = {}
+        for name in store.names(measurement_slot, data_type):
+            history[name] = store.query(measurement_slot, data_type, name,
+                                        start, end, step)
+        return history
+
+    def get_snapshot_store(self):
+        """
+            store.SnapshotStore of snapshot_db, or a private in-memory one
+            (filled on demand by select_slots)
+        """
+        filename = self.snapshot_db or ':memory:'
+        if self.snapshot_store is None or \
+                self.snapshot_store.filename != filename:
+            from .store import SnapshotStore
+            self.snapshot_store = SnapshotStore(filename,
+                                                self.snapshot_retention)
+            self._stored_snapshot = None
+        return self.snapshot_store
+
+    def get_stored_snapshot(self):
+        """
+            id of the current getdashboarddata snapshot in the snapshot
+            store, appending it if needed. A fresh cache which is already
+            stored in snapshot_db is used without loading the response
+        """
+        store = self.get_snapshot_store()
+        account = KeynoteApi.key_namespace(self.api_key)
+        backend = self.get_cache_backend()
+        key = self.cache_key('getdashboarddata')
+        if self.dashboarddata is None and not self.mockinput and \
+                self.cache_usage:
+            latest = store.latest(account)
+            stat = backend.stat(key) if latest is not None else None
+            if stat is not None and latest[1] >= stat[1] and \
+                    time.time() - stat[1] < self.get_cache_maxage():
+                return latest[0]
+
+        dashboarddata = self.get_dashboarddata()
+        if self._stored_snapshot is None or \
+                self._stored_snapshot[0] is not dashboarddata:
+            # a fetch has already been written by write_cache
+            latest = store.latest(account)
+            stat = None if self.mockinput else backend.stat(key)
+            if latest is None or stat is None or latest[1] < stat[1]:
+                latest = (store.append(dashboarddata, account,
+                                       stat[1] if stat else None), None)
+            self._stored_snapshot = (dashboarddata, latest[0])
+        return self._stored_snapshot[1]
+
+    def select_slots(self, data_type='avail_data', timerange='last_one_hour',
+                     below=None, above=None, inclusive=False, product=None,
+                     patterns=None, sort='value', reverse=False, limit=None):
+        """
+            slots of the current snapshot filtered by value bounds, product
+            and shell patterns, sorted by 'value' or 'alias' - as indexed
+            SQL query on the snapshot store:
+
+                kapi.select_slots('avail_data', 'last_one_hour', below=99)
+
+            returns [(alias, product, value, unit), ...], value None if
+            missing
+
+            Without snapshot_db a running keynoted answers the query from
+            its snapshot.
+        """
+        if self.snapshot_db is None and self.dashboarddata is None:
+            rows = self._ask_daemon(
+                'select_slots', data_type=data_type, timerange=timerange,
+                below=below, above=above, inclusive=inclusive,
+                product=product, patterns=patterns, sort=sort,
+                reverse=reverse, limit=limit)
+            if rows is not None:
+                return rows
+        return self.get_snapshot_store().select(
+            self.get_stored_snapshot(), data_type, timerange, below, above,
+            inclusive, product, patterns, sort, reverse, limit)
+
+    def select_slot_history(self, measurement_slot, data_type='perf_data',
+                            timerange='last_one_hour', start=None, end=None):
+        """
+            [(fetched_at, value), ...] of one slot value in all snapshots
+            of snapshot_db between start and end (no API call)
+        """
+        return self.get_snapshot_store().history(
+            measurement_slot, data_type, timerange,
+            KeynoteApi.key_namespace(self.api_key), start, end)
+
+    @staticmethod
+    def write_binary_response(data, filename):
+        """
+            write the pre-indexed binary form of a getdashboarddata
+            response
+        """
+        from .binarycache import encode
+        content = encode(data)
+        atomic_write(filename, lambda outfile: outfile.write(content), 'wb')
+
+    def get_daemon_client(self):
+        """
+            client for a running keynoted if one is configured and its
+            socket exists. returns None otherwise
+        """
+        if self.daemon_socket is None or self.mockinput or \
+                not os.path.exists(self.daemon_socket):
+            return None
+        from .daemon import DaemonClient
+        return DaemonClient(self.daemon_socket, self.api_key)
+
+    def _ask_daemon(self, method, *args, **kwargs):
+        """
+            call a DaemonClient method and take over the budget it reports.
+            returns None (and stops asking) if the daemon is unavailable
+        """
+        client = self.get_daemon_client()
+        if client is None:
+            return None
+        from .daemon import DaemonUnavailable
+        try:
+            result, remaining = getattr(client, method)(*args, **kwargs)
+        except DaemonUnavailable:
+            self.metrics.count('daemon_unavailable')
+            self.daemon_socket = None
+            return None
+        self.metrics.count('daemon_answers')
+        self.set_remaining_api_calls({'remaining_api_calls': {
+            'hour_call_remaining': remaining[0],
+            'day_call_remaining': remaining[1]}})
+        return result
+
+    def prefetch_slots(self, measurement_slots):
+        """
+            fetch the records of several slots from a running keynoted in
+            one request, so their getters do not ask it again
+        """
+        self._get_daemon_records(measurement_slots)
+
+    def _get_daemon_records(self, measurement_slots):
+        """
+            {slot: {data_type: data}} of the given slots from a running
+            keynoted, asking it only for the ones not fetched within the
+            cache TTL. returns None if the daemon is unavailable
+        """
+        fetched_at, records = self._daemon_records
+        if time.time() - fetched_at > self.get_cache_maxage():
+            fetched_at, records = time.time(), {}
+            self._daemon_records = (fetched_at, records)
+        missing = [slot for slot in measurement_slots if slot not in records]
+        if missing:
+            answer = self._ask_daemon('get_records', missing)
+            if answer is None:
+                return None
+            records.update(answer)
+        return records
+
+    def get_binary_cache(self):
+        """
+            mmap'ed binary cache of getdashboarddata if it is enabled, fresh
+            and valid. returns None otherwise (callers fall back to JSON)
+        """
+        if self.cache_format != 'binary' or self.mockinput or \
+                not self.cache_usage:
+            return None
+        if self.binary_cache is None:
+            from .binarycache import BinaryCache, BinaryCacheError
+            filename = self.cache_filename + 'getdashboarddata.bin'
+            try:
+                binary_cache = BinaryCache(filename)
+            except BinaryCacheError:
+                return None
+            # read first, the cached budget is needed for the effective TTL
+            # (like get_api_response)
+            hour, day = binary_cache.remaining_api_calls
+            self.set_remaining_api_calls({'remaining_api_calls': {
+                'hour_call_remaining': hour, 'day_call_remaining': day}})
+            if not self.check_cache_usable(filename):
+                binary_cache.close()
+                return None
+            self.binary_cache = binary_cache
+        return self.binary_cache
 
     @staticmethod
     def write_json_response(data, filename):
-        """ write JSON data to local disk (used for caching)"""
-        with open(filename, 'wb') as outfile:
-            json.dump(data, outfile)
+        """
+            write JSON data to local disk (used for caching).
+            the file is replaced atomically, readers never see partial data
+        """
+        atomic_write(filename, lambda outfile: json.dump(data, outfile))
+
+    def read_response_file(self, filename):
+        """
+            read a JSON or XML response (e.g. mock input) from local disk,
+            the format is detected from the content
+        """
+        from . import streaming
+        with open_response(filename) as infile:
+            if not streaming.is_xml(infile):
+                response = None
+            else:
+                from . import xmlresponse
+                with self.metrics.timer('cache_read'):
+                    response = xmlresponse.parse(infile)
+        if response is None:
+            return self.read_json_response_file(filename)
+        self.set_remaining_api_calls(response)
+        return response
 
     def read_json_response_file(self, filename):
         """ read JSON data from local disk """
-        with open(filename, 'rb') as infile:
-            response = json.load(infile)
+        with self.metrics.timer('cache_read'):
+            with open_response(filename) as infile:
+                response = json.load(infile)
         self.set_remaining_api_calls(response)
         return response
 
@@ -169,6 +934,15 @@ class KeynoteApi(object):
                     response['remaining_api_calls']['day_call_remaining']
             except KeyError:
                 pass
+            self.metrics.gauge('api_remaining_hour', self.api_remaining_hour)
+            self.metrics.gauge('api_remaining_day', self.api_remaining_day)
+
+    def add_hook(self, hook):
+        """
+            call hook(kind, name, value) on every metrics update
+            (kind: 'count', 'gauge' or 'timing', see metrics.Metrics)
+        """
+        self.metrics.add_hook(hook)
 
     def get_remaining_api_calls(self):
         """ getter for remaining API calls. [0]=hourly, [1]=daily """
@@ -180,15 +954,169 @@ class KeynoteApi(object):
             self.dashboarddata = self.get_api_response('getdashboarddata')
         return self.dashboarddata
 
+    def get_snapshot(self):
+        """
+            compact Snapshot of the current dashboarddata with all values
+            parsed to float (NaN for missing values)
+        """
+        dashboarddata = self.get_dashboarddata()
+        if self.snapshot is None or \
+                self._snapshot_source is not dashboarddata:
+            if self.snapshot is not None:
+                self.previous_snapshot = self.snapshot
+            self.snapshot = Snapshot(dashboarddata)
+            self._snapshot_source = dashboarddata
+        return self.snapshot
+
+    def get_previous_snapshot(self):
+        """
+            Snapshot replaced by the current one: the one seen before by
+            this instance, otherwise the previous getdashboarddata response
+            kept next to the cache. None if there is none
+        """
+        if self.previous_snapshot is None and self.mockinput is None:
+            response = self.get_cache_backend().get(
+                self.cache_key('getdashboarddata.prev'))
+            if response is not None:
+                self.previous_snapshot = Snapshot(response)
+        return self.previous_snapshot
+
+    def get_snapshot_diff(self):
+        """
+            diff.SnapshotDiff from the previous to the current snapshot
+            (everything counts as added without a previous one)
+        """
+        from .diff import diff_snapshots
+        snapshot = self.get_snapshot()
+        return diff_snapshots(self.get_previous_snapshot(), snapshot)
+
+    def iter_changes(self):
+        """ events of get_snapshot_diff(), see diff.SnapshotDiff.events """
+        return self.get_snapshot_diff().events()
+
+    def get_slot_index(self):
+        """
+            alias -> [measurement, ...] lookup table for the current
+            dashboarddata. It is built once per fetched snapshot and only
+            rebuilt when dashboarddata gets replaced.
+
+            In compact mode the entries are snapshot.Measurement objects.
+        """
+        if self.compact:
+            return self.get_snapshot().index
+        return self._get_raw_slot_index()
+
+    def _get_raw_slot_index(self):
+        """ alias -> [raw measurement dict, ...] of the current snapshot """
+        dashboarddata = self.get_dashboarddata()
+        if self._slot_index is None or \
+                self._slot_index_source is not dashboarddata:
+            self._slot_index = KeynoteApi.build_slot_index(dashboarddata)
+            self._slot_index_source = dashboarddata
+        return self._slot_index
+
+    @staticmethod
+    def build_slot_index(dashboarddata):
+        """
+            walk all products of a dashboarddata response once and group
+            their measurements by alias (in order of appearance)
+        """
+        index = {}
+        for product in dashboarddata.get('product', []):
+            for item in product.get('measurement', []):
+                index.setdefault(item['alias'], []).append(item)
+        return index
+
+    def iter_measurements(self):
+        """
+            yield the measurements of getdashboarddata one at a time, from a
+            running keynoted or streaming through the response file if it
+            is not loaded yet
+        """
+        if self.dashboarddata is not None:
+            for product in self.dashboarddata.get('product', []):
+                for measurement in product.get('measurement', []):
+                    yield measurement
+            for measurement in self.dashboarddata.get('grid-rows', []):
+                yield measurement
+            return
+
+        measurements = self._ask_daemon('get_measurements')
+        if measurements is not None:
+            for measurement in measurements:
+                yield measurement
+            return
+
+        from . import streaming
+        filename = self.get_response_filename('getdashboarddata')
+        if filename is None:
+            self.get_dashboarddata()
+            for measurement in self.iter_measurements():
+                yield measurement
+            return
+        with open_response(filename) as infile:
+            if streaming.is_xml(infile):
+                from . import xmlresponse
+                streaming = xmlresponse
+            for measurement in streaming.iter_measurements(infile):
+                yield measurement
+
+    def find_measurement(self, measurement_slot):
+        """
+            raw measurement dict of one slot, the last one if the alias
+            occurs more than once. Without loaded dashboarddata the
+            response is streamed (see find_measurements).
+            returns None for unknown slots
+        """
+        measurements = self.find_measurements(measurement_slot)
+        return measurements[-1] if measurements else None
+
+    def find_measurements(self, measurement_slot):
+        """
+            raw measurement dicts of one slot in order of appearance.
+            Without loaded dashboarddata the response is streamed instead
+            of loading all of it
+        """
+        if self.dashboarddata is None and self.cache_backend is not None \
+                and not self.mockinput:
+            # nothing to stream through without cache files
+            self.get_dashboarddata()
+        if self.dashboarddata is not None:
+            return self._get_raw_slot_index().get(measurement_slot, [])
+
+        if measurement_slot not in self._streamed:
+            from . import streaming
+            filename = self.get_response_filename('getdashboarddata')
+            if filename is None:
+                return self._get_raw_slot_index().get(measurement_slot, [])
+            extras = {}
+            with open_response(filename) as infile:
+                if streaming.is_xml(infile):
+                    from . import xmlresponse
+                    streaming = xmlresponse
+                self._streamed[measurement_slot] = \
+                    streaming.find_measurements(infile, measurement_slot,
+                                                extras=extras)
+            # the budget of a cached response was not read yet
+            self.set_remaining_api_calls(extras)
+        return self._streamed[measurement_slot]
+
     def get_measurement_slots(self):
         """
             process measurement slots from class-local dashboarddata
             return: [ (product, id), (testprod, 4)]
         """
+        if self.dashboarddata is None:
+            slots = self._ask_daemon('get_measurement_slots')
+            if slots is not None:
+                return slots
+            if self.get_binary_cache() is not None:
+                return self.binary_cache.get_measurement_slots()
+
         slots = {}
-        for product in self.get_dashboarddata().get('product', []):
-            for item in product.get('measurement', []):
-                slots[item['alias']] = item['id']
+        for alias, measurements in self.get_slot_index().items():
+            slots[alias] = measurements[-1].id if self.compact \
+                else measurements[-1]['id']
         return slots
 
     def get_perf_data(self, measurement_slot):
@@ -206,12 +1134,51 @@ class KeynoteApi(object):
         return self._get_data(measurement_slot, data_type='threshold_data')
 
     def _get_data(self, measurement_slot, data_type=None):
-        """ getter for avail_data, perf_data, threshold_data """
+        """
+            getter for avail_data, perf_data, threshold_data.
+            values are strings as in the response, or floats in compact mode
+        """
         data = {}
-        if data_type is not None:
-            for product in self.get_dashboarddata().get('product', []):
-                for type_ in product.get('measurement', []):
-                    if type_['alias'] == measurement_slot:
-                        for item in type_[data_type]:
-                            data[item['name']] = item['value']
+        if data_type is None:
+            return data
+
+        if self.dashboarddata is None:
+            raw_data = self._get_data_without_dashboarddata(measurement_slot,
+                                                            data_type)
+            if raw_data is not None:
+                for name, value in raw_data.items():
+                    data[name] = parse_value(value) if self.compact \
+                        else value
+                return data
+
+        for type_ in self.get_slot_index().get(measurement_slot, []):
+            if self.compact:
+                data.update(type_.get_data(data_type))
+            else:
+                for item in type_[data_type]:
+                    data[item['name']] = item['value']
         return data
+
+    def _get_data_without_dashboarddata(self, measurement_slot, data_type):
+        """
+            single slot lookup from a running keynoted, the binary cache or
+            by streaming through the response, without loading all of
+            dashboarddata.
+            returns {name: raw value} or None if none of them is enabled
+        """
+        records = self._get_daemon_records([measurement_slot])
+        if records is not None:
+            return records[measurement_slot].get(data_type, {})
+
+        binary_cache = self.get_binary_cache()
+        if binary_cache is not None:
+            return binary_cache.get_data(measurement_slot, data_type) or {}
+
+        if self.streaming:
+            # merged like the other paths, later duplicates win
+            data = {}
+            for measurement in self.find_measurements(measurement_slot):
+                for item in measurement.get(data_type, []):
+                    data[item['name']] = item['value']
+            return data
+        return None
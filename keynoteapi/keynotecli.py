@@ -4,7 +4,9 @@
     (c) 2015 Norman Messtorff <normes@normes.org>
 """
 from __future__ import print_function
-from keynoteapi import KeynoteApi
+import sys
+
+from .keynoteapi import KeynoteApi
 
 
 class KeynoteCli(object):
@@ -13,33 +15,54 @@ class KeynoteCli(object):
         self.kapi = KeynoteApi(api_key, proxies=proxies)
         self.kapi.set_mockinput(mockinput)
 
-    def list_measurements(self):
-        """List all available measurement slots and its data"""
-        for measurement in self.kapi.get_measurement_slots():
-            print("\n# '%s': " % measurement)
-
-            print('  Availability data:')
-            for timerange in self.kapi.get_avail_data(measurement):
-                value = self.kapi.get_avail_data(measurement)[timerange]
-                # do not print a percent sign unless we have an actual value
-                print("    - %s:\t %s%s" % (timerange, value,
-                                            "" if value in ["", "-"] else "%"))
-
-            print('  Response times:')
-            for timerange in self.kapi.get_perf_data(measurement):
-                value = self.kapi.get_perf_data(measurement)[timerange]
-                # do not print a unit symbol unless we have an actual value
-                print("    - %s:\t %s%s" % (timerange, value,
-                                            "" if value in ["", "-"] else "s"))
-
-            thresholds = self.kapi.get_threshold_data(measurement)
-            if len(thresholds.keys()) > 0:
-                print('  Threshold data:')
-                print("    - availability warning: %s" %
-                      thresholds.get('availwarning', '-'))
-                print("    - availability critical: %s" %
-                      thresholds.get('availcritical', '-'))
-                print("    - performance warning: %s" %
-                      thresholds.get('perfwarning', '-'))
-                print("    - performance critical: %s" %
-                      thresholds.get('perfcritical', '-'))
+    def list_measurements(self, report_format='text', sort=None,
+                          reverse=False, patterns=None, outfile=None):
+        """
+            List all available measurement slots and its data in one pass
+            over the response, as text or table (see report).
+            sort: 'slot' or '<avail|perf|threshold>:<timerange>'
+            patterns: shell patterns of the slots to list
+        """
+        from .report import render
+        return render(self.kapi.iter_measurements(), outfile or sys.stdout,
+                      report_format, sort, reverse, patterns)
+
+    def export(self, outfile, export_format='csv', patterns=None):
+        """
+            stream all (or the slots matching fnmatch patterns) values to
+            outfile as csv, jsonl or columnar (see export).
+            returns the number of exported values
+        """
+        from .export import export
+        return export(self.kapi.iter_measurements(), outfile, export_format,
+                      patterns)
+
+    def query(self, condition, patterns=None, reverse=False, limit=None,
+              outfile=None):
+        """
+            print the slots matching a condition like
+            'avail:last_one_hour<99' sorted by value, selected with an
+            indexed query on the snapshot store (see KeynoteApi.select_slots)
+            returns the number of slots
+        """
+        from .store import parse_condition
+        data_type, timerange, bounds = parse_condition(condition)
+        outfile = outfile or sys.stdout
+        rows = self.kapi.select_slots(data_type, timerange, patterns=patterns,
+                                      reverse=reverse, limit=limit, **bounds)
+        for alias, _, value, unit in rows:
+            outfile.write("%s\t%s %s\n" % (alias, value, unit or ''))
+        return len(rows)
+
+    def list_changes(self, outfile=None):
+        """
+            List only the measurement slots which changed since the previous
+            snapshot, and the removed ones
+        """
+        from .report import render
+        diff = self.kapi.get_snapshot_diff()
+        outfile = outfile or sys.stdout
+        render(self.kapi.iter_measurements(), outfile,
+               aliases=set(diff.changed_aliases()))
+        for measurement in diff.removed:
+            outfile.write("\n# '%s': removed\n" % measurement)
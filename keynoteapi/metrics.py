@@ -0,0 +1,131 @@
+"""
+    Self-measurement of KeynoteApi: counters, gauges and timings of the hot
+    path (cache, HTTP fetch, parsing, API budget)
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import time
+
+try:
+    from _thread import allocate_lock
+except ImportError:
+    from thread import allocate_lock
+
+
+class Timer(object):
+    """ context manager adding its duration to a timing of Metrics """
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.time() - self.start)
+
+
+class Metrics(object):
+    """
+        Counters (monotonic), gauges (last value) and timings (count, sum
+        and max of durations in seconds).
+
+        Hooks are called as hook(kind, name, value) for every update, kind
+        being 'count', 'gauge' or 'timing'. Updates are thread-safe (the
+        background refresh and pool workers share the instance), hooks are
+        called outside of the lock.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+        self.hooks = []
+        self._lock = allocate_lock()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _notify(self, kind, name, value):
+        for hook in self.hooks:
+            hook(kind, name, value)
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._notify('count', name, value)
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+        self._notify('gauge', name, value)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+        self._notify('timing', name, seconds)
+
+    def timer(self, name):
+        """ with metrics.timer('fetch'): ... """
+        return Timer(self, name)
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.gauges = {}
+            self.timings = {}
+
+    def _sorted(self):
+        """ consistent copy of (counters, gauges, timings) as sorted items """
+        with self._lock:
+            return (sorted(self.counters.items()),
+                    sorted(self.gauges.items()),
+                    sorted((name, list(timing))
+                           for name, timing in self.timings.items()))
+
+    def perfdata(self):
+        """
+            [(name, value, uom), ...] for Nagios perfdata: counters,
+            gauges and the total seconds of every timing
+        """
+        counters, gauges, timings = self._sorted()
+        result = []
+        for name, value in counters:
+            result.append((name, value, 'B' if name.startswith('bytes')
+                           else 'c'))
+        for name, value in gauges:
+            if value is not None:
+                result.append((name, value, ''))
+        for name, timing in timings:
+            result.append(('%s_time' % name, timing[1], 's'))
+        return result
+
+    def prometheus(self, prefix='keynoteapi'):
+        """ all metrics in the Prometheus text exposition format """
+        counters, gauges, timings = self._sorted()
+        lines = []
+        for name, value in counters:
+            metric = '%s_%s_total' % (prefix, name)
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s %s' % (metric, value))
+        for name, value in gauges:
+            if value is None:
+                continue
+            metric = '%s_%s' % (prefix, name)
+            lines.append('# TYPE %s gauge' % metric)
+            lines.append('%s %s' % (metric, value))
+        for name, timing in timings:
+            metric = '%s_%s_seconds' % (prefix, name)
+            lines.append('# TYPE %s summary' % metric)
+            lines.append('%s_count %i' % (metric, timing[0]))
+            lines.append('%s_sum %.6f' % (metric, timing[1]))
+            lines.append('# TYPE %s_max gauge' % metric)
+            lines.append('%s_max %.6f' % (metric, timing[2]))
+        return '\n'.join(lines) + '\n'
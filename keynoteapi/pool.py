@@ -0,0 +1,148 @@
+"""
+    Several Keynote accounts side by side: one KeynoteApi per API key,
+    fetched in parallel on a bounded number of threads
+
+    Every account keeps its own cache namespace (see
+    KeynoteApi.key_namespace), API budget, scheduler state and history, so
+    the accounts never share a file.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import os
+import threading
+
+from .keynoteapi import KeynoteApi
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def run_parallel(func, items, max_workers=4):
+    """
+        call func(item) for every item on up to max_workers threads.
+        returns ({item: result}, {item: exception})
+    """
+    items = list(items)
+    results = {}
+    errors = {}
+    pending = queue.Queue()
+    for item in items:
+        pending.put(item)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                item = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = func(item)
+            except Exception as err:
+                with lock:
+                    errors[item] = err
+            else:
+                with lock:
+                    results[item] = result
+
+    threads = [threading.Thread(target=worker)
+               for _ in range(max(1, min(max_workers, len(items))))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+class KeynoteApiPool(object):
+    """
+        KeynoteApi instances of many accounts.
+
+        api_keys is a list of API keys (the accounts are named by their key
+        namespace then) or a dict of account name -> API key. Attributes
+        set with configure() apply to every account, cache_filename,
+        schedule_file and history_dir get a per-account suffix.
+    """
+    # attributes naming files which need one per account, formatted with
+    # the configured value and the key namespace
+    per_account_paths = {'cache_filename': '%s%s_',
+                         'schedule_file': '%s.%s',
+                         'history_dir': os.path.join('%s', '%s')}
+
+    def __init__(self, api_keys, proxies=None, compact=True, max_workers=4):
+        if not isinstance(api_keys, dict):
+            api_keys = dict((KeynoteApi.key_namespace(api_key), api_key)
+                            for api_key in api_keys)
+        self.max_workers = max_workers
+        self.apis = {}
+        for account, api_key in api_keys.items():
+            self.apis[account] = KeynoteApi(api_key, proxies=proxies,
+                                            compact=compact)
+        self.errors = {}
+
+    @property
+    def accounts(self):
+        return sorted(self.apis)
+
+    def configure(self, **attributes):
+        """ set KeynoteApi attributes (cache_maxage=..., ...) everywhere """
+        for kapi in self.apis.values():
+            for name, value in attributes.items():
+                if name in self.per_account_paths and value is not None:
+                    value = self.per_account_paths[name] % (
+                        value, KeynoteApi.key_namespace(kapi.api_key))
+                setattr(kapi, name, value)
+
+    def fetch_all(self, api_cmd='getdashboarddata'):
+        """
+            get api_cmd of all accounts in parallel (from their caches if
+            they are fresh). getdashboarddata is kept in each KeynoteApi.
+            returns {account: exception} of the failed accounts
+        """
+        def fetch(account):
+            kapi = self.apis[account]
+            response = kapi.get_api_response(api_cmd)
+            if api_cmd == 'getdashboarddata':
+                kapi.dashboarddata = response
+            return response
+
+        _, self.errors = run_parallel(fetch, self.accounts,
+                                      self.max_workers)
+        return self.errors
+
+    def get_measurement_slots(self):
+        """ {(account, alias): id} of all successfully fetched accounts """
+        slots = {}
+        for account in self.accounts:
+            if account in self.errors:
+                continue
+            for alias, id_ in self.apis[account].get_measurement_slots(
+                    ).items():
+                slots[(account, alias)] = id_
+        return slots
+
+    def iter_slots(self):
+        """
+            yield {'account', 'alias', 'id', 'perf_data', 'avail_data',
+            'threshold_data'} for every slot of every account, sorted
+        """
+        for (account, alias), id_ in sorted(
+                self.get_measurement_slots().items()):
+            kapi = self.apis[account]
+            yield {'account': account, 'alias': alias, 'id': id_,
+                   'perf_data': kapi.get_perf_data(alias),
+                   'avail_data': kapi.get_avail_data(alias),
+                   'threshold_data': kapi.get_threshold_data(alias)}
+
+    def find(self, alias):
+        """ accounts having a slot alias """
+        return [account for account, slot_alias in
+                sorted(self.get_measurement_slots()) if slot_alias == alias]
+
+    def get_remaining_api_calls(self):
+        """ {account: [hourly, daily]} """
+        return dict((account, kapi.get_remaining_api_calls())
+                    for account, kapi in self.apis.items())
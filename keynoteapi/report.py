@@ -0,0 +1,190 @@
+"""
+    Single pass renderer of the measurement slot listing (keynoteCli -l)
+
+    The response is walked once (see KeynoteApi.iter_measurements), the
+    values of every slot are grouped, then sorted, filtered and rendered as
+    text or table into buffered chunks.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import fnmatch
+
+from .export import BufferedWriter
+from .snapshot import parse_value
+
+FORMATS = ('text', 'table')
+REPORT_TYPES = ('avail_data', 'perf_data', 'threshold_data')
+UNITS = {'avail_data': '%', 'perf_data': 's'}
+THRESHOLDS = (('availability warning', 'availwarning'),
+              ('availability critical', 'availcritical'),
+              ('performance warning', 'perfwarning'),
+              ('performance critical', 'perfcritical'))
+# short names of the data types for sort keys and table headers
+SHORT_NAMES = {'avail': 'avail_data', 'perf': 'perf_data',
+               'threshold': 'threshold_data'}
+
+
+class SlotReport(object):
+    """
+        one slot of the listing, referencing its raw measurements (several
+        for slots in more than one product or grid slots without an
+        aggregated row, later ones win)
+    """
+    __slots__ = ('alias', 'agent', 'items')
+
+    def __init__(self, alias, agent=None):
+        self.alias = alias
+        self.agent = agent
+        self.items = []
+
+    def cells(self, data_type):
+        """ raw cells of data_type in order of the response """
+        if len(self.items) == 1:
+            return self.items[0].get(data_type) or ()
+        merged = {}
+        order = []
+        for item in self.items:
+            for cell in item.get(data_type) or ():
+                if cell['name'] not in merged:
+                    order.append(cell['name'])
+                merged[cell['name']] = cell
+        return [merged[name] for name in order]
+
+    def values(self, data_type):
+        """ {name: raw value} of data_type """
+        return dict((cell['name'], cell.get('value'))
+                    for cell in self.cells(data_type))
+
+    def get(self, data_type, name, default=None):
+        value = default
+        for cell in self.cells(data_type):
+            if cell['name'] == name:
+                value = cell.get('value')
+        return value
+
+
+def collect(measurements, patterns=None, aliases=None,
+            grid_aggregate_agent='All'):
+    """
+        group raw measurements (list layout) or grid rows by slot in one
+        pass. Grid slots use their aggregated agent row if there is one
+        (like snapshot.Snapshot). patterns are fnmatch patterns, aliases a
+        set of slots to keep (None: all). returns {alias: SlotReport}
+    """
+    slots = {}
+    for item in measurements:
+        if 'x-alias' in item:
+            alias, agent = item['x-alias'], item.get('y-alias')
+        else:
+            alias, agent = item['alias'], None
+        if aliases is not None and alias not in aliases:
+            continue
+        if patterns and not any(fnmatch.fnmatchcase(alias, pattern)
+                                for pattern in patterns):
+            continue
+        report = slots.get(alias)
+        if report is None or (agent == grid_aggregate_agent and
+                              report.agent != grid_aggregate_agent):
+            report = slots[alias] = SlotReport(alias, agent)
+        elif report.agent == grid_aggregate_agent:
+            continue
+        report.items.append(item)
+    return slots
+
+
+def sort_key(key, reverse=False):
+    """
+        sort function for SlotReports: 'slot' or '<type>:<timerange>' like
+        'avail:last_one_hour', highest first if reverse. Slots without the
+        value go last either way
+    """
+    if key in (None, 'slot'):
+        return lambda report: report.alias
+    data_type, _, name = key.partition(':')
+    data_type = SHORT_NAMES.get(data_type, data_type)
+    if data_type not in REPORT_TYPES or not name:
+        raise ValueError("invalid sort key %s (slot or <%s>:<timerange>)" %
+                         (key, '|'.join(sorted(SHORT_NAMES))))
+
+    sign = -1 if reverse else 1
+
+    def value_key(report):
+        value = parse_value(report.get(data_type, name))
+        return (value != value, sign * value if value == value else 0.0,
+                report.alias)
+    return value_key
+
+
+def _with_unit(value, data_type):
+    # do not print a unit symbol unless we have an actual value
+    return "%s%s" % (value, "" if value in ["", "-"]
+                     else UNITS[data_type])
+
+
+def render_text(reports):
+    """ yield the text listing of SlotReports line by line """
+    for report in reports:
+        yield "\n# '%s': \n" % report.alias
+        for title, data_type in (('Availability data', 'avail_data'),
+                                 ('Response times', 'perf_data')):
+            yield '  %s:\n' % title
+            for cell in report.cells(data_type):
+                yield "    - %s:\t %s\n" % (
+                    cell['name'], _with_unit(cell.get('value'), data_type))
+        thresholds = report.values('threshold_data')
+        if thresholds:
+            yield '  Threshold data:\n'
+            for title, name in THRESHOLDS:
+                yield "    - %s: %s\n" % (title, thresholds.get(name, '-'))
+
+
+def render_table(reports):
+    """
+        yield an aligned table: one row per slot, one column per timerange
+        of availability and response time
+    """
+    reports = list(reports)
+    columns = []
+    for data_type in ('avail_data', 'perf_data'):
+        seen = set()
+        for report in reports:
+            for cell in report.cells(data_type):
+                if cell['name'] not in seen:
+                    seen.add(cell['name'])
+                    columns.append((data_type, cell['name']))
+    header = ['slot'] + ['%s:%s' % (data_type.split('_')[0], name)
+                         for data_type, name in columns]
+    rows = []
+    for report in reports:
+        values = {'avail_data': report.values('avail_data'),
+                  'perf_data': report.values('perf_data')}
+        rows.append([report.alias] + ['%s' % values[data_type].get(name, '-')
+                                      for data_type, name in columns])
+    widths = [len(title) for title in header]
+    for row in rows:
+        widths = [max(width, len(field)) for width, field in zip(widths, row)]
+    for row in [header] + rows:
+        yield ' '.join(field.ljust(width)
+                       for field, width in zip(row, widths)).rstrip() + '\n'
+
+
+RENDERERS = {'text': render_text, 'table': render_table}
+
+
+def render(measurements, outfile, report_format='text', sort=None,
+           reverse=False, patterns=None, aliases=None, buffer_size=65536):
+    """
+        write the listing of raw measurements to outfile in buffered
+        chunks. returns the number of listed slots
+    """
+    if report_format not in RENDERERS:
+        raise ValueError("%s not in valid formats %s" % (
+            report_format, ", ".join(FORMATS)))
+    reports = sorted(collect(measurements, patterns, aliases).values(),
+                     key=sort_key(sort, reverse),
+                     reverse=reverse and sort in (None, 'slot'))
+    writer = BufferedWriter(outfile, buffer_size)
+    for chunk in RENDERERS[report_format](reports):
+        writer.write(chunk)
+    writer.close()
+    return len(reports)
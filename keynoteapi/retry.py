@@ -0,0 +1,134 @@
+"""
+    Errors of API calls, jittered backoff between retries and a circuit
+    breaker shared by all processes using the same state file
+
+    A call is retried only while the caller's deadline leaves room for the
+    backoff and another attempt. After `threshold` failed calls in a row
+    the breaker opens: no call goes out for `reset_timeout` seconds, then
+    a single trial call decides whether it closes again. KeynoteApi serves
+    the expired cache in the meantime (see KeynoteApi.get_api_response).
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import json
+import random
+import time
+
+from .cache import CacheLock, atomic_write
+
+
+class ApiError(Exception):
+    """
+        an API call failed. retryable is False for errors a retry cannot
+        fix (like HTTP 4xx), status is the HTTP status if there was one
+    """
+    def __init__(self, message, status=None, retryable=True):
+        Exception.__init__(self, message)
+        self.status = status
+        self.retryable = retryable
+
+
+class DeadlineExceeded(ApiError):
+    """ no time left for (another) API call """
+    def __init__(self, message):
+        ApiError.__init__(self, message, retryable=False)
+
+
+class CircuitOpen(ApiError):
+    """ the circuit breaker refused an API call """
+    def __init__(self, message, retry_after=None):
+        ApiError.__init__(self, message, retryable=False)
+        self.retry_after = retry_after
+
+
+def status_error(status):
+    """ ApiError of an HTTP status, only 429 and 5xx are worth a retry """
+    return ApiError("Error accessing API URL: HTTP status %s" % status,
+                    status, status == 429 or status >= 500)
+
+
+def backoff_delays(base, cap, rnd=random):
+    """
+        endless delays between retries: uniformly drawn from 0 up to base
+        doubled per retry, at most cap ("full jitter", so clients failing
+        at the same time do not retry at the same time)
+    """
+    attempt = 0
+    while True:
+        yield rnd.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+class CircuitBreaker(object):
+    """
+        consecutive failed calls in state_file (JSON, updated under a
+        CacheLock), or in memory if state_file is None:
+            {"failures": 5, "opened": 1420070400.0}
+    """
+    def __init__(self, state_file=None, threshold=5, reset_timeout=60):
+        self.state_file = state_file
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = {'failures': 0, 'opened': None}
+
+    def _load(self):
+        if self.state_file is None:
+            return dict(self.state)
+        try:
+            with open(self.state_file) as infile:
+                state = json.load(infile)
+        except (IOError, OSError, ValueError):
+            state = {}
+        state.setdefault('failures', 0)
+        state.setdefault('opened', None)
+        return state
+
+    def _save(self, state):
+        if self.state_file is None:
+            self.state = state
+        else:
+            atomic_write(self.state_file,
+                         lambda outfile: json.dump(state, outfile))
+
+    def _update(self, update):
+        """ apply update(state) to the state under the lock """
+        if self.state_file is None:
+            update(self.state)
+            return
+        with CacheLock(self.state_file):
+            state = self._load()
+            update(state)
+            self._save(state)
+
+    def retry_after(self, now=None):
+        """
+            None if a call may go out, otherwise the seconds until the
+            next trial call
+        """
+        opened = self._load()['opened']
+        if opened is None:
+            return None
+        remaining = opened + self.reset_timeout - \
+            (time.time() if now is None else now)
+        return remaining if remaining > 0 else None
+
+    def is_open(self, now=None):
+        return self.retry_after(now) is not None
+
+    def record_success(self):
+        """ a call succeeded: close the breaker """
+        if self._load()['failures']:
+            self._update(lambda state: state.update(failures=0, opened=None))
+
+    def record_failure(self, now=None):
+        """
+            a call failed (after its retries): open the breaker at the
+            threshold, again after a failed trial call
+        """
+        now = time.time() if now is None else now
+
+        def update(state):
+            state['failures'] += 1
+            if state['failures'] >= self.threshold:
+                state['opened'] = now
+        self._update(update)
@@ -0,0 +1,177 @@
+"""
+    Token bucket scheduler for API calls, shared by all processes using the
+    same state file
+
+    The hourly and daily budget reported by the API (minus a reserve) is
+    refilled evenly over the rest of the hour/day into two buckets holding
+    at most `burst` tokens. Every API call takes one token of both. A call
+    is refused once the budget down to the reserve is spent, long before
+    the API itself would reject it.
+
+    Interactive calls (checks) go first: background refreshes leave the
+    last token to them and are deferred while an interactive call waits.
+    Identical api_cmds never get here twice at once, the cache lock in
+    KeynoteApi.get_api_response already coalesces them.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import json
+import os
+import time
+
+from .cache import CacheLock, atomic_write
+
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+PERIODS = (('hour', 3600), ('day', 86400))
+# waiting calls older than this are from crashed processes
+PENDING_TIMEOUT = 60
+
+
+class BudgetExceeded(Exception):
+    """ the scheduler refused an API call """
+    def __init__(self, message, retry_after=None):
+        Exception.__init__(self, message)
+        self.retry_after = retry_after
+
+
+class Scheduler(object):
+    """
+        Token buckets in state_file (JSON, updated under a CacheLock):
+            {"hour": {"remaining": 250, "tokens": 1.5, "updated": ...},
+             "day": {...}, "pending": {"<pid> <api_cmd>": [priority, since]}}
+    """
+    def __init__(self, state_file, reserve=0, burst=3):
+        self.state_file = state_file
+        self.reserve = reserve
+        self.burst = burst
+
+    def _load(self):
+        try:
+            with open(self.state_file) as infile:
+                state = json.load(infile)
+        except (IOError, OSError, ValueError):
+            state = {}
+        for period, _ in PERIODS:
+            state.setdefault(period, {'remaining': None, 'tokens': 0,
+                                      'updated': None})
+        state.setdefault('pending', {})
+        return state
+
+    def _save(self, state):
+        atomic_write(self.state_file,
+                     lambda outfile: json.dump(state, outfile))
+
+    def _refill(self, state, now):
+        """
+            add the tokens earned since the last update of each bucket and
+            forget waiting calls of crashed processes
+        """
+        for period, seconds in PERIODS:
+            bucket = state[period]
+            updated = bucket['updated']
+            if updated is not None and int(updated // seconds) != \
+                    int(now // seconds):
+                # the API started a new hour/day, the budget is unknown
+                # until the next response tells it
+                bucket['remaining'] = None
+            if bucket['remaining'] is not None and updated is not None:
+                bucket['tokens'] = min(
+                    self.burst, bucket['tokens'] +
+                    self.rate(bucket['remaining'], seconds, now) *
+                    max(0, now - updated))
+            bucket['updated'] = now
+        pending = {}
+        for key, entry in state['pending'].items():
+            if now - entry[1] < PENDING_TIMEOUT:
+                pending[key] = entry
+        state['pending'] = pending
+
+    def rate(self, remaining, seconds, now):
+        """ tokens per second spreading remaining calls over the period """
+        usable = remaining - self.reserve
+        if usable <= 0:
+            return 0.0
+        return float(usable) / (seconds - now % seconds)
+
+    def _check(self, state, priority, now):
+        """
+            None if a call may go out now, otherwise (reason, seconds until
+            it may go out)
+        """
+        if priority == BACKGROUND:
+            for pending_priority, _ in state['pending'].values():
+                if pending_priority == INTERACTIVE:
+                    return 'interactive calls first', 1.0
+        needed = 2 if priority == BACKGROUND else 1
+        wait = 0.0
+        for period, seconds in PERIODS:
+            bucket = state[period]
+            if bucket['remaining'] is None:
+                continue
+            if bucket['remaining'] - self.reserve < needed:
+                return ('%sly budget spent (%s calls left, %s reserved)' %
+                        (period, bucket['remaining'], self.reserve),
+                        seconds - now % seconds)
+            if bucket['tokens'] < needed:
+                rate = self.rate(bucket['remaining'], seconds, now)
+                wait = max(wait, (needed - bucket['tokens']) / rate)
+        if wait > 0:
+            return 'spreading the budget', wait
+        return None
+
+    def acquire(self, api_cmd, priority=INTERACTIVE, wait=0, now=None):
+        """
+            take the tokens of one call of api_cmd, waiting up to wait
+            seconds for them. raises BudgetExceeded if the call has to be
+            refused or deferred. (now is for tests and disables waiting)
+        """
+        key = '%s %s' % (os.getpid(), api_cmd)
+        deadline = (time.time() if now is None else now) + wait
+        while True:
+            current = time.time() if now is None else now
+            with CacheLock(self.state_file):
+                state = self._load()
+                self._refill(state, current)
+                refused = self._check(state, priority, current)
+                if refused is None:
+                    for period, _ in PERIODS:
+                        bucket = state[period]
+                        if bucket['remaining'] is not None:
+                            bucket['tokens'] -= 1
+                            bucket['remaining'] -= 1
+                    state['pending'].pop(key, None)
+                    self._save(state)
+                    return True
+                reason, retry_after = refused
+                if current + retry_after > deadline or now is not None:
+                    state['pending'].pop(key, None)
+                    self._save(state)
+                    raise BudgetExceeded('%s call of %s refused: %s' %
+                                         (priority, api_cmd, reason),
+                                         retry_after)
+                state['pending'][key] = [priority, current]
+                self._save(state)
+            time.sleep(min(retry_after, max(0.01, deadline - current)))
+
+    def update_budget(self, remaining_hour, remaining_day, now=None):
+        """ take over the budget reported by an API response """
+        now = time.time() if now is None else now
+        with CacheLock(self.state_file):
+            state = self._load()
+            self._refill(state, now)
+            for (period, _), remaining in zip(PERIODS, (remaining_hour,
+                                                        remaining_day)):
+                if remaining is None:
+                    continue
+                if state[period]['remaining'] is None:
+                    # budget (re)learned: allow a burst right away
+                    state[period]['tokens'] = self.burst
+                state[period]['remaining'] = remaining
+            self._save(state)
+
+    def get_state(self):
+        """ current buckets (for monitoring) """
+        state = self._load()
+        self._refill(state, time.time())
+        return state
@@ -0,0 +1,156 @@
+"""
+    Compact, typed representation of a getdashboarddata response
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+from array import array
+
+NAN = float('nan')
+
+DATA_TYPES = ('perf_data', 'avail_data', 'threshold_data')
+
+
+def parse_value(value):
+    """
+        convert an API value to float once.
+        returns NAN for missing values like "-" and "" (or garbage)
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+class Measurement(object):
+    """
+        One measurement (list layout) or one slot/agent row (grid layout).
+
+        Value names are shared tuples owned by the Snapshot, the values
+        themselves are kept as float arrays in the same order.
+    """
+    __slots__ = ('alias', 'id', 'product', 'agent', 'names', 'values',
+                 'units')
+
+    def __init__(self, alias, id_=None, product=None, agent=None):
+        self.alias = alias
+        self.id = id_
+        self.product = product
+        self.agent = agent
+        # one entry per data type, in order of DATA_TYPES
+        self.names = [(), (), ()]
+        self.values = [array('d'), array('d'), array('d')]
+        self.units = [None, None, None]
+
+    def get_data(self, data_type):
+        """ dict of name -> float for perf_data, avail_data, threshold_data """
+        pos = DATA_TYPES.index(data_type)
+        return dict(zip(self.names[pos], self.values[pos]))
+
+    def get_value(self, data_type, name, default=NAN):
+        """ single value lookup without building a dict """
+        pos = DATA_TYPES.index(data_type)
+        try:
+            return self.values[pos][self.names[pos].index(name)]
+        except ValueError:
+            return default
+
+    def get_unit(self, data_type):
+        """ unit of perf_data, avail_data or threshold_data values """
+        return self.units[DATA_TYPES.index(data_type)]
+
+    def __repr__(self):
+        return "<Measurement %s%s>" % (
+            self.alias, "" if self.agent is None else " @ %s" % self.agent)
+
+
+class Snapshot(object):
+    """
+        Compact snapshot of one getdashboarddata response.
+        Handles the list layout ('product' -> 'measurement') as well as the
+        grid layout ('grid-rows', slot = x-alias, agent = y-alias).
+    """
+    grid_aggregate_agent = 'All'
+
+    def __init__(self, dashboarddata=None):
+        self.measurements = []
+        self.index = {}
+        self.remaining_api_calls = [None, None]
+        self._strings = {}
+        self._name_tuples = {}
+        if dashboarddata is not None:
+            self.load(dashboarddata)
+
+    def intern(self, value):
+        """ share equal strings (names, units) across all measurements """
+        return self._strings.setdefault(value, value)
+
+    def _intern_names(self, names):
+        """ share equal name tuples across all measurements """
+        names = tuple(self.intern(name) for name in names)
+        return self._name_tuples.setdefault(names, names)
+
+    def _fill(self, measurement, item):
+        """ copy all data types of a raw measurement/grid-row """
+        for pos, data_type in enumerate(DATA_TYPES):
+            cells = item.get(data_type) or []
+            measurement.names[pos] = self._intern_names(
+                cell['name'] for cell in cells)
+            measurement.values[pos] = array(
+                'd', [parse_value(cell.get('value')) for cell in cells])
+            if cells:
+                measurement.units[pos] = self.intern(cells[0].get('unit'))
+        return measurement
+
+    def load(self, dashboarddata):
+        """ add all measurements of a getdashboarddata response """
+        remaining = dashboarddata.get('remaining_api_calls') or {}
+        self.remaining_api_calls = [remaining.get('hour_call_remaining'),
+                                    remaining.get('day_call_remaining')]
+
+        for product in dashboarddata.get('product', []):
+            product_id = product.get('id')
+            for item in product.get('measurement', []):
+                self.add_raw(item, product_id)
+
+        for item in dashboarddata.get('grid-rows', []):
+            self.add_raw(item)
+
+    def add_raw(self, item, product_id=None):
+        """
+            add a raw measurement (list layout) or grid row (grid layout)
+            returns the new Measurement
+        """
+        if 'x-alias' in item:
+            measurement = Measurement(item['x-alias'], item.get('x-num'),
+                                      agent=self.intern(item.get('y-alias')))
+        else:
+            measurement = Measurement(item['alias'], item.get('id'),
+                                      self.intern(product_id))
+        self.add(self._fill(measurement, item))
+        return measurement
+
+    def add(self, measurement):
+        """
+            register a measurement. Grid rows are indexed by their slot
+            alias, using the aggregated agent row if there is one.
+        """
+        self.measurements.append(measurement)
+        entries = self.index.setdefault(measurement.alias, [])
+        if measurement.agent is None:
+            entries.append(measurement)
+        elif measurement.agent == self.grid_aggregate_agent:
+            entries[:] = [measurement]
+        elif not entries or \
+                entries[0].agent != self.grid_aggregate_agent:
+            entries.append(measurement)
+
+    def agents(self, alias):
+        """ per-agent rows of a slot (grid layout only) """
+        result = {}
+        for measurement in self.measurements:
+            if measurement.alias == alias and measurement.agent is not None:
+                result[measurement.agent] = measurement
+        return result
+
+    def __len__(self):
+        return len(self.measurements)
@@ -0,0 +1,183 @@
+"""
+    Statistics over the recorded value history (see history) used for
+    dynamic thresholds: percentiles, EWMA and the median absolute deviation
+
+    baselines() handles many series in one batch. With NumPy installed all
+    series are stacked into one matrix and computed at once, otherwise a
+    pure Python fallback gives the same results series by series.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import math
+import warnings
+
+NAN = float('nan')
+# scales the MAD of normally distributed data to its standard deviation
+MAD_SIGMA = 1.4826
+DEFAULT_PERCENTILES = (5, 50, 95)
+
+_numpy = None
+
+
+def get_numpy():
+    """ the numpy module, or None if it is not installed (imported lazily) """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def _valid(values):
+    """ sorted values without NaN (missing samples) """
+    return sorted(value for value in values if value == value)
+
+
+def percentile(values, q):
+    """
+        q-th percentile (0-100) with linear interpolation like
+        numpy.percentile. NaN values are ignored, NaN if there are none
+    """
+    values = _valid(values)
+    if not values:
+        return NAN
+    pos = (len(values) - 1) * q / 100.0
+    low = int(math.floor(pos))
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+def median(values):
+    return percentile(values, 50)
+
+
+def mad(values):
+    """ median absolute deviation from the median """
+    center = median(values)
+    return median([abs(value - center) for value in _valid(values)])
+
+
+def ewma(values, alpha=0.3):
+    """
+        exponentially weighted moving average of values (oldest first),
+        returns the latest average. NaN values are skipped
+    """
+    average = NAN
+    for value in values:
+        if value != value:
+            continue
+        average = value if average != average \
+            else average + alpha * (value - average)
+    return average
+
+
+class Baseline(object):
+    """ summary of one series, NaN everywhere if it has no samples """
+    __slots__ = ('count', 'median', 'mad', 'ewma', 'percentiles')
+
+    def __init__(self, count, median_, mad_, ewma_, percentiles):
+        self.count = count
+        self.median = median_
+        self.mad = mad_
+        self.ewma = ewma_
+        self.percentiles = percentiles
+
+    @property
+    def spread(self):
+        """ robust estimate of the standard deviation """
+        return MAD_SIGMA * self.mad
+
+    def __repr__(self):
+        return "<Baseline n=%i median=%g mad=%g ewma=%g>" % (
+            self.count, self.median, self.mad, self.ewma)
+
+
+def _baseline(values, qs, alpha):
+    valid = _valid(values)
+    return Baseline(len(valid), median(valid), mad(valid),
+                    ewma(values, alpha),
+                    dict((q, percentile(valid, q)) for q in qs))
+
+
+def _baselines_numpy(numpy, keys, series, qs, alpha):
+    """ one matrix for all series, right aligned and padded with NaN """
+    width = max(1, max(len(series[key]) for key in keys))
+    matrix = numpy.full((len(keys), width), numpy.nan)
+    for row, key in enumerate(keys):
+        values = series[key]
+        if len(values):
+            matrix[row, width - len(values):] = values
+
+    with warnings.catch_warnings():
+        # rows without any sample ("All-NaN slice") are NaN on purpose
+        warnings.simplefilter('ignore', RuntimeWarning)
+        counts = numpy.sum(~numpy.isnan(matrix), axis=1)
+        medians = numpy.nanmedian(matrix, axis=1)
+        mads = numpy.nanmedian(numpy.abs(matrix - medians[:, None]), axis=1)
+        percentiles = numpy.nanpercentile(matrix, list(qs), axis=1) \
+            if qs else numpy.empty((0, len(keys)))
+
+    averages = numpy.full(len(keys), numpy.nan)
+    for column in matrix.T:
+        valid = ~numpy.isnan(column)
+        first = valid & numpy.isnan(averages)
+        averages[first] = column[first]
+        update = valid & ~first
+        averages[update] += alpha * (column[update] - averages[update])
+
+    result = {}
+    for row, key in enumerate(keys):
+        result[key] = Baseline(
+            int(counts[row]), float(medians[row]), float(mads[row]),
+            float(averages[row]),
+            dict((q, float(percentiles[pos][row]))
+                 for pos, q in enumerate(qs)))
+    return result
+
+
+def baselines(series, percentiles=DEFAULT_PERCENTILES, alpha=0.3,
+              use_numpy=None):
+    """
+        Baselines of many series in one pass.
+
+        series maps any key (e.g. (slot, data_type, timerange)) to a list
+        of values, oldest first, NaN for missing samples.
+        use_numpy: None to use NumPy if it is installed, False to force the
+        pure Python implementation.
+
+        returns {key: Baseline}
+    """
+    keys = list(series)
+    numpy = get_numpy() if use_numpy is not False else None
+    if numpy is not None and keys:
+        return _baselines_numpy(numpy, keys, series, tuple(percentiles),
+                                alpha)
+    result = {}
+    for key in keys:
+        result[key] = _baseline(series[key], percentiles, alpha)
+    return result
+
+
+def dynamic_range(baseline, factor, higher_is_worse=True, min_spread=0.0,
+                  limits=(None, None)):
+    """
+        Nagios range string accepting values up to factor times the spread
+        away from the EWMA of a baseline on the bad side
+        (":limit" if higher_is_worse, "limit:" otherwise), clipped to
+        limits. returns None if the baseline has no samples
+    """
+    if not baseline.count:
+        return None
+    spread = max(baseline.spread, min_spread)
+    if higher_is_worse:
+        limit = baseline.ewma + factor * spread
+        if limits[1] is not None:
+            limit = min(limit, limits[1])
+        return ':%.6g' % limit
+    limit = baseline.ewma - factor * spread
+    if limits[0] is not None:
+        limit = max(limit, limits[0])
+    return '%.6g:' % limit
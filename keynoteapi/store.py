@@ -0,0 +1,203 @@
+"""
+    Indexed SQLite store of getdashboarddata snapshots
+
+    Every snapshot is written in one transaction: one row per account and
+    fetch in `snapshots`, one row per slot, product, data type and value
+    name (the timerange like last_one_hour, or the threshold name) in
+    `slot_values`. Grid slots are stored with their aggregated agent row
+    (like snapshot.Snapshot), missing values as NULL. The rows are built
+    straight from the raw response, a Snapshot would cost more than the
+    inserts.
+
+    Selections like "all slots under 99% availability in the last hour"
+    run as indexed SQL on the latest snapshot instead of walking the
+    response in Python:
+
+        store.select(store.latest(account)[0], 'avail_data',
+                     'last_one_hour', below=99)
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import re
+import sqlite3
+import time
+
+from .report import collect
+from .snapshot import DATA_TYPES, parse_value
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS snapshots ('
+    ' id INTEGER PRIMARY KEY, account TEXT NOT NULL,'
+    ' fetched_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS slot_values ('
+    ' snapshot_id INTEGER NOT NULL, alias TEXT NOT NULL, product TEXT,'
+    ' data_type TEXT NOT NULL, timerange TEXT NOT NULL, value REAL,'
+    ' unit TEXT)',
+    'CREATE INDEX IF NOT EXISTS snapshots_fetched_at'
+    ' ON snapshots (account, fetched_at)',
+    'CREATE INDEX IF NOT EXISTS slot_values_timerange'
+    ' ON slot_values (snapshot_id, data_type, timerange, value)',
+    'CREATE INDEX IF NOT EXISTS slot_values_alias'
+    ' ON slot_values (alias, data_type, timerange, snapshot_id)',
+    'CREATE INDEX IF NOT EXISTS slot_values_product'
+    ' ON slot_values (product, snapshot_id)',
+)
+# short data type names of conditions, like report.SHORT_NAMES
+SHORT_NAMES = {'avail': 'avail_data', 'perf': 'perf_data',
+               'threshold': 'threshold_data'}
+CONDITION = re.compile(r'^(\w+):(\w+)\s*(<=|>=|<|>)\s*([-+0-9.eE]+)$')
+
+
+def parse_condition(condition):
+    """
+        'avail:last_one_hour<99' -> ('avail_data', 'last_one_hour',
+        {'below': 99.0}). <= and >= are inclusive, < and > are not
+    """
+    match = CONDITION.match(condition.strip())
+    data_type = SHORT_NAMES.get(match.group(1), match.group(1)) \
+        if match else None
+    if data_type not in DATA_TYPES:
+        raise ValueError("invalid condition %s (like avail:last_one_hour<99)"
+                         % condition)
+    operator, value = match.group(3), float(match.group(4))
+    bound = {'<': 'below', '<=': 'below', '>': 'above', '>=': 'above'}
+    return data_type, match.group(2), {bound[operator]: value,
+                                       'inclusive': '=' in operator}
+
+
+def iter_items(dashboarddata):
+    """
+        yield (alias, product id, raw measurement) of a getdashboarddata
+        response, grid slots only with their aggregated agent row if there
+        is one (product None)
+    """
+    for product in dashboarddata.get('product', []):
+        product_id = product.get('id')
+        for item in product.get('measurement', []):
+            yield item['alias'], product_id, item
+    if 'grid-rows' in dashboarddata:
+        for alias, report in collect(dashboarddata['grid-rows']).items():
+            for item in report.items:
+                yield alias, None, item
+
+
+class SnapshotStore(object):
+    """
+        snapshots of any number of accounts in the SQLite database
+        filename (':memory:' for a private in-memory one). Snapshots older
+        than retention seconds are pruned on append (None: kept forever)
+    """
+    def __init__(self, filename, retention=None, timeout=10):
+        self.filename = filename
+        self.retention = retention
+        self.connection = sqlite3.connect(filename, timeout,
+                                          check_same_thread=False)
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        self.connection.close()
+
+    def append(self, dashboarddata, account='', timestamp=None):
+        """
+            write all values of a getdashboarddata response as one
+            snapshot in a single transaction. returns the snapshot id
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        rows = []
+        for alias, product, item in iter_items(dashboarddata):
+            for data_type in DATA_TYPES:
+                for cell in item.get(data_type) or ():
+                    value = parse_value(cell.get('value'))
+                    rows.append((alias, product, data_type, cell['name'],
+                                 value if value == value else None,
+                                 cell.get('unit')))
+        with self.connection:
+            cursor = self.connection.execute(
+                'INSERT INTO snapshots (account, fetched_at) VALUES (?, ?)',
+                (account, timestamp))
+            snapshot_id = cursor.lastrowid
+            self.connection.executemany(
+                'INSERT INTO slot_values VALUES (%i, ?, ?, ?, ?, ?, ?)' %
+                snapshot_id, rows)
+            if self.retention is not None:
+                self._prune(timestamp - self.retention)
+        return snapshot_id
+
+    def _prune(self, before):
+        expired = self.connection.execute(
+            'SELECT id FROM snapshots WHERE fetched_at < ?',
+            (before,)).fetchall()
+        self.connection.executemany(
+            'DELETE FROM slot_values WHERE snapshot_id = ?', expired)
+        self.connection.executemany('DELETE FROM snapshots WHERE id = ?',
+                                    expired)
+
+    def prune(self, before):
+        """ delete all snapshots fetched before the timestamp before """
+        with self.connection:
+            self._prune(before)
+
+    def latest(self, account=''):
+        """ (id, fetched_at) of the newest snapshot of account or None """
+        return self.connection.execute(
+            'SELECT id, fetched_at FROM snapshots WHERE account = ?'
+            ' ORDER BY fetched_at DESC LIMIT 1', (account,)).fetchone()
+
+    def snapshots(self, account='', start=None, end=None):
+        """ [(id, fetched_at), ...] of account, oldest first """
+        return self.connection.execute(
+            'SELECT id, fetched_at FROM snapshots WHERE account = ?'
+            ' AND fetched_at >= ? AND fetched_at <= ? ORDER BY fetched_at',
+            (account, -1 if start is None else start,
+             float('inf') if end is None else end)).fetchall()
+
+    def select(self, snapshot_id, data_type='avail_data',
+               timerange='last_one_hour', below=None, above=None,
+               inclusive=False, product=None, patterns=None, sort='value',
+               reverse=False, limit=None):
+        """
+            [(alias, product, value, unit), ...] of one snapshot, filtered
+            by value bounds, product and shell patterns of the alias,
+            sorted by 'value' (missing values last) or 'alias'
+        """
+        sql = ['SELECT alias, product, value, unit FROM slot_values'
+               ' WHERE snapshot_id = ? AND data_type = ? AND timerange = ?']
+        args = [snapshot_id, data_type, timerange]
+        for bound, operator in ((below, '<'), (above, '>')):
+            if bound is not None:
+                sql.append('AND value %s%s ?' % (operator,
+                                                 '=' if inclusive else ''))
+                args.append(bound)
+        if product is not None:
+            sql.append('AND product = ?')
+            args.append(product)
+        if patterns:
+            # GLOB has the syntax of fnmatch (case sensitive)
+            sql.append('AND (%s)' % ' OR '.join(['alias GLOB ?'] *
+                                                len(patterns)))
+            args.extend(patterns)
+        order = ' DESC' if reverse else ''
+        if sort == 'value':
+            sql.append('ORDER BY value IS NULL, value%s, alias' % order)
+        elif sort == 'alias':
+            sql.append('ORDER BY alias%s' % order)
+        else:
+            raise ValueError("invalid sort %s (value or alias)" % sort)
+        if limit is not None:
+            sql.append('LIMIT %i' % limit)
+        return self.connection.execute(' '.join(sql), args).fetchall()
+
+    def history(self, alias, data_type='perf_data', timerange='last_one_hour',
+                account='', start=None, end=None):
+        """ [(fetched_at, value), ...] of one slot value, oldest first """
+        return self.connection.execute(
+            'SELECT fetched_at, value FROM slot_values'
+            ' JOIN snapshots ON snapshots.id = snapshot_id'
+            ' WHERE alias = ? AND data_type = ? AND timerange = ?'
+            ' AND account = ? AND fetched_at >= ? AND fetched_at <= ?'
+            ' ORDER BY fetched_at',
+            (alias, data_type, timerange, account,
+             -1 if start is None else start,
+             float('inf') if end is None else end)).fetchall()
@@ -0,0 +1,159 @@
+"""
+    Incremental parsing of large getdashboarddata responses
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+import codecs
+import json
+import re
+
+# arrays holding the measurements of the list and grid layout
+MEASUREMENT_ARRAYS = re.compile(r'"(?:measurement|grid-rows)"\s*:\s*\[')
+REMAINING_API_CALLS = re.compile(r'"remaining_api_calls"\s*:')
+WHITESPACE = ' \t\n\r,'
+
+
+def is_xml(infile):
+    """
+        True if a response file (opened in binary mode) holds XML rather
+        than JSON (see xmlresponse). The file position is restored
+    """
+    pos = infile.tell()
+    head = infile.read(64).lstrip(b'\xef\xbb\xbf \t\r\n')
+    infile.seek(pos)
+    return head.startswith(b'<')
+
+
+def iter_measurements(infile, chunk_size=65536, extras=None):
+    """
+        yield the measurements ('measurement' entries of all products, or
+        'grid-rows' of the grid layout) of a JSON response one at a time.
+        A dict extras receives the 'remaining_api_calls' of the response
+        once they are read.
+
+        Only one chunk and the current measurement are held in memory, so
+        the caller can stop early and memory does not grow with the number
+        of slots. infile can be opened in text or binary mode.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buf = u''
+    pos = 0
+    eof = False
+    in_array = False
+
+    while True:
+        if not in_array:
+            match = MEASUREMENT_ARRAYS.search(buf, pos)
+            budget = None if extras is None else \
+                REMAINING_API_CALLS.search(buf, pos)
+            if budget is not None and \
+                    (match is None or budget.start() < match.start()):
+                start = budget.end()
+                while start < len(buf) and buf[start] in WHITESPACE:
+                    start += 1
+                try:
+                    extras['remaining_api_calls'], pos = \
+                        decoder.raw_decode(buf, start)
+                    continue
+                except ValueError:
+                    # the budget continues in the next chunk
+                    if eof:
+                        raise
+                    pos = budget.start()
+            elif match is not None:
+                in_array = True
+                pos = match.end()
+                continue
+            elif eof:
+                return
+            else:
+                # keep a tail which may hold the beginning of the next key
+                pos = max(pos, len(buf) - 32)
+        else:
+            while pos < len(buf) and buf[pos] in WHITESPACE:
+                pos += 1
+            if pos < len(buf):
+                if buf[pos] == ']':
+                    in_array = False
+                    pos += 1
+                    continue
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except ValueError:
+                    # measurement continues in the next chunk
+                    if eof:
+                        raise
+                else:
+                    pos = end
+                    yield item
+                    continue
+            elif eof:
+                raise ValueError('unexpected end of measurement array')
+
+        chunk = infile.read(chunk_size)
+        if isinstance(chunk, bytes):
+            chunk = utf8.decode(chunk, not chunk)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+def find_measurements(infile, measurement_slot, chunk_size=65536,
+                      grid_aggregate_agent='All', extras=None):
+    """
+        stream through a response and collect the measurements with alias
+        measurement_slot. An alias can occur in several products of the
+        list layout, so the whole response is read. For the grid layout
+        only the aggregated agent row of the slot is returned if there is
+        one (like snapshot.Snapshot does), reading stops after its rows
+        (and the budget, if extras is given, see iter_measurements).
+
+        returns the list of measurement dicts in order of appearance
+    """
+    return collect_measurements(iter_measurements(infile, chunk_size, extras),
+                                measurement_slot, grid_aggregate_agent,
+                                extras)
+
+
+def collect_measurements(measurements, measurement_slot,
+                         grid_aggregate_agent='All', extras=None):
+    """
+        the measurements with alias measurement_slot of an iterator over
+        the measurements of a response (JSON or XML), see
+        find_measurements. Iterating stops once the grid rows of the slot
+        and the budget in extras (if given) are read
+    """
+    found = []
+    grid_done = False
+    for item in measurements:
+        if 'alias' in item:
+            if item['alias'] == measurement_slot:
+                found.append(item)
+            continue
+        if not grid_done and item.get('x-alias') == measurement_slot:
+            if item.get('y-alias') == grid_aggregate_agent:
+                found = [item]
+                grid_done = True
+            elif not found:
+                found = [item]
+        elif found:
+            # grid rows of a slot are contiguous
+            grid_done = True
+        if grid_done and (extras is None or
+                          'remaining_api_calls' in extras):
+            break
+    return found
+
+
+def find_measurement(infile, measurement_slot, chunk_size=65536,
+                     grid_aggregate_agent='All'):
+    """
+        the last measurement with alias measurement_slot (see
+        find_measurements), later duplicates win as in a loaded response.
+
+        returns the measurement dict or None
+    """
+    found = find_measurements(infile, measurement_slot, chunk_size,
+                              grid_aggregate_agent)
+    return found[-1] if found else None
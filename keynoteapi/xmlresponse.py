@@ -0,0 +1,137 @@
+"""
+    Incremental parsing of XML API responses (format=xml)
+
+    The XML responses are turned into the same dicts as their JSON
+    counterparts, so everything downstream (snapshot, caches, history) does
+    not care about the format. Measurements are converted as soon as their
+    end tag is parsed and then dropped from the tree, memory stays flat
+    however many slots the dashboard has.
+
+    (c) 2015 Norman Messtorff <normes@normes.org>
+"""
+from xml.etree import ElementTree
+
+from .snapshot import DATA_TYPES
+from .streaming import collect_measurements
+
+# elements holding one measurement of the list and grid layout
+MEASUREMENT_TAGS = ('measurement', 'grid-row')
+# child elements of a grid-row which are plain text values
+GRID_TEXT = ('x-alias', 'y-alias')
+REMAINING_API_CALLS = ('hour_call_remaining', 'day_call_remaining')
+
+
+def _text(elem):
+    return (elem.text or '').strip()
+
+
+def _measurement(elem):
+    """ dict of a measurement or grid-row element like in JSON responses """
+    item = dict(elem.attrib)
+    for child in elem:
+        if child.tag in DATA_TYPES:
+            item[child.tag] = [dict(cell.attrib) for cell in child]
+        elif child.tag == 'alias' or child.tag in GRID_TEXT:
+            item[child.tag] = _text(child)
+    return item
+
+
+def _remaining_api_calls(elem):
+    """ budget from attributes or child elements, as int like in JSON """
+    remaining = {}
+    for name in REMAINING_API_CALLS:
+        value = elem.get(name)
+        if value is None and elem.find(name) is not None:
+            value = _text(elem.find(name))
+        try:
+            remaining[name] = int(value)
+        except (TypeError, ValueError):
+            pass
+    return remaining
+
+
+def iter_events(infile):
+    """
+        yield ('measurement', product, item), ('product', product, None)
+        at the start of each product (list layout) and (tag, None, value)
+        for the top level extras ('grid_dimension', 'remaining_api_calls').
+        product is a dict with 'id' and 'name' or None (grid layout).
+        Parsed elements are cleared right away.
+    """
+    stack = []
+    product = None
+    for event, elem in ElementTree.iterparse(infile, ('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag == 'product':
+                product = {'id': elem.get('id')}
+                yield 'product', product, None
+            continue
+        stack.pop()
+        tag = elem.tag
+        if tag in MEASUREMENT_TAGS:
+            yield 'measurement', product, _measurement(elem)
+        elif tag == 'name' and product is not None and stack and \
+                stack[-1].tag == 'product':
+            product['name'] = _text(elem)
+        elif tag == 'product':
+            product = None
+        elif tag == 'grid_dimension':
+            yield tag, None, dict((child.tag, dict(child.attrib))
+                                  for child in elem)
+        elif tag == 'remaining_api_calls':
+            yield tag, None, _remaining_api_calls(elem)
+        else:
+            continue
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+
+def parse(infile):
+    """ the whole response as dict, like json.load of the JSON response """
+    response = {}
+    for kind, product, value in iter_events(infile):
+        if kind == 'product':
+            product['measurement'] = []
+            response.setdefault('product', []).append(product)
+        elif kind == 'measurement':
+            if product is None:
+                response.setdefault('grid-rows', []).append(value)
+            else:
+                product['measurement'].append(value)
+        else:
+            response[kind] = value
+    return response
+
+
+def iter_measurements(infile, extras=None):
+    """
+        yield the measurements (list layout) or grid rows (grid layout) one
+        at a time, see streaming.iter_measurements
+    """
+    for kind, _, value in iter_events(infile):
+        if kind == 'measurement':
+            yield value
+        elif kind == 'remaining_api_calls' and extras is not None:
+            extras[kind] = value
+
+
+def find_measurements(infile, measurement_slot, grid_aggregate_agent='All',
+                      extras=None):
+    """
+        stream through a response and collect the measurements with alias
+        measurement_slot, see streaming.find_measurements
+    """
+    return collect_measurements(iter_measurements(infile, extras),
+                                measurement_slot, grid_aggregate_agent,
+                                extras)
+
+
+def find_measurement(infile, measurement_slot, grid_aggregate_agent='All'):
+    """
+        the last measurement with alias measurement_slot, see
+        streaming.find_measurement
+    """
+    found = find_measurements(infile, measurement_slot, grid_aggregate_agent)
+    return found[-1] if found else None
@@ -26,10 +26,11 @@ def read(*filenames, **kwargs):
 
 setup(
     name='keynoteapi',
-    packages=find_packages(exclude=['tests']),
+    packages=find_packages(exclude=['tests', 'benchmarks']),
     scripts=[
         'check_keynote',
-        'keynoteCli'
+        'keynoteCli',
+        'keynoted'
     ],
     description='Access the Keynote Systems API (api.keynote.com)',
     long_description=read('README.md'),
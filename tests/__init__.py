@@ -1,3 +1,61 @@
 """
     Test module for keynoteapi
 """
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import keynoteapi.keynoteapi
+from benchmarks import generator
+
+
+def load(filename):
+    """ a JSON fixture as dict """
+    with open(filename) as infile:
+        return json.load(infile)
+
+
+def write_large_dashboard(filename, slots, response_format='json'):
+    """
+        generated list layout response (see benchmarks.generator) with
+        slots measurements in one product, as JSON or XML. It is written
+        one measurement at a time
+    """
+    rnd = random.Random(0)
+    measurements = (generator.gen_measurement(num, rnd)
+                    for num in range(slots))
+    remaining = {'hour_call_remaining': 1, 'day_call_remaining': 2}
+    if response_format == 'xml':
+        generator.write_xml({'product': [{'name': 'P', 'id': 'P',
+                                          'measurement': measurements}],
+                             'remaining_api_calls': remaining}, filename)
+        return
+    with open(filename, 'w') as outfile:
+        outfile.write('{"product": [{"name": "P", "id": "P", '
+                      '"measurement": [')
+        for num, measurement in enumerate(measurements):
+            outfile.write(',' if num else '')
+            outfile.write(json.dumps(measurement))
+        outfile.write(']}], "remaining_api_calls": %s}' %
+                      json.dumps(remaining))
+
+
+class TempDirTestCase(unittest.TestCase):
+    """ tests with a fresh temporary directory self.tmpdir """
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='keynoteapi-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def in_tmpdir(self, kapi, prefix='cache_'):
+        """ kapi with its cache files in self.tmpdir """
+        kapi.cache_filename = os.path.join(self.tmpdir, prefix)
+        return kapi
+
+    def api(self, api_key='test-api-key', **kwargs):
+        """ KeynoteApi caching in self.tmpdir """
+        return self.in_tmpdir(keynoteapi.keynoteapi.KeynoteApi(api_key,
+                                                               **kwargs))
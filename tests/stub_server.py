@@ -0,0 +1,117 @@
+"""
+    Local stand-in for api.keynote.com used by the tests
+"""
+import gzip
+import io
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """answers every GET with the server's current response"""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+        status, body = self.server.respond(self)
+        if 'gzip' in (self.headers.get('Accept-Encoding') or '') and \
+                self.server.use_gzip:
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+                gz.write(body)
+            body = buf.getvalue()
+            self.send_response(status)
+            self.send_header('Content-Encoding', 'gzip')
+        else:
+            self.send_response(status)
+            if self.server.bogus_encoding is not None:
+                self.send_header('Content-Encoding',
+                                 self.server.bogus_encoding)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    """
+        threaded HTTP server on a random local port.
+        respond(handler) returns (status, body bytes), override it or set
+        body to change the answer. Without use_gzip, bogus_encoding is sent
+        as Content-Encoding of the plain body
+    """
+    daemon_threads = True
+
+    def __init__(self, body=b'{}', use_gzip=True):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+        self.body = body
+        self.use_gzip = use_gzip
+        self.bogus_encoding = None
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       kwargs={'poll_interval': 0.05})
+        self.thread.daemon = True
+
+    @property
+    def api_base(self):
+        return 'http://127.0.0.1:%i/keynote/api' % self.server_address[1]
+
+    def respond(self, handler):
+        return 200, self.body
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class FaultyServer(StubServer):
+    """
+        StubServer failing on purpose. faults lists what the next requests
+        get: an HTTP status (with an error body), ('delay', seconds) before
+        the normal answer or None for the normal answer. Requests beyond
+        the list get default
+    """
+    def __init__(self, body=b'{}', faults=(), default=None):
+        StubServer.__init__(self, body)
+        self.faults = list(faults)
+        self.default = default
+        # wakes delayed answers when the server is shut down
+        self.closed = threading.Event()
+
+    def respond(self, handler):
+        with self.lock:
+            fault = self.faults.pop(0) if self.faults else self.default
+        if isinstance(fault, tuple):
+            self.closed.wait(fault[1])
+        elif fault is not None:
+            return fault, b'error'
+        return 200, self.body
+
+    def handle_error(self, request, client_address):
+        # clients giving up on delayed answers hang up on purpose
+        pass
+
+    def __exit__(self, *args):
+        self.closed.set()
+        StubServer.__exit__(self, *args)
@@ -0,0 +1,110 @@
+"""
+    Testmodule for keynoteapi.asyncapi
+"""
+import json
+import sys
+import threading
+import time
+import unittest
+import keynoteapi.asyncapi
+from tests import TempDirTestCase
+from tests.stub_server import StubServer
+
+
+class SlowServer(StubServer):
+    """answers after a delay and records the highest concurrency"""
+    delay = 0.3
+
+    def __init__(self):
+        StubServer.__init__(self)
+        self.active = 0
+        self.max_active = 0
+
+    def respond(self, handler):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        api_cmd = handler.path.split('?')[0].rsplit('/', 1)[-1]
+        if api_cmd == 'broken':
+            return 500, b'error'
+        return 200, json.dumps({'cmd': api_cmd}).encode('utf-8')
+
+
+class AsyncKeynoteApiTest(TempDirTestCase):
+    """fan out API commands against a local stand-in server"""
+    commands = ['getalarmsummary', 'getmwindows', 'getbaselines',
+                'getalarmlogs']
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.server = SlowServer().__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+        TempDirTestCase.tearDown(self)
+
+    def api(self, max_concurrency=4):
+        akapi = keynoteapi.asyncapi.AsyncKeynoteApi(
+            'test-api-key', max_concurrency=max_concurrency)
+        akapi.kapi.api_base = self.server.api_base
+        self.in_tmpdir(akapi.kapi)
+        return akapi
+
+    def test_get_api_response(self):
+        future = self.api().get_api_response('getmwindows')
+        assert future.result(5) == {'cmd': 'getmwindows'}
+        assert future.done()
+
+    def test_fan_out_waits_for_slowest_call(self):
+        start = time.time()
+        responses = self.api().get_api_responses(self.commands).result(5)
+        elapsed = time.time() - start
+        assert sorted(responses) == sorted(self.commands)
+        assert responses['getbaselines'] == {'cmd': 'getbaselines'}
+        assert elapsed < 2 * SlowServer.delay
+        assert self.server.max_active == len(self.commands)
+
+    def test_concurrency_limit(self):
+        self.api(max_concurrency=2).get_api_responses(self.commands).result(5)
+        assert self.server.max_active == 2
+
+    def test_cache_is_shared(self):
+        akapi = self.api()
+        akapi.get_api_responses(self.commands).result(5)
+        akapi.get_api_responses(self.commands).result(5)
+        assert len(self.server.requests) == len(self.commands)
+
+    def test_error_is_raised_by_result(self):
+        future = self.api().get_api_responses(['getmwindows', 'broken'])
+        self.assertRaises(Exception, future.result, 5)
+
+    def test_empty_fan_out(self):
+        assert self.api().get_api_responses([]).result(1) == {}
+
+    def test_done_callback(self):
+        called = threading.Event()
+        future = self.api().get_api_response('getmwindows')
+        future.add_done_callback(lambda future: called.set())
+        future.result(5)
+        called.wait(1)
+        assert called.is_set()
+
+    @unittest.skipIf(sys.version_info < (3, 5), 'needs asyncio')
+    def test_await(self):
+        import asyncio
+        akapi = self.api()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        start = time.time()
+        try:
+            results = loop.run_until_complete(asyncio.gather(
+                *[akapi.get_api_response(cmd) for cmd in self.commands]))
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+        assert [result['cmd'] for result in results] == self.commands
+        assert time.time() - start < 2 * SlowServer.delay
@@ -0,0 +1,152 @@
+"""
+    Testmodule for keynoteapi.binarycache
+"""
+import os
+import time
+import keynoteapi.binarycache
+import keynoteapi.keynoteapi
+from tests import TempDirTestCase, load
+
+
+class BinaryCacheTest(TempDirTestCase):
+    """encode responses and read single slots back"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.filename = os.path.join(self.tmpdir, 'cache.bin')
+        self.write(load('tests/json/getdashboarddata_list.json'))
+
+    def write(self, dashboarddata):
+        keynoteapi.keynoteapi.KeynoteApi.write_binary_response(
+            dashboarddata, self.filename)
+
+    def corrupt(self, offset, value=b'X'):
+        with open(self.filename, 'r+b') as outfile:
+            outfile.seek(offset)
+            outfile.write(value)
+
+    def test_get_data(self):
+        cache = keynoteapi.binarycache.BinaryCache(self.filename)
+        assert cache.get_data('WPT_Ford', 'perf_data') == {
+            'last_five_minute': '16.726', 'last_fifteen_minute': '16.726',
+            'last_one_hour': '28.465', 'last_24_hours': '28.783'}
+        assert cache.get_data('WPT_Ford', 'threshold_data')['availwarning'] \
+            == '-1.0'
+        cache.close()
+
+    def test_unknown_slot(self):
+        cache = keynoteapi.binarycache.BinaryCache(self.filename)
+        assert cache.get_data('invalid product', 'perf_data') is None
+        assert cache.get_record('invalid product') is None
+
+    def test_remaining_api_calls(self):
+        cache = keynoteapi.binarycache.BinaryCache(self.filename)
+        assert cache.remaining_api_calls == [3596, 21596]
+        self.write({'product': []})
+        cache = keynoteapi.binarycache.BinaryCache(self.filename)
+        assert cache.remaining_api_calls == [None, None]
+
+    def test_measurement_slots(self):
+        cache = keynoteapi.binarycache.BinaryCache(self.filename)
+        assert cache.get_measurement_slots() == {'WPT_Ford': '687588'}
+
+    def test_binary_search(self):
+        measurements = [{'alias': 'slot %04i' % num, 'id': str(num),
+                         'avail_data': [{'name': 'last_one_hour',
+                                         'value': str(num)}]}
+                        for num in range(500, 0, -1)]
+        self.write({'product': [{'measurement': measurements}]})
+        cache = keynoteapi.binarycache.BinaryCache(self.filename)
+        assert cache.slot_count == 500
+        for num in (1, 2, 250, 499, 500):
+            assert cache.get_data('slot %04i' % num, 'avail_data') == {
+                'last_one_hour': str(num)}
+        assert cache.get_data('slot 0000', 'avail_data') is None
+        assert cache.get_data('slot 0501', 'avail_data') is None
+
+    def test_checksum_mismatch(self):
+        self.corrupt(os.path.getsize(self.filename) - 2)
+        self.assertRaises(keynoteapi.binarycache.BinaryCacheError,
+                          keynoteapi.binarycache.BinaryCache, self.filename)
+
+    def test_unknown_version(self):
+        self.corrupt(4, b'\xff')
+        self.assertRaises(keynoteapi.binarycache.BinaryCacheError,
+                          keynoteapi.binarycache.BinaryCache, self.filename)
+
+    def test_missing_and_empty_file(self):
+        self.assertRaises(keynoteapi.binarycache.BinaryCacheError,
+                          keynoteapi.binarycache.BinaryCache,
+                          self.filename + '.missing')
+        open(self.filename, 'w').close()
+        self.assertRaises(keynoteapi.binarycache.BinaryCacheError,
+                          keynoteapi.binarycache.BinaryCache, self.filename)
+
+
+class KeynoteapiBinaryCacheTest(TempDirTestCase):
+    """KeynoteApi prefers the binary cache and falls back to JSON"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        writer = self.api()
+        writer.write_cache(load('tests/json/getdashboarddata_list.json'),
+                           writer.cache_filename + 'getdashboarddata')
+
+    def api(self, compact=False):
+        kapi = TempDirTestCase.api(self, compact=compact)
+        kapi.cache_format = 'binary'
+        return kapi
+
+    def test_reads_binary_cache(self):
+        kapi = self.api()
+        assert kapi.get_avail_data('WPT_Ford')['last_one_hour'] == '98.193'
+        assert kapi.get_measurement_slots() == {'WPT_Ford': '687588'}
+        assert kapi.get_remaining_api_calls() == [3596, 21596]
+        assert kapi.dashboarddata is None
+
+    def test_compact_values(self):
+        kapi = self.api(compact=True)
+        assert kapi.get_perf_data('WPT_Ford')['last_24_hours'] == 28.783
+        assert kapi.dashboarddata is None
+
+    def test_falls_back_to_json_on_corrupt_file(self):
+        with open(os.path.join(self.tmpdir, 'cache_getdashboarddata.bin'),
+                  'r+b') as outfile:
+            outfile.seek(-1, 2)
+            outfile.write(b'X')
+        kapi = self.api()
+        assert kapi.get_avail_data('WPT_Ford')['last_one_hour'] == '98.193'
+        assert kapi.dashboarddata is not None
+
+    def test_ttl_of_cached_budget(self):
+        # a tight budget stretches the TTL, also in a fresh process
+        response = load('tests/json/getdashboarddata_list.json')
+        response['remaining_api_calls'] = {'hour_call_remaining': 1,
+                                           'day_call_remaining': 1}
+        filename = os.path.join(self.tmpdir, 'cache_getdashboarddata')
+        self.api().write_cache(response, filename)
+        old = time.time() - 5
+        for suffix in ('', '.bin'):
+            os.utime(filename + suffix, (old, old))
+        kapi = self.api()
+        kapi.cache_maxage = 1
+        assert kapi.get_binary_cache() is not None
+        assert kapi.get_remaining_api_calls() == [1, 1]
+        # the same decision as for the JSON cache
+        kapi = self.api()
+        kapi.cache_maxage = 1
+        kapi.memory_cache = None
+        kapi.get_api_response('getdashboarddata')
+        assert kapi.metrics.counters['cache_hits'] == 1
+
+    def test_json_only_by_default(self):
+        kapi = self.api()
+        kapi.cache_format = 'json'
+        assert kapi.get_avail_data('WPT_Ford')['last_one_hour'] == '98.193'
+        assert kapi.dashboarddata is not None
+
+    def test_grid_layout_has_no_binary_form(self):
+        kapi = self.api()
+        kapi.write_cache(load('tests/json/getdashboarddata_grid.json'),
+                         kapi.cache_filename + 'getdashboarddata')
+        assert not os.path.exists(kapi.cache_filename +
+                                  'getdashboarddata.bin')
+        assert kapi.get_binary_cache() is None
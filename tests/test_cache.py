@@ -0,0 +1,320 @@
+"""
+    Testmodule for keynoteapi.cache and the cache handling of KeynoteApi
+"""
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import keynoteapi.cache
+import keynoteapi.keynoteapi
+from tests import TempDirTestCase
+
+
+class CountingKeynoteApi(keynoteapi.keynoteapi.KeynoteApi):
+    """KeynoteApi which logs every upstream call to a file"""
+    def __init__(self, calls_filename, delay=0.2):
+        keynoteapi.keynoteapi.KeynoteApi.__init__(self, 'test-api-key')
+        self.calls_filename = calls_filename
+        self.delay = delay
+
+    def fetch_api_response(self, api_cmd):
+        with open(self.calls_filename, 'a') as calls:
+            calls.write('%s %s\n' % (os.getpid(), api_cmd))
+        time.sleep(self.delay)
+        return {'remaining_api_calls': {'hour_call_remaining': 42,
+                                        'day_call_remaining': 4242}}
+
+
+# a check answering from a cache within its grace period
+GRACE_CHECK = """
+import sys, time
+from tests.test_cache import CountingKeynoteApi
+kapi = CountingKeynoteApi(sys.argv[1], delay=float(sys.argv[3]))
+kapi.cache_filename = sys.argv[2]
+kapi.cache_grace = 60
+kapi.refresh_detached = True
+start = time.time()
+kapi.get_api_response('getdashboarddata')
+print(time.time() - start)
+"""
+
+
+def concurrent_reader(tmpdir, start, results):
+    kapi = CountingKeynoteApi(os.path.join(tmpdir, 'calls'))
+    kapi.cache_filename = os.path.join(tmpdir, 'cache_')
+    start.wait()
+    response = kapi.get_api_response('getdashboarddata')
+    results.put(response['remaining_api_calls']['hour_call_remaining'])
+
+
+class CacheTest(TempDirTestCase):
+    """locking and atomic writes of the response cache"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.calls_filename = os.path.join(self.tmpdir, 'calls')
+
+    def calls(self):
+        if not os.path.exists(self.calls_filename):
+            return []
+        with open(self.calls_filename) as calls:
+            return calls.readlines()
+
+    def test_atomic_write(self):
+        filename = os.path.join(self.tmpdir, 'data')
+        keynoteapi.cache.atomic_write(filename,
+                                      lambda outfile: outfile.write('new'))
+        with open(filename) as infile:
+            assert infile.read() == 'new'
+        assert os.listdir(self.tmpdir) == ['data']
+
+    def test_atomic_write_keeps_old_content_on_error(self):
+        filename = os.path.join(self.tmpdir, 'data')
+        keynoteapi.cache.atomic_write(filename,
+                                      lambda outfile: outfile.write('old'))
+
+        def failing_writer(outfile):
+            outfile.write('partial')
+            raise ValueError('writer failed')
+
+        self.assertRaises(ValueError, keynoteapi.cache.atomic_write,
+                          filename, failing_writer)
+        with open(filename) as infile:
+            assert infile.read() == 'old'
+        assert os.listdir(self.tmpdir) == ['data']
+
+    def test_lock_is_exclusive(self):
+        filename = os.path.join(self.tmpdir, 'cache')
+        first = keynoteapi.cache.CacheLock(filename)
+        second = keynoteapi.cache.CacheLock(filename)
+        assert first.acquire()
+        assert not second.acquire(blocking=False)
+        first.release()
+        assert second.acquire(blocking=False)
+        second.release()
+
+    def test_get_api_response_writes_cache(self):
+        kapi = self.in_tmpdir(CountingKeynoteApi(self.calls_filename,
+                                                 delay=0))
+        kapi.get_api_response('getdashboarddata')
+        kapi.get_api_response('getdashboarddata')
+        assert len(self.calls()) == 1
+        with open(kapi.cache_filename + 'getdashboarddata') as infile:
+            assert json.load(infile)['remaining_api_calls'] == {
+                'hour_call_remaining': 42, 'day_call_remaining': 4242}
+        assert kapi.get_remaining_api_calls() == [42, 4242]
+
+    def test_single_flight_refresh(self):
+        """ many processes starting at once cause exactly one API call """
+        start = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(
+            target=concurrent_reader, args=(self.tmpdir, start, results))
+            for _ in range(12)]
+        for process in processes:
+            process.start()
+        start.set()
+        for process in processes:
+            process.join(10)
+
+        assert [results.get(timeout=1) for _ in processes] == \
+            [42] * len(processes)
+        assert len(self.calls()) == 1
+
+
+class CachePolicyTest(TempDirTestCase):
+    """budget-aware TTL and stale-while-revalidate"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.calls_filename = os.path.join(self.tmpdir, 'calls')
+        self.kapi = self.in_tmpdir(CountingKeynoteApi(self.calls_filename,
+                                                      delay=0.2))
+        self.cache_filename = self.kapi.cache_filename + 'getdashboarddata'
+
+    def tearDown(self):
+        self.kapi.wait_for_refresh()
+        TempDirTestCase.tearDown(self)
+
+    def write_cache(self, age, hour_remaining=3000):
+        keynoteapi.keynoteapi.KeynoteApi.write_json_response(
+            {'remaining_api_calls': {'hour_call_remaining': hour_remaining,
+                                     'day_call_remaining': 20000}},
+            self.cache_filename)
+        mtime = time.time() - age
+        os.utime(self.cache_filename, (mtime, mtime))
+
+    def test_cache_maxage_without_budget(self):
+        assert self.kapi.get_cache_maxage() == 60
+
+    def test_cache_maxage_stretched_by_small_budget(self):
+        self.kapi.api_remaining_hour = 10
+        # 30 minutes left in this hour, 10 calls left: one call per 3 minutes
+        assert self.kapi.get_cache_maxage(now=1800) == 180
+
+    def test_cache_maxage_exhausted_budget(self):
+        self.kapi.api_remaining_hour = 0
+        assert self.kapi.get_cache_maxage(now=3000) == 600
+
+    def test_cache_maxage_reserve(self):
+        self.kapi.api_remaining_hour = 12
+        self.kapi.api_calls_reserve = 2
+        assert self.kapi.get_cache_maxage(now=1800) == 180
+
+    def test_cache_maxage_shrinks_to_minage(self):
+        self.kapi.cache_minage = 10
+        self.kapi.api_remaining_hour = 3000
+        self.kapi.api_remaining_day = 20000
+        assert self.kapi.get_cache_maxage(now=0) == 10
+        assert self.kapi.get_cache_maxage(now=3599) == 10
+
+    def test_cache_maxage_daily_budget(self):
+        self.kapi.api_remaining_hour = 3000
+        self.kapi.api_remaining_day = 100
+        assert self.kapi.get_cache_maxage(now=0) == 864
+
+    def test_expired_cache_uses_budget_from_cache_file(self):
+        # 90s old, but only one call left in the 30 minutes of this hour
+        # which are left: still fresh enough
+        maxage = self.kapi.get_cache_maxage
+        self.kapi.get_cache_maxage = lambda now=None: maxage(now=1800)
+        self.write_cache(age=90, hour_remaining=1)
+        response = self.kapi.get_api_response('getdashboarddata')
+        assert response['remaining_api_calls']['hour_call_remaining'] == 1
+        assert self.kapi.refresh_thread is None
+        assert not os.path.exists(self.calls_filename)
+
+    def test_stale_while_revalidate(self):
+        self.kapi.cache_grace = 60
+        self.write_cache(age=90)
+        start = time.time()
+        response = self.kapi.get_api_response('getdashboarddata')
+        assert time.time() - start < 0.2
+        assert response['remaining_api_calls']['hour_call_remaining'] == 3000
+
+        self.kapi.wait_for_refresh()
+        assert self.kapi.refresh_error is None
+        response = self.kapi.get_api_response('getdashboarddata')
+        assert response['remaining_api_calls']['hour_call_remaining'] == 42
+        with open(self.calls_filename) as calls:
+            assert len(calls.readlines()) == 1
+
+    def test_detached_refresh_does_not_delay_exit(self):
+        self.write_cache(age=90)
+        start = time.time()
+        # waits for the exit and the end of the output
+        output = subprocess.check_output(
+            [sys.executable, '-c', GRACE_CHECK, self.calls_filename,
+             self.kapi.cache_filename, '3'])
+        assert time.time() - start < 2
+        assert float(output) < 0.5
+
+        # the detached child finishes the refresh
+        for _ in range(100):
+            with open(self.cache_filename) as infile:
+                if json.load(infile)['remaining_api_calls'][
+                        'hour_call_remaining'] == 42:
+                    break
+            time.sleep(0.1)
+        else:
+            assert False, 'cache not refreshed'
+        lock = keynoteapi.cache.CacheLock(self.cache_filename)
+        assert lock.acquire(timeout=5)
+        lock.release()
+
+    def test_stale_without_second_refresh(self):
+        self.kapi.cache_grace = 60
+        self.write_cache(age=90)
+        lock = keynoteapi.cache.CacheLock(self.cache_filename)
+        lock.acquire()
+        try:
+            self.kapi.get_api_response('getdashboarddata')
+            assert self.kapi.refresh_thread is None
+        finally:
+            lock.release()
+
+    def test_beyond_grace_blocks_on_refresh(self):
+        self.kapi.cache_grace = 60
+        self.write_cache(age=200)
+        response = self.kapi.get_api_response('getdashboarddata')
+        assert response['remaining_api_calls']['hour_call_remaining'] == 42
+        assert self.kapi.refresh_thread is None
+
+
+class CompressedCacheTest(TempDirTestCase):
+    """gzip/zlib compressed cache files and mock inputs"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        with open('tests/json/getdashboarddata_list.json', 'rb') as infile:
+            self.plain = infile.read()
+
+    def write(self, name, data):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'wb') as outfile:
+            outfile.write(data)
+        return filename
+
+    def test_compression_of(self):
+        compression_of = keynoteapi.cache.compression_of
+        for compression in keynoteapi.cache.COMPRESSIONS:
+            assert compression_of(keynoteapi.cache.compress(
+                self.plain, compression)) == compression
+        assert compression_of(self.plain) is None
+        assert compression_of(b'<?xml') is None
+        assert compression_of(b'') is None
+        assert keynoteapi.cache.compress(self.plain, None) is self.plain
+        self.assertRaises(ValueError, keynoteapi.cache.compress, b'', 'bz2')
+
+    def test_decompressing_file(self):
+        data = self.plain * 20
+        filename = self.write('data', keynoteapi.cache.compress(data, 'zlib'))
+        infile = keynoteapi.cache.open_response(filename)
+        infile.chunk_size = 100
+        assert infile.read(10) == data[:10]
+        assert infile.tell() == 10
+        infile.seek(5000)
+        assert infile.read(10) == data[5000:5010]
+        assert infile.seek(3) == 3
+        assert infile.read() == data[3:]
+        assert infile.read() == b''
+        infile.close()
+
+    def test_plain_file_is_not_wrapped(self):
+        filename = self.write('data', self.plain)
+        with keynoteapi.cache.open_response(filename) as infile:
+            assert infile.read() == self.plain
+            assert not isinstance(infile, keynoteapi.cache.DecompressingFile)
+
+    def test_compressed_cache_round_trip(self):
+        for compression in keynoteapi.cache.COMPRESSIONS:
+            calls_filename = os.path.join(self.tmpdir, 'calls')
+            kapi = self.in_tmpdir(CountingKeynoteApi(calls_filename,
+                                                     delay=0),
+                                  compression + '_')
+            kapi.cache_compression = compression
+            kapi.memory_cache = None
+            response = kapi.get_api_response('getdashboarddata')
+            with open(kapi.cache_filename + 'getdashboarddata', 'rb') as raw:
+                assert keynoteapi.cache.compression_of(raw.read(2)) == \
+                    compression
+
+            # read back by an instance which writes plain files
+            reader = CountingKeynoteApi(calls_filename, delay=0)
+            reader.cache_filename = kapi.cache_filename
+            reader.memory_cache = None
+            assert reader.get_api_response('getdashboarddata') == response
+        with open(calls_filename) as calls:
+            assert len(calls.readlines()) == 2
+
+    def test_compressed_mockinput(self):
+        expected = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+        expected.set_mockinput('tests/json/getdashboarddata_list.json')
+        for compression in keynoteapi.cache.COMPRESSIONS:
+            kapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+            compressed = keynoteapi.cache.compress(self.plain, compression)
+            kapi.set_mockinput(self.write(compression, compressed))
+            assert [item['alias'] for item in kapi.iter_measurements()] == \
+                [item['alias'] for item in expected.iter_measurements()]
+            assert kapi.find_measurement('WPT_Ford') == \
+                expected.find_measurement('WPT_Ford')
+            assert kapi.get_dashboarddata() == expected.get_dashboarddata()
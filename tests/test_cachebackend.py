@@ -0,0 +1,223 @@
+"""
+    Testmodule for keynoteapi.cachebackend
+"""
+import json
+import os
+import time
+import keynoteapi.cachebackend
+import keynoteapi.keynoteapi
+from tests import TempDirTestCase, load
+
+RESPONSE = {'product': [], 'remaining_api_calls': {
+    'hour_call_remaining': 100, 'day_call_remaining': 1000}}
+
+
+class BackendContract(object):
+    """behaviour shared by all backends (mixed into a TempDirTestCase)"""
+    def setUp(self):
+        super(BackendContract, self).setUp()
+        self.backend = self.make_backend()
+
+    def test_missing(self):
+        assert self.backend.stat('getdashboarddata') is None
+        assert self.backend.get('getdashboarddata') is None
+        assert self.backend.age('getdashboarddata') == float('inf')
+
+    def test_set_get(self):
+        stat = self.backend.set('getdashboarddata', RESPONSE)
+        assert self.backend.stat('getdashboarddata') == stat
+        assert stat[2] > 0
+        assert self.backend.get('getdashboarddata') == RESPONSE
+        assert 0 <= self.backend.age('getdashboarddata') < 5
+
+    def test_load_store_json_size(self):
+        size = len(json.dumps(RESPONSE))
+        stat, stored = self.backend.store('getdashboarddata', RESPONSE)
+        assert stat == self.backend.stat('getdashboarddata')
+        assert stored == size
+        assert self.backend.load('getdashboarddata') == (RESPONSE, size)
+        assert self.backend.load('missing') == (None, 0)
+
+    def test_new_version_on_write(self):
+        first = self.backend.set('getdashboarddata', RESPONSE)
+        time.sleep(0.01)
+        second = self.backend.set('getdashboarddata', {'product': [1]})
+        assert first[0] != second[0]
+        assert self.backend.get('getdashboarddata') == {'product': [1]}
+
+    def test_keep_previous(self):
+        self.backend.set('getdashboarddata', RESPONSE)
+        self.backend.keep_previous('getdashboarddata')
+        self.backend.set('getdashboarddata', {'product': [1]})
+        assert self.backend.get('getdashboarddata.prev') == RESPONSE
+
+    def test_delete(self):
+        self.backend.set('getdashboarddata', RESPONSE)
+        self.backend.delete('getdashboarddata')
+        assert self.backend.get('getdashboarddata') is None
+        self.backend.delete('getdashboarddata')
+
+    def test_names_are_unique(self):
+        assert self.backend.name('a') != self.backend.name('b')
+
+
+class FileBackendTest(BackendContract, TempDirTestCase):
+    def make_backend(self):
+        return keynoteapi.cachebackend.FileBackend(
+            os.path.join(self.tmpdir, 'cache_'))
+
+    def test_classic_cache_files(self):
+        self.backend.set('getdashboarddata', RESPONSE)
+        with open(os.path.join(self.tmpdir, 'cache_getdashboarddata')) as f:
+            assert json.load(f) == RESPONSE
+
+
+class SqliteBackendTest(BackendContract, TempDirTestCase):
+    def make_backend(self):
+        return keynoteapi.cachebackend.SqliteBackend(
+            os.path.join(self.tmpdir, 'cache.sqlite'))
+
+    def tearDown(self):
+        self.backend.close()
+        TempDirTestCase.tearDown(self)
+
+    def test_evicts_oldest_writes(self):
+        self.backend.max_entries = 2
+        for key in ('a', 'b', 'c'):
+            self.backend.set(key, RESPONSE)
+            time.sleep(0.01)
+        assert self.backend.get('a') is None
+        assert self.backend.get('c') == RESPONSE
+
+    def test_evicts_by_size(self):
+        self.backend.max_bytes = 2 * len(json.dumps(RESPONSE))
+        for key in ('a', 'b', 'c'):
+            self.backend.set(key, RESPONSE)
+            time.sleep(0.01)
+        assert [self.backend.get(key) is not None
+                for key in ('a', 'b', 'c')] == [False, True, True]
+
+    def test_shared_by_processes(self):
+        self.backend.set('getdashboarddata', RESPONSE)
+        other = keynoteapi.cachebackend.SqliteBackend(self.backend.filename)
+        try:
+            assert other.get('getdashboarddata') == RESPONSE
+        finally:
+            other.close()
+
+
+class MemoryBackendTest(BackendContract, TempDirTestCase):
+    def make_backend(self):
+        return keynoteapi.cachebackend.MemoryBackend()
+
+    def test_lru_eviction(self):
+        self.backend.max_entries = 2
+        self.backend.set('a', RESPONSE)
+        self.backend.set('b', RESPONSE)
+        self.backend.get('a')
+        self.backend.set('c', RESPONSE)
+        assert sorted(self.backend.entries) == ['a', 'c']
+
+    def test_size_bound(self):
+        size = len(json.dumps(RESPONSE))
+        self.backend.max_bytes = 2 * size
+        for key in ('a', 'b', 'c'):
+            self.backend.set(key, RESPONSE)
+        assert len(self.backend) == 2
+        assert self.backend.size == 2 * size
+        # never stores what does not fit at all
+        self.backend.remember('huge', 1, RESPONSE, 0, 3 * size)
+        assert self.backend.get('huge') is None
+
+    def test_ttl(self):
+        self.backend.ttl = 0.05
+        self.backend.set('a', RESPONSE)
+        time.sleep(0.1)
+        assert self.backend.get('a') is None
+        assert len(self.backend) == 0
+
+    def test_lookup_needs_same_version(self):
+        self.backend.remember('a', 1, RESPONSE, time.time(), 10)
+        assert self.backend.lookup('a', 1) is RESPONSE
+        assert self.backend.lookup('a', 2) is None
+
+
+class KeynoteApiBackendTest(TempDirTestCase):
+    """KeynoteApi reading through the memory tier and other backends"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.memory_cache = keynoteapi.cachebackend.MemoryBackend()
+        self.calls = []
+
+    def api(self, cache_backend=None):
+        kapi = TempDirTestCase.api(self)
+        kapi.cache_backend = cache_backend
+        kapi.memory_cache = self.memory_cache
+
+        def fetch(api_cmd):
+            self.calls.append(api_cmd)
+            return load('tests/json/getdashboarddata_list.json')
+        kapi.fetch_api_response = fetch
+        return kapi
+
+    def test_new_instances_share_parsed_response(self):
+        first = self.api().get_dashboarddata()
+        kapi = self.api()
+        assert kapi.get_dashboarddata() is first
+        assert kapi.metrics.counters['cache_memory_hits'] == 1
+        assert kapi.get_remaining_api_calls() == [3596, 21596]
+        assert self.calls == ['getdashboarddata']
+
+    def test_rewritten_file_is_read_again(self):
+        first = self.api().get_dashboarddata()
+        keynoteapi.keynoteapi.KeynoteApi.write_json_response(
+            dict(first, product=[]),
+            os.path.join(self.tmpdir, 'cache_getdashboarddata'))
+        assert self.api().get_dashboarddata()['product'] == []
+
+    def test_memory_tier_sized_by_json(self):
+        kapi = self.api()
+        kapi.cache_compression = 'gzip'
+        response = kapi.get_dashboarddata()
+        kapi = self.api()
+        kapi.cache_compression = 'gzip'
+        self.memory_cache.clear()
+        assert kapi.get_dashboarddata() == response
+        # not the size of the compressed file
+        assert self.memory_cache.size == len(json.dumps(response))
+        assert os.path.getsize(os.path.join(
+            self.tmpdir, 'cache_getdashboarddata')) < self.memory_cache.size
+
+    def test_without_memory_tier(self):
+        self.api().get_dashboarddata()
+        kapi = self.api()
+        kapi.memory_cache = None
+        kapi.get_dashboarddata()
+        assert 'cache_memory_hits' not in kapi.metrics.counters
+
+    def test_sqlite_backend(self):
+        backend = keynoteapi.cachebackend.SqliteBackend(
+            os.path.join(self.tmpdir, 'cache.sqlite'))
+        try:
+            self.api(backend).get_dashboarddata()
+            kapi = self.api(backend)
+            kapi.memory_cache = None
+            assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == \
+                '28.465'
+            assert self.calls == ['getdashboarddata']
+            assert not os.path.exists(
+                os.path.join(self.tmpdir, 'cache_getdashboarddata'))
+            # namespaced by API key
+            assert backend.stat(kapi.cache_key('getdashboarddata'))
+            assert kapi.cache_key('getdashboarddata') != 'getdashboarddata'
+        finally:
+            backend.close()
+
+    def test_memory_backend_keeps_previous(self):
+        backend = keynoteapi.cachebackend.MemoryBackend()
+        kapi = self.api(backend)
+        kapi.cache_usage = False
+        kapi.get_api_response('getdashboarddata')
+        kapi.get_api_response('getdashboarddata')
+        assert self.api(backend).get_previous_snapshot() is not None
+        assert len(self.memory_cache) == 0
@@ -0,0 +1,169 @@
+"""
+    Testmodule for the multi slot mode of the check_keynote script
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+import unittest
+from tests import TempDirTestCase
+from tests.test_store import dashboarddata
+
+try:
+    import nagiosplugin
+except ImportError:
+    nagiosplugin = None
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'check_keynote')
+AVAIL = {'WPT_a': '100', 'WPT_b': '90', 'WPT_c': '-', 'other': '99'}
+
+
+def load_script():
+    """ check_keynote as module (it has no .py suffix) """
+    try:
+        from importlib.machinery import SourceFileLoader
+        from importlib.util import module_from_spec, spec_from_loader
+    except ImportError:
+        import imp
+        return imp.load_source('check_keynote', SCRIPT)
+    loader = SourceFileLoader('check_keynote', SCRIPT)
+    module = module_from_spec(spec_from_loader('check_keynote', loader))
+    loader.exec_module(module)
+    return module
+
+
+@unittest.skipIf(nagiosplugin is None, 'nagiosplugin is not installed')
+class CheckKeynoteTest(TempDirTestCase):
+    """several slots checked with one dashboard fetch"""
+    @classmethod
+    def setUpClass(cls):
+        cls.script = load_script()
+
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.mockinput = os.path.join(self.tmpdir, 'getdashboarddata.json')
+        with open(self.mockinput, 'w') as outfile:
+            json.dump(dashboarddata(AVAIL), outfile)
+
+    def keynote(self, measurement_slot):
+        keynote = self.script.Keynote('test-api-key', measurement_slot)
+        keynote.kapi.set_mockinput(self.mockinput)
+        keynote.timeranges = ['last_one_hour']
+        return keynote
+
+    def check(self, keynote, contexts):
+        check = nagiosplugin.Check(keynote)
+        check.add(*contexts)
+        check.add(nagiosplugin.ScalarContext('remaining_api_calls_hour'),
+                  nagiosplugin.ScalarContext('remaining_api_calls_day'),
+                  nagiosplugin.ScalarContext('slots_without_data', '0'),
+                  nagiosplugin.ScalarContext('script_runtime'),
+                  self.script.KeynoteSummary(
+                      keynote.resolve_slots() if keynote.multi_slot
+                      else keynote.measurement_slot, keynote.missing_slots))
+        check()
+        return check
+
+    def test_resolve_slots(self):
+        keynote = self.keynote(['WPT_*', 'other', 'missing'])
+        assert keynote.resolve_slots() == ['WPT_a', 'WPT_b', 'WPT_c',
+                                           'other']
+        assert keynote.missing_slots == ['missing']
+        keynote = self.keynote([])
+        assert keynote.resolve_slots() == ['WPT_a', 'WPT_b', 'WPT_c',
+                                           'other']
+        assert keynote.missing_slots == []
+
+    def test_probe(self):
+        keynote = self.keynote(['WPT_a', 'WPT_c', 'missing'])
+        metrics = dict((metric.name, metric) for metric in keynote.probe())
+        assert metrics['WPT_a_avail_1h'].value == 100.0
+        assert metrics['WPT_a_avail_1h'].context == \
+            'availability_last_one_hour'
+        assert metrics['WPT_a_response_1h'].value == 1.5
+        # WPT_c has no availability, missing does not exist
+        assert 'WPT_c_response_1h' in metrics
+        assert 'WPT_c_avail_1h' not in metrics
+        assert metrics['slots_checked'].value == 2
+        assert metrics['slots_without_data'].value == 2
+
+    def test_probe_without_any_data(self):
+        keynote = self.keynote(['WPT_c', 'missing'])
+        self.assertRaises(AttributeError, list, keynote.probe())
+        keynote = self.keynote(['nothing*'])
+        self.assertRaises(AttributeError, list, keynote.probe())
+
+    def test_per_slot_contexts(self):
+        keynote = self.keynote(['WPT_a', 'WPT_b'])
+        keynote.per_slot_contexts = True
+        assert keynote.context_name('WPT_a', 'availability_x') == \
+            'WPT_a_availability_x'
+        contexts = []
+        for slot, avail_warn in (('WPT_a', '95:'), ('WPT_b', '85:')):
+            contexts.extend(self.script.threshold_contexts(
+                avail_warn, '80:', '10', '20',
+                prefix=keynote.context_name(slot, '')))
+        check = self.check(keynote, contexts)
+        assert check.state == nagiosplugin.Ok
+        assert check.summary_str == '2 slots'
+
+    def test_combined_state(self):
+        keynote = self.keynote(['WPT_*', 'other'])
+        contexts = self.script.threshold_contexts('95:', '80:', '10', '20')
+        check = self.check(keynote, contexts)
+        # WPT_b is below the warning level, WPT_c without data
+        assert check.state == nagiosplugin.Warn
+        assert check.summary_str == '4 slots, warning: WPT_b'
+
+        contexts = self.script.threshold_contexts('95:', '92:', '10', '20')
+        check = self.check(self.keynote(['WPT_*', 'other']), contexts)
+        assert check.state == nagiosplugin.Critical
+        assert check.summary_str == '4 slots, critical: WPT_b'
+
+    def test_missing_slot_fails(self):
+        keynote = self.keynote(['WPT_a', 'missing'])
+        contexts = self.script.threshold_contexts('95:', '80:', '10', '20')
+        check = self.check(keynote, contexts)
+        assert check.state == nagiosplugin.Warn
+        assert check.summary_str == '1 slots, warning: missing'
+
+    def expired_cache_keynote(self, measurement_slot):
+        """the API is down and the cached response has expired"""
+        keynote = self.script.Keynote('test-api-key', measurement_slot)
+        keynote.timeranges = ['last_one_hour']
+        self.in_tmpdir(keynote.kapi)
+        keynote.kapi.api_base = 'http://127.0.0.1:1/keynote/api'
+        keynote.kapi.api_retries = 0
+        filename = keynote.kapi.cache_filename + 'getdashboarddata'
+        keynote.kapi.write_json_response(dashboarddata(AVAIL), filename)
+        old = time.time() - 3600
+        os.utime(filename, (old, old))
+        return keynote
+
+    def test_api_error_single_slot(self):
+        keynote = self.expired_cache_keynote('WPT_a')
+        contexts = self.script.threshold_contexts('95:', '80:', '10', '20')
+        check = self.check(keynote, contexts +
+                           [self.script.ApiErrorContext()])
+        assert check.state == nagiosplugin.Warn
+        assert check.summary_str.startswith(
+            'WPT_a, API call failed, using the expired cache: ')
+
+    def test_api_error_multi_slot(self):
+        keynote = self.expired_cache_keynote(['WPT_a', 'other'])
+        contexts = self.script.threshold_contexts('95:', '80:', '10', '20')
+        check = self.check(keynote, contexts +
+                           [self.script.ApiErrorContext()])
+        assert check.state == nagiosplugin.Warn
+        assert check.summary_str.startswith(
+            '2 slots, API call failed, using the expired cache: ')
+
+    def test_all_slots_excludes_measurement_slot(self):
+        process = subprocess.Popen(
+            [sys.executable, SCRIPT, '-k', 'test-api-key', '-m', 'WPT_a',
+             '--all-slots'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stderr = process.communicate()[1].decode('utf-8')
+        assert process.returncode == 2
+        assert 'not allowed with argument' in stderr
@@ -0,0 +1,129 @@
+"""
+    Testmodule for keynoteapi.client
+"""
+import io
+import json
+import socket
+import unittest
+import zlib
+import keynoteapi.client
+import keynoteapi.keynoteapi
+from tests.stub_server import FaultyServer, StubServer
+
+RESPONSE = json.dumps({'remaining_api_calls': {
+    'hour_call_remaining': 100, 'day_call_remaining': 1000}}).encode('utf-8')
+
+
+class HttpClientTest(unittest.TestCase):
+    """keep-alive client against a local stand-in server"""
+    def test_decode_body_gzip(self):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        body = compressor.compress(b'data') + compressor.flush()
+        assert keynoteapi.client.decode_body(body, 'gzip') == b'data'
+        assert keynoteapi.client.decode_body(b'data', None) == b'data'
+
+    def test_get_gzip(self):
+        with StubServer(RESPONSE) as server:
+            client = keynoteapi.client.HttpClient()
+            status, body = client.get(server.api_base + '/test?format=json')
+            client.close()
+        assert status == 200
+        assert body == RESPONSE
+        assert server.requests == ['/keynote/api/test?format=json']
+
+    def test_connection_reuse(self):
+        with StubServer(RESPONSE) as server:
+            client = keynoteapi.client.HttpClient()
+            for _ in range(5):
+                assert client.get(server.api_base + '/test')[1] == RESPONSE
+            client.close()
+        assert len(server.requests) == 5
+        assert server.connections == 1
+
+    def test_stale_pooled_connection_is_replaced(self):
+        with StubServer(RESPONSE) as server:
+            client = keynoteapi.client.HttpClient()
+            client.get(server.api_base + '/test')
+            for idle in client.pool.values():
+                for connection in idle:
+                    connection.sock.close()
+            assert client.get(server.api_base + '/test')[1] == RESPONSE
+            client.close()
+        assert server.connections == 2
+
+    def test_slow_answer_on_reused_connection_is_not_resent(self):
+        with FaultyServer(RESPONSE, [None, ('delay', 2)]) as server:
+            client = keynoteapi.client.HttpClient(read_timeout=0.3)
+            client.get(server.api_base + '/test')
+            self.assertRaises(socket.timeout, client.get,
+                              server.api_base + '/test')
+            assert len(server.requests) == 2
+            assert 'connections_stale' not in client.metrics.counters
+            # the timed out connection is closed, not pooled
+            assert client.pool[('http', '127.0.0.1',
+                                server.server_address[1])] == []
+
+    def test_broken_body_closes_connection(self):
+        with StubServer(RESPONSE, use_gzip=False) as server:
+            server.bogus_encoding = 'gzip'
+            client = keynoteapi.client.HttpClient()
+            opened = []
+            new_connection = client._new_connection
+
+            def record(*args, **kwargs):
+                opened.append(new_connection(*args, **kwargs))
+                return opened[-1]
+            client._new_connection = record
+            self.assertRaises(zlib.error, client.get,
+                              server.api_base + '/test')
+            assert client.pool == {}
+            assert opened[0].sock is None
+            server.bogus_encoding = None
+            assert client.get(server.api_base + '/test')[1] == RESPONSE
+            client.close()
+        assert server.connections == 2
+
+    def test_keynoteapi_uses_one_client(self):
+        with StubServer(RESPONSE) as server:
+            kapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+            kapi.api_base = server.api_base
+            first = kapi.fetch_api_response('getdashboarddata')
+            second = kapi.fetch_api_response('getdashboarddata')
+            kapi.get_http_client().close()
+        assert first == second == json.loads(RESPONSE.decode('utf-8'))
+        assert server.connections == 1
+        assert server.requests[0] == '/keynote/api/getdashboarddata' \
+            '?api_key=test-api-key&format=json'
+
+    def test_keynoteapi_http_error(self):
+        with StubServer(RESPONSE) as server:
+            server.respond = lambda handler: (500, b'error')
+            kapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+            kapi.api_base = server.api_base
+            self.assertRaises(Exception, kapi.fetch_api_response,
+                              'getdashboarddata')
+
+    def test_read_decoded_in_chunks(self):
+        data = RESPONSE * 1000
+        compressor = zlib.compressobj()
+        body = io.BytesIO(compressor.compress(data) + compressor.flush())
+        sizes = []
+
+        def read(size):
+            sizes.append(size)
+            return body.read(size)
+        received, decoded = keynoteapi.client.read_decoded(read, 'deflate',
+                                                           1024)
+        assert decoded == data
+        assert received == len(body.getvalue())
+        assert len(sizes) > 1 and set(sizes) == set([1024])
+
+    def test_get_counts_wire_and_decoded_bytes(self):
+        data = RESPONSE * 10000
+        with StubServer(data) as server:
+            client = keynoteapi.client.HttpClient()
+            assert client.get(server.api_base + '/test')[1] == data
+            client.close()
+        counters = client.metrics.counters
+        assert counters['bytes_decoded'] == len(data)
+        assert 0 < counters['bytes_received'] < len(data) / 10
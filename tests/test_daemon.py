@@ -0,0 +1,148 @@
+"""
+    Testmodule for keynoteapi.daemon
+"""
+import os
+import keynoteapi.daemon
+import keynoteapi.keynoteapi
+from tests import TempDirTestCase
+
+
+class DaemonTest(TempDirTestCase):
+    """serve the list fixture from a daemon on a temporary socket"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.socket_path = os.path.join(self.tmpdir, 'keynoted.sock')
+        kapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+        kapi.set_mockinput('tests/json/getdashboarddata_list.json')
+        self.daemon = keynoteapi.daemon.KeynoteDaemon(kapi, self.socket_path)
+        self.daemon.start()
+
+    def tearDown(self):
+        self.daemon.stop()
+        TempDirTestCase.tearDown(self)
+
+    def api(self, api_key='test-api-key'):
+        kapi = TempDirTestCase.api(self, api_key)
+        kapi.daemon_socket = self.socket_path
+        return kapi
+
+    def test_ping(self):
+        client = keynoteapi.daemon.DaemonClient(self.socket_path)
+        assert client.request('ping') == {'pong': True}
+
+    def test_client_get_data(self):
+        client = keynoteapi.daemon.DaemonClient(self.socket_path,
+                                                'test-api-key')
+        data, remaining = client.get_data('WPT_Ford', 'avail_data')
+        assert data['last_one_hour'] == '98.193'
+        assert remaining == [3596, 21596]
+
+    def test_other_api_key_is_refused(self):
+        client = keynoteapi.daemon.DaemonClient(self.socket_path, 'other')
+        self.assertRaises(keynoteapi.daemon.DaemonUnavailable,
+                          client.get_measurement_slots)
+
+    def test_invalid_request(self):
+        client = keynoteapi.daemon.DaemonClient(self.socket_path,
+                                                'test-api-key')
+        self.assertRaises(keynoteapi.daemon.DaemonUnavailable,
+                          client.request, 'data', data_type='unknown')
+
+    def test_keynoteapi_uses_daemon(self):
+        kapi = self.api()
+        assert kapi.get_measurement_slots() == {'WPT_Ford': '687588'}
+        assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == '28.465'
+        assert kapi.get_avail_data('invalid product') == {}
+        assert kapi.get_remaining_api_calls() == [3596, 21596]
+        assert kapi.dashboarddata is None
+
+    def test_one_request_per_slot(self):
+        kapi = self.api()
+        for _ in range(4):
+            assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == \
+                '28.465'
+            assert kapi.get_avail_data('WPT_Ford')['last_one_hour'] == \
+                '98.193'
+        assert kapi.metrics.counters['daemon_answers'] == 1
+
+    def test_prefetch_slots(self):
+        kapi = self.api()
+        kapi.prefetch_slots(['WPT_Ford', 'invalid product'])
+        assert kapi.get_threshold_data('WPT_Ford')['availwarning'] == '-1.0'
+        assert kapi.get_avail_data('invalid product') == {}
+        assert kapi.metrics.counters['daemon_answers'] == 1
+        # asked again once the records are older than the cache TTL
+        kapi._daemon_records = (0, kapi._daemon_records[1])
+        assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == '28.465'
+        assert kapi.metrics.counters['daemon_answers'] == 2
+
+    def test_keynoteapi_compact_values(self):
+        kapi = self.api()
+        kapi.compact = True
+        assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == 28.465
+
+    def test_keynoteapi_falls_back_without_daemon(self):
+        self.daemon.stop()
+        # stale socket file, nobody listening
+        open(self.socket_path, 'w').close()
+        kapi = self.api()
+        kapi.fetch_api_response = lambda api_cmd: {'product': []}
+        assert kapi.get_perf_data('WPT_Ford') == {}
+        assert kapi.daemon_socket is None
+        assert kapi.dashboarddata == {'product': []}
+
+    def test_keynoteapi_falls_back_for_other_key(self):
+        kapi = self.api('other-api-key')
+        kapi.fetch_api_response = lambda api_cmd: {'product': []}
+        assert kapi.get_perf_data('WPT_Ford') == {}
+        assert kapi.daemon_socket is None
+        assert kapi.dashboarddata == {'product': []}
+
+    def test_keynoteapi_measurements_from_daemon(self):
+        kapi = self.api()
+        measurements = list(kapi.iter_measurements())
+        assert [measurement['alias'] for measurement in measurements] == \
+            ['WPT_Ford']
+        assert kapi.metrics.counters['daemon_answers'] == 1
+        assert kapi.dashboarddata is None
+        assert not os.path.exists(kapi.cache_filename + 'getdashboarddata')
+
+    def test_keynoteapi_select_slots_from_daemon(self):
+        kapi = self.api()
+        assert kapi.select_slots('avail_data', 'last_one_hour',
+                                 below=99) == [
+                                     ('WPT_Ford', 'TxP', 98.193, 'percent')]
+        assert kapi.select_slots('avail_data', 'last_one_hour',
+                                 above=99) == []
+        assert kapi.metrics.counters['daemon_answers'] == 2
+        assert kapi.dashboarddata is None
+
+    def test_keynotecli_uses_daemon(self):
+        import keynoteapi.keynotecli
+        from tests.test_export import CountingFile
+        keycli = keynoteapi.keynotecli.KeynoteCli('test-api-key')
+        self.in_tmpdir(keycli.kapi)
+        keycli.kapi.daemon_socket = self.socket_path
+        outfile = CountingFile()
+        assert keycli.query('avail:last_one_hour<99', outfile=outfile) == 1
+        assert outfile.getvalue().startswith('WPT_Ford\t98.193')
+        keycli.export(CountingFile(), 'jsonl')
+        assert keycli.kapi.metrics.counters['daemon_answers'] == 2
+        assert keycli.kapi.dashboarddata is None
+
+    def test_changes(self):
+        client = keynoteapi.daemon.DaemonClient(self.socket_path,
+                                                'test-api-key')
+        events, sequence, truncated = client.get_changes()
+        assert events == [{'event': 'slot_added', 'alias': 'WPT_Ford',
+                           'seq': 1}]
+        assert (sequence, truncated) == (1, False)
+        # unchanged response
+        self.daemon.refresh()
+        assert client.get_changes(sequence) == ([], 1, False)
+
+        self.daemon.kapi.set_mockinput('tests/json/empty.json')
+        self.daemon.refresh()
+        events, sequence, truncated = client.get_changes(1)
+        assert [event['event'] for event in events] == ['slot_removed']
+        assert sequence == 2
@@ -0,0 +1,117 @@
+"""
+    Testmodule for keynoteapi.diff
+"""
+import copy
+import json
+import os
+import unittest
+import keynoteapi.diff
+from keynoteapi.snapshot import Snapshot
+from tests import TempDirTestCase, load
+
+
+def load_list():
+    return load('tests/json/getdashboarddata_list.json')
+
+
+def set_value(dashboarddata, alias, data_type, name, value):
+    for product in dashboarddata['product']:
+        for measurement in product['measurement']:
+            if measurement['alias'] != alias:
+                continue
+            for cell in measurement[data_type]:
+                if cell['name'] == name:
+                    cell['value'] = value
+
+
+def changed_list():
+    """ list fixture with one perf value and one threshold changed """
+    data = load_list()
+    set_value(data, 'WPT_Ford', 'perf_data', 'last_five_minute', '17.5')
+    set_value(data, 'WPT_Ford', 'threshold_data', 'perfwarning', '20')
+    return data
+
+
+class DiffTest(unittest.TestCase):
+    """diff snapshots of the list fixture"""
+    def test_identical(self):
+        diff = keynoteapi.diff.diff_snapshots(Snapshot(load_list()),
+                                              Snapshot(load_list()))
+        assert not diff
+        assert list(diff.events()) == []
+
+    def test_missing_values_are_equal(self):
+        data = load_list()
+        set_value(data, 'WPT_Ford', 'perf_data', 'last_one_hour', '-')
+        diff = keynoteapi.diff.diff_snapshots(Snapshot(data),
+                                              Snapshot(copy.deepcopy(data)))
+        assert not diff
+
+    def test_changed_values(self):
+        diff = keynoteapi.diff.diff_snapshots(Snapshot(load_list()),
+                                              Snapshot(changed_list()))
+        assert diff.changed_aliases() == ['WPT_Ford']
+        assert diff.timeranges('WPT_Ford', 'perf_data') == \
+            ['last_five_minute']
+        assert diff.timeranges('WPT_Ford', 'avail_data') == []
+        assert diff.thresholds() == {'WPT_Ford': {'perfwarning': (-1.0,
+                                                                  20.0)}}
+
+    def test_added_and_removed_slots(self):
+        old = load_list()
+        new = load_list()
+        new['product'][0]['measurement'][0]['alias'] = 'WPT_Other'
+        diff = keynoteapi.diff.diff_snapshots(Snapshot(old), Snapshot(new))
+        assert diff.added == ['WPT_Other']
+        assert diff.removed == ['WPT_Ford']
+        assert diff.changed == {}
+        diff = keynoteapi.diff.diff_snapshots(None, Snapshot(old))
+        assert diff.added == ['WPT_Ford']
+
+    def test_events(self):
+        data = changed_list()
+        set_value(data, 'WPT_Ford', 'avail_data', 'last_one_hour', '-')
+        events = list(keynoteapi.diff.diff_snapshots(
+            Snapshot(load_list()), Snapshot(data)).events())
+        assert events == [
+            {'event': 'value_changed', 'alias': 'WPT_Ford',
+             'data_type': 'perf_data', 'name': 'last_five_minute',
+             'old': 16.726, 'new': 17.5},
+            {'event': 'value_changed', 'alias': 'WPT_Ford',
+             'data_type': 'avail_data', 'name': 'last_one_hour',
+             'old': 98.193, 'new': None},
+            {'event': 'threshold_moved', 'alias': 'WPT_Ford',
+             'data_type': 'threshold_data', 'name': 'perfwarning',
+             'old': -1.0, 'new': 20.0},
+        ]
+        # valid JSON without NaN
+        json.dumps(events, allow_nan=False)
+
+
+class KeynoteApiDiffTest(TempDirTestCase):
+    """previous snapshots of KeynoteApi"""
+    def test_in_memory_previous_snapshot(self):
+        kapi = self.api()
+        kapi.dashboarddata = load_list()
+        assert kapi.get_snapshot_diff().added == ['WPT_Ford']
+        kapi.dashboarddata = changed_list()
+        diff = kapi.get_snapshot_diff()
+        assert diff.added == []
+        assert diff.changed_aliases() == ['WPT_Ford']
+
+    def test_previous_response_file(self):
+        responses = [load_list(), changed_list()]
+        kapi = self.api()
+        kapi.cache_usage = False
+        kapi.fetch_api_response = lambda api_cmd: responses.pop(0)
+        kapi.get_api_response('getdashboarddata')
+        kapi.get_api_response('getdashboarddata')
+        filename = kapi.cache_filename + 'getdashboarddata'
+        assert os.path.exists(filename + '.prev')
+
+        # a new process compares the cache with the kept response
+        kapi = self.api()
+        kapi.cache_maxage = 3600
+        events = list(kapi.iter_changes())
+        assert [event['name'] for event in events] == \
+            ['last_five_minute', 'perfwarning']
@@ -0,0 +1,128 @@
+"""
+    Testmodule for keynoteapi.export
+"""
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import keynoteapi.export
+import keynoteapi.keynotecli
+from tests import write_large_dashboard
+from tests.test_streaming import peak_memory, tracemalloc
+
+
+class CountingFile(object):
+    """ outfile remembering every write """
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+    def getvalue(self):
+        return ''.join(self.writes)
+
+
+class NullFile(object):
+    def write(self, data):
+        pass
+
+
+def export(mockinput, export_format, patterns=None):
+    kcli = keynoteapi.keynotecli.KeynoteCli('test-api-key',
+                                            mockinput=mockinput)
+    outfile = CountingFile()
+    rows = kcli.export(outfile, export_format, patterns)
+    return rows, outfile.getvalue()
+
+
+class ExportTest(unittest.TestCase):
+    """export the fixtures"""
+    def test_csv(self):
+        rows, output = export('tests/json/getdashboarddata_list.json', 'csv')
+        lines = list(csv.reader(io.StringIO(u'' + output)))
+        assert rows == 12
+        assert lines[0] == list(keynoteapi.export.COLUMNS)
+        assert lines[3] == ['WPT_Ford', '', '687588', 'perf_data',
+                            'last_one_hour', '28.465', 'seconds']
+
+    def test_csv_quotes_grid_agents(self):
+        rows, output = export('tests/json/getdashboarddata_grid.json', 'csv')
+        lines = list(csv.reader(io.StringIO(u'' + output)))
+        assert rows == 6 * 12
+        assert 'ANS, Digex, Cable & Wireless, UUNET' in \
+            [line[1] for line in lines]
+
+    def test_jsonl(self):
+        rows, output = export('tests/json/getdashboarddata_list.json',
+                              'jsonl')
+        records = [json.loads(line) for line in output.splitlines()]
+        assert len(records) == rows == 12
+        assert records[2] == {'slot': 'WPT_Ford', 'agent': None,
+                              'id': '687588', 'data_type': 'perf_data',
+                              'name': 'last_one_hour', 'value': 28.465,
+                              'unit': 'seconds'}
+
+    def test_columnar_round_trip(self):
+        rows, output = export('tests/json/getdashboarddata_grid.json',
+                              'columnar')
+        decoded = list(keynoteapi.export.read_columnar(
+            io.StringIO(u'' + output)))
+        assert len(decoded) == rows
+        assert decoded[0] == ('WPT_Ford', 'USA - GA', '1', 'perf_data',
+                              'last_one_hour', 17.583, 'seconds')
+
+    def test_filter(self):
+        assert export('tests/json/getdashboarddata_list.json', 'csv',
+                      ['WPT_*'])[0] == 12
+        assert export('tests/json/getdashboarddata_list.json', 'csv',
+                      ['Other', 'WPT_F?rd'])[0] == 12
+        rows, output = export('tests/json/getdashboarddata_list.json',
+                              'jsonl', ['Other'])
+        assert (rows, output) == (0, '')
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, export,
+                          'tests/json/getdashboarddata_list.json', 'xls')
+
+
+class ExportStreamingTest(unittest.TestCase):
+    """large exports are written incrementally"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp(prefix='keynoteapi-test-')
+        cls.small = os.path.join(cls.tmpdir, 'small.json')
+        cls.large = os.path.join(cls.tmpdir, 'large.json')
+        write_large_dashboard(cls.small, 500)
+        write_large_dashboard(cls.large, 5000)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def test_buffered_writes(self):
+        kcli = keynoteapi.keynotecli.KeynoteCli('test-api-key',
+                                                mockinput=self.small)
+        outfile = CountingFile()
+        rows = kcli.export(outfile, 'csv')
+        # 4 response times, availabilities and thresholds per slot
+        assert rows == 6000
+        # far fewer writes than rows, none much larger than the buffer
+        assert 1 < len(outfile.writes) < 100
+        assert max(len(chunk) for chunk in outfile.writes) < 2 * 65536
+        assert kcli.kapi.dashboarddata is None
+
+    @unittest.skipIf(tracemalloc is None, 'needs tracemalloc')
+    def test_constant_peak_memory(self):
+        def run(filename, export_format):
+            kcli = keynoteapi.keynotecli.KeynoteCli('test-api-key',
+                                                    mockinput=filename)
+            kcli.export(NullFile(), export_format)
+
+        for export_format in ('csv', 'jsonl'):
+            small = peak_memory(run, self.small, export_format)
+            large = peak_memory(run, self.large, export_format)
+            assert large < 1.5 * small, (export_format, small, large)
@@ -0,0 +1,207 @@
+"""
+    Testmodule for keynoteapi.history and KeynoteApi.get_history
+"""
+import os
+import threading
+import time
+import unittest
+import keynoteapi.cache
+import keynoteapi.history
+import keynoteapi.keynoteapi
+from tests import TempDirTestCase
+
+
+def dashboarddata(value, alias='WPT_Ford'):
+    return {'product': [{'id': 'prod', 'measurement': [{
+        'alias': alias, 'id': '1',
+        'perf_data': [{'name': 'last_five_minute', 'value': value},
+                      {'name': 'last_one_hour', 'value': '-'}],
+        'avail_data': [{'name': 'last_five_minute', 'value': '100'}],
+        'threshold_data': [{'name': 'perfwarning', 'value': '1'}]}]}]}
+
+
+class RingFileTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.filename = os.path.join(self.tmpdir, 'ring')
+
+    def test_fixed_size(self):
+        ring = keynoteapi.history.RingFile(self.filename, 60, 10)
+        ring.append(60, 1.0)
+        size = os.path.getsize(self.filename)
+        assert size == keynoteapi.history.HEADER.size + \
+            10 * keynoteapi.history.RECORD.size
+        for num in range(30):
+            ring.append(120 + num * 60, float(num))
+        assert os.path.getsize(self.filename) == size
+
+    def test_wraps_around(self):
+        ring = keynoteapi.history.RingFile(self.filename, 60, 3)
+        for num in range(5):
+            ring.append(num * 60, float(num))
+        assert [record[0] for record in ring.records()] == [120, 180, 240]
+        assert [record[2] for record in ring.records()] == [2.0, 3.0, 4.0]
+
+    def test_downsampling(self):
+        ring = keynoteapi.history.RingFile(self.filename, 3600, 3)
+        ring.append(3600, 1.0)
+        ring.append(3700, 2.0)
+        ring.append(7199, 6.0)
+        ring.append(7200, 5.0)
+        assert ring.records() == [(3600, 3, 3.0), (7200, 1, 5.0)]
+
+    def test_drops_out_of_order_samples(self):
+        ring = keynoteapi.history.RingFile(self.filename, 60, 3)
+        assert ring.append(120, 1.0)
+        assert not ring.append(60, 2.0)
+        assert ring.records() == [(120, 1, 1.0)]
+
+    def test_time_window(self):
+        ring = keynoteapi.history.RingFile(self.filename, 60, 10)
+        for num in range(10):
+            ring.append(num * 60, float(num))
+        assert [record[0] for record in ring.records(150, 300)] == \
+            [120, 180, 240, 300]
+
+    def test_resize_keeps_newest(self):
+        ring = keynoteapi.history.RingFile(self.filename, 60, 5)
+        for num in range(5):
+            ring.append(num * 60, float(num))
+        ring = keynoteapi.history.RingFile(self.filename, 60, 2)
+        ring.append(300, 5.0)
+        assert [record[2] for record in ring.records()] == [4.0, 5.0]
+
+    def test_corrupt_file(self):
+        with open(self.filename, 'wb') as outfile:
+            outfile.write(b'garbage')
+        ring = keynoteapi.history.RingFile(self.filename, 60, 5)
+        self.assertRaises(keynoteapi.history.HistoryError, ring.records)
+
+
+class HistoryStoreTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.store = keynoteapi.history.HistoryStore(
+            os.path.join(self.tmpdir, 'history'),
+            archives=((60, 600), (3600, 86400)))
+
+    def test_quote(self):
+        for alias in (u'WPT_Ford', u'../etc', u'a b/c', u'M\xfcnchen'):
+            quoted = keynoteapi.history.quote(alias)
+            assert '/' not in quoted and '.' not in quoted
+            assert keynoteapi.history.unquote(quoted) == alias
+
+    def test_append_and_query(self):
+        for num in range(3):
+            self.store.append(dashboarddata(str(num)), timestamp=60 * num)
+        assert self.store.slots() == ['WPT_Ford']
+        assert self.store.names('WPT_Ford', 'perf_data') == \
+            ['last_five_minute']
+        assert self.store.query('WPT_Ford', 'perf_data', 'last_five_minute',
+                                step=60) == [(0, 0.0), (60, 1.0), (120, 2.0)]
+        assert self.store.query('WPT_Ford', 'perf_data', 'last_five_minute',
+                                step=3600) == [(0, 1.0)]
+        assert self.store.names('WPT_Ford', 'threshold_data') == []
+
+    def test_append_is_serialized(self):
+        lock = keynoteapi.cache.CacheLock(self.store.directory)
+        lock.acquire()
+        writer = threading.Thread(target=self.store.append,
+                                  args=(dashboarddata('1.5'), 60))
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+        lock.release()
+        writer.join(5)
+        assert self.store.query('WPT_Ford', 'perf_data', 'last_five_minute',
+                                step=60) == [(60, 1.5)]
+
+    def test_archive_for(self):
+        assert self.store.archive_for(start=900, now=1000) == (60, 600)
+        assert self.store.archive_for(start=0, now=1000) == (3600, 86400)
+        assert self.store.archive_for(step=120) == (3600, 86400)
+        assert self.store.archive_for() == (60, 600)
+
+
+class KeynoteApiHistoryTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.kapi = self.api()
+        self.kapi.history_dir = os.path.join(self.tmpdir, 'history')
+
+    def test_disabled(self):
+        self.kapi.history_dir = None
+        self.kapi.write_cache(dashboarddata('1.5'),
+                              self.kapi.cache_filename + 'getdashboarddata')
+        assert self.kapi.get_history('WPT_Ford') == {}
+        assert not os.path.exists(os.path.join(self.tmpdir, 'history'))
+
+    def test_recorded_on_write_cache(self):
+        self.kapi.fetch_api_response = lambda api_cmd: dashboarddata('1.5')
+        self.kapi.get_api_response('getdashboarddata')
+        history = self.kapi.get_history('WPT_Ford')
+        assert list(history.keys()) == ['last_five_minute']
+        assert history['last_five_minute'][0][1] == 1.5
+        assert self.kapi.get_history('WPT_Ford', 'avail_data',
+                                     'last_five_minute')[0][1] == 100.0
+
+    def test_recorded_after_releasing_the_cache_lock(self):
+        cache_lock = keynoteapi.cache.CacheLock(
+            self.kapi.cache_filename + 'getdashboarddata')
+        history_lock = keynoteapi.cache.CacheLock(self.kapi.history_dir)
+        store = self.kapi.get_history_store()
+        append = store.append
+        held = []
+
+        def checked_append(*args):
+            # each acquire fails while another instance holds the lock
+            held.append((not cache_lock.acquire(blocking=False),
+                         not history_lock.acquire(blocking=False)))
+            cache_lock.release()
+            history_lock.release()
+            return append(*args)
+        store.append = checked_append
+        self.kapi.fetch_api_response = lambda api_cmd: dashboarddata('1.5')
+        self.kapi.get_api_response('getdashboarddata')
+        assert held == [(False, False)]
+        assert self.kapi.get_history('WPT_Ford')['last_five_minute']
+        assert self.kapi.metrics.timings['history'][0] == 1
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_recorded_in_detached_child(self):
+        store = self.kapi.get_history_store()
+        append = store.append
+
+        def slow_append(*args):
+            time.sleep(1)
+            return append(*args)
+        store.append = slow_append
+        self.kapi.refresh_detached = True
+        self.kapi.fetch_api_response = lambda api_cmd: dashboarddata('1.5')
+        start = time.time()
+        self.kapi.get_api_response('getdashboarddata')
+        assert time.time() - start < 0.5
+        assert 'history' not in self.kapi.metrics.timings
+        for _ in range(100):
+            if self.kapi.get_history('WPT_Ford'):
+                break
+            time.sleep(0.1)
+        else:
+            assert False, 'history not recorded'
+        # wait for the child to release the history lock
+        history_lock = keynoteapi.cache.CacheLock(self.kapi.history_dir)
+        assert history_lock.acquire(timeout=5)
+        history_lock.release()
+
+    def test_query_needs_no_api(self):
+        self.kapi.write_cache(dashboarddata('1.5'),
+                              self.kapi.cache_filename + 'getdashboarddata')
+
+        def fetch(api_cmd):
+            raise AssertionError('history queries must not call the API')
+        kapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+        kapi.history_dir = self.kapi.history_dir
+        kapi.fetch_api_response = fetch
+        assert kapi.get_history('WPT_Ford', name='last_five_minute',
+                                start=0)[0][1] == 1.5
+        assert kapi.get_history('unknown', name='last_five_minute') == []
@@ -435,3 +435,31 @@ class KeynoteapiTest(unittest.TestCase):
                                                 })
         assert kapi.proxies is not None
         assert kapi.proxies['https'] == test_proxy
+
+    def test_slot_index_built_once_per_snapshot(self):
+        """ the alias index is reused until dashboarddata changes """
+        self.keyapi.set_mockinput('tests/json/getdashboarddata_list.json')
+        index = self.keyapi.get_slot_index()
+        assert 'WPT_Ford' in index
+        assert self.keyapi.get_slot_index() is index
+
+    def test_slot_index_rebuilt_on_new_snapshot(self):
+        """ replacing dashboarddata invalidates the alias index """
+        self.keyapi.set_mockinput('tests/json/getdashboarddata_list.json')
+        index = self.keyapi.get_slot_index()
+        self.keyapi.dashboarddata = {'product': [{'measurement': [
+            {'alias': 'other', 'id': '1', 'avail_data': [
+                {'name': 'last_one_hour', 'value': '50'}]}]}]}
+        assert self.keyapi.get_slot_index() is not index
+        assert self.keyapi.get_avail_data('other') == {'last_one_hour': '50'}
+        assert self.keyapi.get_avail_data('WPT_Ford') == {}
+
+    def test_slot_index_merges_duplicate_aliases(self):
+        """ aliases in several products are merged like before """
+        self.keyapi.dashboarddata = {'product': [
+            {'measurement': [{'alias': 'dup', 'id': '1', 'perf_data': [
+                {'name': 'a', 'value': '1'}, {'name': 'b', 'value': '2'}]}]},
+            {'measurement': [{'alias': 'dup', 'id': '2', 'perf_data': [
+                {'name': 'b', 'value': '3'}]}]}]}
+        assert self.keyapi.get_perf_data('dup') == {'a': '1', 'b': '3'}
+        assert self.keyapi.get_measurement_slots() == {'dup': '2'}
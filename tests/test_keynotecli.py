@@ -1,9 +1,15 @@
 """
     Testmodule for keynotcli
 """
+import os
+import subprocess
+import sys
 import unittest
 import keynoteapi.keynotecli
 
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'keynoteCli')
+
 
 class KeynotecliTest(unittest.TestCase):
     """create a keynotecli object"""
@@ -40,3 +46,13 @@ class KeynotecliTest(unittest.TestCase):
             assert "    - performance critical: -1.0" in output
         finally:
             sys.stdout = saved_stdout
+
+    def test_invalid_sort_key(self):
+        """ an unknown --sort key is a usage error """
+        process = subprocess.Popen(
+            [sys.executable, SCRIPT, '-k', 'test-api-key', '-l', '--sort',
+             'bogus:last_one_hour'], stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE)
+        stderr = process.communicate()[1].decode('utf-8')
+        assert process.returncode == 2
+        assert 'invalid sort key bogus:last_one_hour' in stderr
@@ -0,0 +1,129 @@
+"""
+    Testmodule for keynoteapi.metrics and the instrumentation of KeynoteApi
+"""
+import json
+import os
+import threading
+import time
+import unittest
+import keynoteapi.metrics
+from tests import TempDirTestCase
+from tests.stub_server import StubServer
+
+RESPONSE = json.dumps({'remaining_api_calls': {
+    'hour_call_remaining': 100, 'day_call_remaining': 1000}}).encode('utf-8')
+
+
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        self.metrics = keynoteapi.metrics.Metrics()
+
+    def test_count_gauge_observe(self):
+        self.metrics.count('cache_hits')
+        self.metrics.count('cache_hits')
+        self.metrics.count('bytes_received', 100)
+        self.metrics.gauge('api_remaining_hour', 42)
+        self.metrics.observe('fetch', 0.5)
+        self.metrics.observe('fetch', 0.25)
+        assert self.metrics.counters == {'cache_hits': 2,
+                                         'bytes_received': 100}
+        assert self.metrics.gauges == {'api_remaining_hour': 42}
+        assert self.metrics.timings == {'fetch': [2, 0.75, 0.5]}
+
+    def test_timer(self):
+        with self.metrics.timer('parse'):
+            time.sleep(0.01)
+        assert self.metrics.timings['parse'][0] == 1
+        assert self.metrics.timings['parse'][1] >= 0.01
+
+    def test_concurrent_updates(self):
+        def update():
+            for _ in range(2000):
+                self.metrics.count('cache_hits')
+                self.metrics.observe('fetch', 0.5)
+        threads = [threading.Thread(target=update) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert self.metrics.counters['cache_hits'] == 16000
+        assert self.metrics.timings['fetch'] == [16000, 8000.0, 0.5]
+
+    def test_hooks(self):
+        events = []
+        hook = lambda *event: events.append(event)
+        self.metrics.add_hook(hook)
+        self.metrics.count('cache_misses')
+        self.metrics.observe('fetch', 1.0)
+        self.metrics.remove_hook(hook)
+        self.metrics.count('cache_misses')
+        assert events == [('count', 'cache_misses', 1),
+                          ('timing', 'fetch', 1.0)]
+
+    def test_perfdata(self):
+        self.metrics.count('bytes_received', 10)
+        self.metrics.count('cache_hits')
+        self.metrics.gauge('api_remaining_day', None)
+        self.metrics.observe('fetch', 0.5)
+        assert self.metrics.perfdata() == [('bytes_received', 10, 'B'),
+                                           ('cache_hits', 1, 'c'),
+                                           ('fetch_time', 0.5, 's')]
+
+    def test_prometheus(self):
+        self.metrics.count('cache_hits', 3)
+        self.metrics.gauge('api_remaining_hour', 42)
+        self.metrics.observe('fetch', 0.5)
+        assert self.metrics.prometheus().splitlines() == [
+            '# TYPE keynoteapi_cache_hits_total counter',
+            'keynoteapi_cache_hits_total 3',
+            '# TYPE keynoteapi_api_remaining_hour gauge',
+            'keynoteapi_api_remaining_hour 42',
+            '# TYPE keynoteapi_fetch_seconds summary',
+            'keynoteapi_fetch_seconds_count 1',
+            'keynoteapi_fetch_seconds_sum 0.500000',
+            '# TYPE keynoteapi_fetch_seconds_max gauge',
+            'keynoteapi_fetch_seconds_max 0.500000']
+
+
+class KeynoteApiMetricsTest(TempDirTestCase):
+    """instrumentation of the cache and fetch path"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.kapi = self.api()
+
+    def test_fetch_and_cache(self):
+        events = []
+        self.kapi.add_hook(lambda *event: events.append(event[:2]))
+        with StubServer(RESPONSE) as server:
+            self.kapi.api_base = server.api_base
+            self.kapi.get_api_response('getdashboarddata')
+            self.kapi.get_api_response('getdashboarddata')
+            self.kapi.get_http_client().close()
+
+        metrics = self.kapi.metrics
+        assert metrics.counters['cache_misses'] == 1
+        assert metrics.counters['cache_hits'] == 1
+        assert metrics.counters['api_calls'] == 1
+        assert metrics.counters['connections_opened'] == 1
+        # gzip compressed on the wire
+        assert 0 < metrics.counters['bytes_received'] < len(RESPONSE) + 50
+        for name in ('dns', 'connect', 'wait', 'read', 'fetch', 'parse',
+                     'cache_read'):
+            assert metrics.timings[name][0] == 1, name
+        assert 'tls' not in metrics.timings
+        assert metrics.gauges == {'api_remaining_hour': 100,
+                                  'api_remaining_day': 1000}
+        assert ('count', 'cache_misses') in events
+        assert ('timing', 'fetch') in events
+
+    def test_stale_and_errors(self):
+        self.kapi.cache_grace = 60
+        self.kapi.write_json_response(
+            {}, self.kapi.cache_filename + 'getdashboarddata')
+        old = time.time() - 90
+        os.utime(self.kapi.cache_filename + 'getdashboarddata', (old, old))
+        self.kapi.api_base = 'http://127.0.0.1:1/keynote/api'
+        self.kapi.get_api_response('getdashboarddata')
+        self.kapi.wait_for_refresh()
+        assert self.kapi.metrics.counters['cache_stale'] == 1
+        assert self.kapi.metrics.counters['api_errors'] == 1
@@ -0,0 +1,106 @@
+"""
+    Testmodule for keynoteapi.pool
+"""
+import os
+import time
+import keynoteapi.pool
+from keynoteapi.keynoteapi import KeynoteApi
+from tests import TempDirTestCase
+from tests.stub_server import StubServer
+
+with open('tests/json/getdashboarddata_list.json', 'rb') as fixture:
+    LIST_RESPONSE = fixture.read()
+
+
+class AccountServer(StubServer):
+    """answers with the list fixture, slots renamed after the API key"""
+    delay = 0.3
+
+    def respond(self, handler):
+        time.sleep(self.delay)
+        api_key = handler.path.split('api_key=')[1].split('&')[0]
+        if api_key == 'broken':
+            return 500, b'error'
+        return 200, LIST_RESPONSE.replace(
+            b'"WPT_Ford"', ('"%s_Ford"' % api_key).encode('utf-8'))
+
+
+class KeynoteApiPoolTest(TempDirTestCase):
+    """fetch several accounts against a local stand-in server"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.server = AccountServer().__enter__()
+
+    def tearDown(self):
+        self.server.__exit__()
+        TempDirTestCase.tearDown(self)
+
+    def pool(self, api_keys, max_workers=4):
+        pool = keynoteapi.pool.KeynoteApiPool(api_keys,
+                                              max_workers=max_workers)
+        pool.configure(api_base=self.server.api_base,
+                       cache_filename=os.path.join(self.tmpdir, 'cache_'))
+        return pool
+
+    def test_key_namespace(self):
+        assert KeynoteApi('key-a').cache_filename != \
+            KeynoteApi('key-b').cache_filename
+        assert KeynoteApi('key-a').cache_filename == \
+            KeynoteApi('key-a').cache_filename
+        assert KeynoteApi.key_namespace('key-a') not in \
+            KeynoteApi('key-b').cache_filename
+
+    def test_fetch_in_parallel(self):
+        pool = self.pool({'a': 'key-a', 'b': 'key-b', 'c': 'key-c'})
+        start = time.time()
+        assert pool.fetch_all() == {}
+        assert time.time() - start < 2 * AccountServer.delay
+        assert len(self.server.requests) == 3
+        # every account has its own cache file
+        assert len([name for name in os.listdir(self.tmpdir)
+                    if name.endswith('_getdashboarddata')]) == 3
+
+        # fresh caches are not fetched again
+        pool.fetch_all()
+        assert len(self.server.requests) == 3
+
+    def test_max_workers(self):
+        pool = self.pool(['key-a', 'key-b'], max_workers=1)
+        start = time.time()
+        pool.fetch_all()
+        assert time.time() - start >= 2 * AccountServer.delay
+
+    def test_merged_slots(self):
+        pool = self.pool({'a': 'key-a', 'b': 'key-b'})
+        pool.fetch_all()
+        assert pool.get_measurement_slots() == {('a', 'key-a_Ford'): '687588',
+                                                ('b', 'key-b_Ford'): '687588'}
+        slots = list(pool.iter_slots())
+        assert [(slot['account'], slot['alias']) for slot in slots] == \
+            [('a', 'key-a_Ford'), ('b', 'key-b_Ford')]
+        assert slots[0]['threshold_data']
+        assert pool.find('key-b_Ford') == ['b']
+        assert pool.get_remaining_api_calls()['a'] == \
+            pool.apis['a'].get_remaining_api_calls()
+
+    def test_failed_account(self):
+        pool = self.pool({'a': 'key-a', 'x': 'broken'})
+        errors = pool.fetch_all()
+        assert list(errors) == ['x']
+        assert [account for account, _ in pool.get_measurement_slots()] == \
+            ['a']
+
+    def test_accounts_named_by_key_namespace(self):
+        pool = keynoteapi.pool.KeynoteApiPool(['key-a', 'key-b'])
+        assert pool.accounts == sorted([KeynoteApi.key_namespace('key-a'),
+                                        KeynoteApi.key_namespace('key-b')])
+
+    def test_per_account_paths(self):
+        pool = self.pool({'a': 'key-a', 'b': 'key-b'})
+        pool.configure(schedule_file=os.path.join(self.tmpdir, 'schedule'),
+                       history_dir=os.path.join(self.tmpdir, 'history'),
+                       cache_maxage=60)
+        for attribute in ('cache_filename', 'schedule_file', 'history_dir'):
+            assert getattr(pool.apis['a'], attribute) != \
+                getattr(pool.apis['b'], attribute)
+        assert pool.apis['a'].cache_maxage == pool.apis['b'].cache_maxage == 60
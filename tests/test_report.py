@@ -0,0 +1,84 @@
+"""
+    Testmodule for keynoteapi.report
+"""
+import unittest
+import keynoteapi.keynotecli
+import keynoteapi.report
+from tests.test_export import CountingFile
+
+
+def measurement(alias, avail, perf='1.0'):
+    cells = lambda value: [{'name': 'last_one_hour', 'value': value,
+                            'unit': 'seconds', 'duration': '3600'}]
+    return {'alias': alias, 'id': alias, 'avail_data': cells(avail),
+            'perf_data': cells(perf), 'threshold_data': []}
+
+
+MEASUREMENTS = [measurement('b', '99.5'), measurement('a', '-'),
+                measurement('c', '97.0'), measurement('d', '100')]
+
+
+def render(measurements=MEASUREMENTS, *args, **kwargs):
+    outfile = CountingFile()
+    count = keynoteapi.report.render(measurements, outfile, *args, **kwargs)
+    return count, outfile
+
+
+class ReportTest(unittest.TestCase):
+    """render the listing"""
+    def test_text_like_list_measurements(self):
+        kcli = keynoteapi.keynotecli.KeynoteCli(
+            'test-api-key', mockinput='tests/json/getdashboarddata_list.json')
+        outfile = CountingFile()
+        assert kcli.list_measurements(outfile=outfile) == 1
+        lines = outfile.getvalue().split('\n')
+        assert lines[:4] == ['', "# 'WPT_Ford': ", '  Availability data:',
+                             '    - last_five_minute:\t 100%']
+        assert '    - last_24_hours:\t 28.783s' in lines
+        assert '    - performance critical: -1.0' in lines
+
+    def test_grid_uses_aggregated_row(self):
+        kcli = keynoteapi.keynotecli.KeynoteCli(
+            'test-api-key', mockinput='tests/json/getdashboarddata_grid.json')
+        outfile = CountingFile()
+        kcli.list_measurements(outfile=outfile)
+        assert '    - last_one_hour:\t 31.149s' in \
+            outfile.getvalue().split('\n')
+
+    def test_sort_by_slot(self):
+        _, outfile = render(MEASUREMENTS, 'table')
+        rows = outfile.getvalue().splitlines()
+        assert rows[0].split() == ['slot', 'avail:last_one_hour',
+                                   'perf:last_one_hour']
+        assert [row.split()[0] for row in rows[1:]] == ['a', 'b', 'c', 'd']
+        _, outfile = render(MEASUREMENTS, 'table', reverse=True)
+        assert [row.split()[0] for row in
+                outfile.getvalue().splitlines()[1:]] == ['d', 'c', 'b', 'a']
+
+    def test_sort_by_value(self):
+        _, outfile = render(MEASUREMENTS, 'table', 'avail:last_one_hour')
+        assert [row.split()[0] for row in
+                outfile.getvalue().splitlines()[1:]] == ['c', 'b', 'd', 'a']
+        _, outfile = render(MEASUREMENTS, 'table', 'avail:last_one_hour',
+                            reverse=True)
+        # missing values go last either way
+        assert [row.split()[0] for row in
+                outfile.getvalue().splitlines()[1:]] == ['d', 'b', 'c', 'a']
+
+    def test_invalid_sort_key(self):
+        self.assertRaises(ValueError, render, MEASUREMENTS, 'text', 'avail')
+        self.assertRaises(ValueError, render, MEASUREMENTS, 'text', 'x:y')
+
+    def test_filter(self):
+        count, outfile = render(MEASUREMENTS, patterns=['a', 'c*'])
+        assert count == 2
+        assert "# 'b'" not in outfile.getvalue()
+        count, _ = render(MEASUREMENTS, aliases=set(['d']))
+        assert count == 1
+
+    def test_buffered_output(self):
+        many = [measurement('SLOT_%05i' % num, '99.0')
+                for num in range(2000)]
+        count, outfile = render(many, buffer_size=4096)
+        assert count == 2000
+        assert 1 < len(outfile.writes) < 2000
@@ -0,0 +1,167 @@
+"""
+    Testmodule for keynoteapi.retry and the deadline-aware fetching of
+    KeynoteApi against a fault-injecting stand-in server
+"""
+import json
+import os
+import random
+import time
+import keynoteapi.cache
+import keynoteapi.retry
+from tests import TempDirTestCase
+from tests.stub_server import FaultyServer
+
+RESPONSE = json.dumps({'remaining_api_calls': {
+    'hour_call_remaining': 100, 'day_call_remaining': 1000}}).encode('utf-8')
+STALE = {'remaining_api_calls': {'hour_call_remaining': 99,
+                                 'day_call_remaining': 999}, 'stale': True}
+
+
+class RetryTest(TempDirTestCase):
+    """backoff, error types and the circuit breaker"""
+    def test_backoff_delays(self):
+        delays = keynoteapi.retry.backoff_delays(0.5, 3, random.Random(1))
+        for limit in (0.5, 1, 2, 3, 3, 3):
+            assert 0 <= next(delays) <= limit
+
+    def test_status_error(self):
+        for status, retryable in ((503, True), (429, True), (404, False)):
+            error = keynoteapi.retry.status_error(status)
+            assert error.status == status
+            assert error.retryable == retryable
+        assert not keynoteapi.retry.CircuitOpen('open').retryable
+        assert isinstance(keynoteapi.retry.DeadlineExceeded('late'),
+                          keynoteapi.retry.ApiError)
+
+    def test_breaker_opens_and_closes(self):
+        state_file = os.path.join(self.tmpdir, 'breaker')
+        breaker = keynoteapi.retry.CircuitBreaker(state_file, threshold=2,
+                                                  reset_timeout=10)
+        breaker.record_failure(now=100)
+        assert not breaker.is_open(now=101)
+        breaker.record_failure(now=100)
+        # shared by all processes using the state file
+        other = keynoteapi.retry.CircuitBreaker(state_file, threshold=2,
+                                                reset_timeout=10)
+        assert other.retry_after(now=105) == 5
+        # trial call after reset_timeout, a failure opens it again
+        assert not other.is_open(now=111)
+        other.record_failure(now=111)
+        assert breaker.is_open(now=120)
+        breaker.record_success()
+        assert not other.is_open(now=120)
+
+    def test_breaker_in_memory(self):
+        breaker = keynoteapi.retry.CircuitBreaker(threshold=1)
+        breaker.record_failure()
+        assert breaker.is_open()
+        breaker.record_success()
+        assert not breaker.is_open()
+        assert os.listdir(self.tmpdir) == []
+
+
+class DeadlineTest(TempDirTestCase):
+    """retries, deadlines and fail over of KeynoteApi.get_api_response"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.kapi = self.api()
+
+    def api(self):
+        kapi = TempDirTestCase.api(self)
+        kapi.memory_cache = None
+        kapi.retry_backoff = 0.01
+        return kapi
+
+    def write_stale(self):
+        filename = self.kapi.cache_filename + 'getdashboarddata'
+        self.kapi.write_json_response(STALE, filename)
+        old = time.time() - 300
+        os.utime(filename, (old, old))
+
+    def fetch(self, server, deadline=None):
+        self.kapi.api_base = server.api_base
+        try:
+            return self.kapi.get_api_response('getdashboarddata', deadline)
+        finally:
+            self.kapi.get_http_client().close()
+
+    def test_retries_transient_errors(self):
+        with FaultyServer(RESPONSE, [503, 429]) as server:
+            response = self.fetch(server)
+        assert response == json.loads(RESPONSE.decode('utf-8'))
+        assert len(server.requests) == 3
+        assert self.kapi.metrics.counters['api_retries'] == 2
+
+    def test_no_retry_of_client_errors(self):
+        with FaultyServer(RESPONSE, [404]) as server:
+            try:
+                self.fetch(server)
+            except keynoteapi.retry.ApiError as err:
+                assert err.status == 404
+            else:
+                assert False, 'no ApiError'
+        assert len(server.requests) == 1
+
+    def test_deadline_bounds_slow_response(self):
+        with FaultyServer(RESPONSE, default=('delay', 2)) as server:
+            start = time.time()
+            self.assertRaises(keynoteapi.retry.ApiError, self.fetch, server,
+                              time.time() + 0.3)
+            assert time.time() - start < 1
+        assert len(server.requests) == 1
+
+    def test_no_retry_past_deadline(self):
+        self.kapi.retry_backoff = self.kapi.retry_backoff_max = 1e6
+        with FaultyServer(RESPONSE, default=503) as server:
+            start = time.time()
+            self.assertRaises(keynoteapi.retry.ApiError, self.fetch, server,
+                              time.time() + 1)
+            assert time.time() - start < 1
+        assert len(server.requests) == 1
+
+    def test_slow_response_fails_over_to_stale(self):
+        self.write_stale()
+        self.kapi.set_timeout(0.6, margin=0.3)
+        with FaultyServer(RESPONSE, default=('delay', 2)) as server:
+            assert self.fetch(server) == STALE
+        assert isinstance(self.kapi.api_error, keynoteapi.retry.ApiError)
+        assert self.kapi.metrics.counters['api_failovers'] == 1
+        assert self.kapi.get_remaining_api_calls() == [99, 999]
+
+    def test_circuit_breaker(self):
+        self.write_stale()
+        self.kapi.api_retries = 0
+        self.kapi.breaker_threshold = 2
+        self.kapi.breaker_reset = 0.3
+        with FaultyServer(RESPONSE, [503, 503]) as server:
+            for _ in range(4):
+                assert self.fetch(server) == STALE
+            # open after two failures, the API is left alone
+            assert len(server.requests) == 2
+            assert isinstance(self.kapi.api_error,
+                              keynoteapi.retry.CircuitOpen)
+            assert self.kapi.metrics.counters['api_calls_suspended'] == 2
+
+            # the breaker state is shared with other instances
+            other = self.api()
+            other.api_base = server.api_base
+            assert other.get_api_response('getdashboarddata') == STALE
+            assert len(server.requests) == 2
+
+            time.sleep(0.3)
+            assert self.fetch(server) != STALE
+            assert not self.kapi.get_breaker().is_open()
+
+    def test_lock_wait_is_bounded(self):
+        lock = keynoteapi.cache.CacheLock(
+            self.kapi.cache_filename + 'getdashboarddata')
+        lock.acquire()
+        try:
+            with FaultyServer(RESPONSE) as server:
+                self.assertRaises(keynoteapi.retry.DeadlineExceeded,
+                                  self.fetch, server, time.time() + 0.2)
+                self.write_stale()
+                assert self.fetch(server, time.time() + 0.2) == STALE
+            assert server.requests == []
+        finally:
+            lock.release()
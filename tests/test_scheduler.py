@@ -0,0 +1,168 @@
+"""
+    Testmodule for keynoteapi.scheduler and scheduled KeynoteApi calls
+"""
+import multiprocessing
+import os
+import time
+import keynoteapi.scheduler
+from tests import TempDirTestCase
+from tests.test_cache import CountingKeynoteApi
+
+# 30 minutes into an hour, 23.5 hours left in the day
+NOW = 86400 * 100 + 1800
+
+
+def scheduled_caller(state_file, results):
+    scheduler = keynoteapi.scheduler.Scheduler(state_file, burst=2)
+    try:
+        results.put(scheduler.acquire('getdashboarddata', now=NOW))
+    except keynoteapi.scheduler.BudgetExceeded:
+        results.put(False)
+
+
+class SchedulerTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.state_file = os.path.join(self.tmpdir, 'schedule')
+        self.scheduler = keynoteapi.scheduler.Scheduler(self.state_file,
+                                                        burst=2)
+
+    def acquire(self, priority=keynoteapi.scheduler.INTERACTIVE, now=NOW):
+        try:
+            return self.scheduler.acquire('getdashboarddata', priority,
+                                          now=now)
+        except keynoteapi.scheduler.BudgetExceeded:
+            return False
+
+    def test_unknown_budget_is_not_limited(self):
+        assert all(self.acquire() for _ in range(10))
+
+    def test_burst_then_spread(self):
+        self.scheduler.update_budget(180, 20000, now=NOW)
+        assert self.acquire() and self.acquire()
+        try:
+            self.scheduler.acquire('getdashboarddata', now=NOW)
+        except keynoteapi.scheduler.BudgetExceeded as err:
+            # 178 calls in 1800 seconds: one every ~10 seconds
+            assert 10 < err.retry_after < 10.2
+        else:
+            raise AssertionError('third call within the burst')
+        assert not self.acquire(now=NOW + 5)
+        assert self.acquire(now=NOW + 11)
+        state = self.scheduler._load()
+        assert state['hour']['remaining'] == 177
+        assert state['day']['remaining'] == 19997
+
+    def test_reserve_is_never_spent(self):
+        self.scheduler.reserve = 2
+        self.scheduler.update_budget(3, 20000, now=NOW)
+        assert self.acquire()
+        try:
+            self.scheduler.acquire('getdashboarddata', now=NOW + 1000)
+        except keynoteapi.scheduler.BudgetExceeded as err:
+            assert 'budget spent' in str(err)
+            # not before the next hour
+            assert err.retry_after == 800
+        else:
+            raise AssertionError('reserve spent')
+
+    def test_new_hour_forgets_budget(self):
+        self.scheduler.update_budget(1, 20000, now=NOW)
+        assert self.acquire()
+        assert not self.acquire(now=NOW + 60)
+        assert self.acquire(now=NOW + 1800)
+
+    def test_background_leaves_last_token(self):
+        self.scheduler.update_budget(3000, 20000, now=NOW)
+        assert self.acquire(keynoteapi.scheduler.BACKGROUND)
+        assert not self.acquire(keynoteapi.scheduler.BACKGROUND)
+        assert self.acquire(keynoteapi.scheduler.INTERACTIVE)
+
+    def test_background_waits_for_interactive(self):
+        self.scheduler.update_budget(3000, 20000, now=NOW)
+        state = self.scheduler._load()
+        state['pending']['1 getdashboarddata'] = ['interactive', NOW]
+        self.scheduler._save(state)
+        assert not self.acquire(keynoteapi.scheduler.BACKGROUND)
+        # waiting calls of crashed processes are forgotten
+        assert self.acquire(keynoteapi.scheduler.BACKGROUND,
+                            now=NOW + keynoteapi.scheduler.PENDING_TIMEOUT)
+
+    def test_wait_for_token(self):
+        self.scheduler.update_budget(3000, 20000)
+        state = self.scheduler._load()
+        state['hour']['tokens'] = 0.9
+        self.scheduler._save(state)
+        start = time.time()
+        assert self.scheduler.acquire('getdashboarddata', wait=5)
+        assert time.time() - start < 5
+        assert self.scheduler._load()['pending'] == {}
+
+    def test_shared_between_processes(self):
+        self.scheduler.update_budget(180, 20000, now=NOW)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(
+            target=scheduled_caller, args=(self.state_file, results))
+            for _ in range(6)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(10)
+        assert sorted(results.get(timeout=1) for _ in processes) == \
+            [False] * 4 + [True] * 2
+
+
+class ScheduledKeynoteApiTest(TempDirTestCase):
+    """KeynoteApi asks the scheduler before every API call"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.calls_filename = os.path.join(self.tmpdir, 'calls')
+        self.kapi = self.in_tmpdir(CountingKeynoteApi(self.calls_filename,
+                                                      delay=0))
+        self.kapi.schedule_file = os.path.join(self.tmpdir, 'schedule')
+        self.cache_filename = self.kapi.cache_filename + 'getdashboarddata'
+
+    def calls(self):
+        if not os.path.exists(self.calls_filename):
+            return 0
+        with open(self.calls_filename) as calls:
+            return len(calls.readlines())
+
+    def spend_budget(self):
+        """ the budget of the last response is used up """
+        self.kapi.api_calls_reserve = 42
+        self.kapi.get_scheduler().update_budget(42, 4242)
+
+    def expire_cache(self):
+        mtime = time.time() - 3600
+        os.utime(self.cache_filename, (mtime, mtime))
+
+    def test_budget_learned_from_responses(self):
+        self.kapi.get_api_response('getdashboarddata')
+        state = self.kapi.get_scheduler().get_state()
+        assert state['hour']['remaining'] == 42
+        assert state['day']['remaining'] == 4242
+
+    def test_refused_call_serves_expired_cache(self):
+        self.kapi.get_api_response('getdashboarddata')
+        self.spend_budget()
+        self.expire_cache()
+        response = self.kapi.get_api_response('getdashboarddata')
+        assert response['remaining_api_calls']['hour_call_remaining'] == 42
+        assert self.calls() == 1
+        assert self.kapi.metrics.counters['api_calls_refused'] == 1
+
+    def test_refused_call_without_cache(self):
+        self.spend_budget()
+        self.assertRaises(keynoteapi.scheduler.BudgetExceeded,
+                          self.kapi.get_api_response, 'getdashboarddata')
+        assert self.calls() == 0
+
+    def test_background_refresh_deferred(self):
+        self.kapi.get_api_response('getdashboarddata')
+        self.spend_budget()
+        self.kapi.refresh_in_background('getdashboarddata')
+        self.kapi.wait_for_refresh()
+        assert isinstance(self.kapi.refresh_error,
+                          keynoteapi.scheduler.BudgetExceeded)
+        assert self.calls() == 1
@@ -0,0 +1,94 @@
+"""
+    Testmodule for keynoteapi.snapshot
+"""
+import math
+import unittest
+import keynoteapi.keynoteapi
+import keynoteapi.snapshot
+from tests import load
+
+
+class SnapshotTest(unittest.TestCase):
+    """build snapshots from the list and grid fixtures"""
+    def setUp(self):
+        self.list_snapshot = keynoteapi.snapshot.Snapshot(
+            load('tests/json/getdashboarddata_list.json'))
+        self.grid_snapshot = keynoteapi.snapshot.Snapshot(
+            load('tests/json/getdashboarddata_grid.json'))
+
+    def test_parse_value(self):
+        assert keynoteapi.snapshot.parse_value('16.726') == 16.726
+        assert math.isnan(keynoteapi.snapshot.parse_value('-'))
+        assert math.isnan(keynoteapi.snapshot.parse_value(''))
+        assert math.isnan(keynoteapi.snapshot.parse_value(None))
+
+    def test_list_layout(self):
+        assert len(self.list_snapshot) == 1
+        measurement = self.list_snapshot.index['WPT_Ford'][0]
+        assert measurement.id == '687588'
+        assert measurement.product == 'TxP'
+        assert measurement.agent is None
+        assert measurement.get_data('perf_data')['last_one_hour'] == 28.465
+        assert measurement.get_value('avail_data', 'last_24_hours') == 97.658
+        assert measurement.get_unit('avail_data') == 'percent'
+
+    def test_list_remaining_api_calls(self):
+        assert self.list_snapshot.remaining_api_calls == [3596, 21596]
+
+    def test_get_value_unknown_name(self):
+        measurement = self.list_snapshot.index['WPT_Ford'][0]
+        assert math.isnan(measurement.get_value('perf_data', 'unknown'))
+
+    def test_grid_layout_uses_aggregated_agent(self):
+        assert len(self.grid_snapshot) == 6
+        entries = self.grid_snapshot.index['WPT_Ford']
+        assert len(entries) == 1
+        assert entries[0].agent == 'All'
+        assert entries[0].get_data('avail_data')['last_7_days'] == 99.405
+
+    def test_grid_agents(self):
+        agents = self.grid_snapshot.agents('WPT_Ford')
+        assert len(agents) == 6
+        assert agents['USA - West'].get_value('perf_data',
+                                              'last_one_hour') == 61.111
+
+    def test_names_and_units_are_shared(self):
+        first, second = self.grid_snapshot.measurements[:2]
+        assert first.names[0] is second.names[0]
+        assert first.get_unit('perf_data') is second.get_unit('perf_data')
+
+    def test_slots_only(self):
+        measurement = self.list_snapshot.measurements[0]
+        self.assertRaises(AttributeError, setattr, measurement, 'foo', 1)
+
+
+class KeynoteapiCompactTest(unittest.TestCase):
+    """KeynoteApi getters reading from the compact snapshot"""
+    def setUp(self):
+        self.keyapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key',
+                                                       compact=True)
+        self.keyapi.set_mockinput('tests/json/getdashboarddata_list.json')
+
+    def test_get_avail_data(self):
+        assert self.keyapi.get_avail_data('WPT_Ford')['last_one_hour'] == \
+            98.193
+
+    def test_get_perf_data(self):
+        assert self.keyapi.get_perf_data('WPT_Ford') == {
+            'last_five_minute': 16.726, 'last_fifteen_minute': 16.726,
+            'last_one_hour': 28.465, 'last_24_hours': 28.783}
+
+    def test_get_threshold_data(self):
+        assert self.keyapi.get_threshold_data('WPT_Ford')['perfwarning'] == \
+            -1.0
+
+    def test_get_measurement_slots(self):
+        assert self.keyapi.get_measurement_slots() == {'WPT_Ford': '687588'}
+
+    def test_invalid_slot(self):
+        assert self.keyapi.get_avail_data('invalid product') == {}
+
+    def test_grid_layout(self):
+        self.keyapi.set_mockinput('tests/json/getdashboarddata_grid.json')
+        assert self.keyapi.get_perf_data('WPT_Ford')['last_one_hour'] == \
+            31.149
@@ -0,0 +1,48 @@
+"""
+    Testmodule guarding the startup cost of keynoteapi
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+from tests import TempDirTestCase
+
+# modules which a check answered from a warm cache must not import
+HEAVY_MODULES = ('ssl', 'http.client', 'httplib', 'socketserver',
+                 'SocketServer', 'tempfile', 'threading', 'mmap', 'zlib',
+                 'requesocks', 'urllib2')
+
+LOOKUP = """
+import json, sys
+from keynoteapi.keynoteapi import KeynoteApi
+kapi = KeynoteApi('test-api-key')
+kapi.cache_filename = sys.argv[1]
+kapi.get_perf_data(sys.argv[2])
+print(json.dumps(sorted(name for name in sys.argv[3:]
+                        if name in sys.modules)))
+"""
+
+
+class StartupTest(TempDirTestCase):
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.cache_filename = os.path.join(self.tmpdir, 'cache_')
+        shutil.copy('tests/json/getdashboarddata_list.json',
+                    self.cache_filename + 'getdashboarddata')
+
+    def imported(self, code, *args):
+        output = subprocess.check_output(
+            [sys.executable, '-c', code] + list(args) + list(HEAVY_MODULES))
+        return json.loads(output.decode('utf-8'))
+
+    def test_import_is_light(self):
+        code = ("import json, sys; import keynoteapi.keynoteapi; "
+                "print(json.dumps([name for name in sys.argv[1:] "
+                "if name in sys.modules]))")
+        assert self.imported(code) == []
+
+    def test_cache_hit_needs_no_network_stack(self):
+        assert self.imported(LOOKUP, self.cache_filename,
+                             'WPT_Ford') == []
+
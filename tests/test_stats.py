@@ -0,0 +1,85 @@
+"""
+    Testmodule for keynoteapi.stats
+"""
+import math
+import random
+import unittest
+import keynoteapi.stats
+
+NAN = float('nan')
+
+
+def isnan(value):
+    return value != value
+
+
+class StatsTest(unittest.TestCase):
+    def test_percentile(self):
+        values = [4.0, 1.0, 3.0, 2.0, NAN]
+        assert keynoteapi.stats.percentile(values, 0) == 1.0
+        assert keynoteapi.stats.percentile(values, 50) == 2.5
+        assert keynoteapi.stats.percentile(values, 100) == 4.0
+        assert abs(keynoteapi.stats.percentile(values, 95) - 3.85) < 1e-9
+        assert isnan(keynoteapi.stats.percentile([NAN], 50))
+        assert isnan(keynoteapi.stats.percentile([], 50))
+
+    def test_mad(self):
+        assert keynoteapi.stats.median([1, 2, 3, 4, 100]) == 3
+        assert keynoteapi.stats.mad([1, 2, 3, 4, 100]) == 1
+        assert keynoteapi.stats.mad([5, 5, 5]) == 0
+
+    def test_ewma(self):
+        assert keynoteapi.stats.ewma([1.0, NAN, 3.0], alpha=0.5) == 2.0
+        assert keynoteapi.stats.ewma([2.0]) == 2.0
+        assert isnan(keynoteapi.stats.ewma([]))
+
+    def test_baselines(self):
+        result = keynoteapi.stats.baselines(
+            {'a': [1.0, 2.0, 3.0, 4.0, 100.0], 'empty': []},
+            percentiles=(50,), use_numpy=False)
+        assert result['a'].count == 5
+        assert result['a'].median == 3.0
+        assert result['a'].percentiles == {50: 3.0}
+        assert abs(result['a'].spread - keynoteapi.stats.MAD_SIGMA) < 1e-9
+        assert result['empty'].count == 0
+        assert isnan(result['empty'].median)
+
+    def test_dynamic_range(self):
+        baseline = keynoteapi.stats.baselines(
+            {'perf': [1.0, 1.0, 2.0, 3.0, 3.0]}, use_numpy=False)['perf']
+        # ewma 2.167, spread 1.4826
+        assert keynoteapi.stats.dynamic_range(baseline, 2) == ':5.1322'
+        assert keynoteapi.stats.dynamic_range(baseline, 1, False) == \
+            '0.6844:'
+        assert keynoteapi.stats.dynamic_range(baseline, 2, False,
+                                              limits=(0, 100)) == '0:'
+        assert keynoteapi.stats.dynamic_range(baseline, 2,
+                                              min_spread=10) == ':22.167'
+        empty = keynoteapi.stats.baselines({'x': []})['x']
+        assert keynoteapi.stats.dynamic_range(empty, 2) is None
+
+
+@unittest.skipIf(keynoteapi.stats.get_numpy() is None, 'needs numpy')
+class NumpyStatsTest(unittest.TestCase):
+    """the batched NumPy path matches the pure Python fallback"""
+    def test_same_results(self):
+        rand = random.Random(0)
+        series = {}
+        for num in range(200):
+            values = [rand.gauss(10, 2) for _ in range(rand.randint(0, 50))]
+            if values and num % 3 == 0:
+                values[rand.randrange(len(values))] = NAN
+            series[num] = values
+        fast = keynoteapi.stats.baselines(series)
+        slow = keynoteapi.stats.baselines(series, use_numpy=False)
+        for key in series:
+            assert fast[key].count == slow[key].count
+            for attr in ('median', 'mad', 'ewma'):
+                expected = getattr(slow[key], attr)
+                value = getattr(fast[key], attr)
+                assert (isnan(value) and isnan(expected)) or \
+                    math.fabs(value - expected) < 1e-9
+            for q, expected in slow[key].percentiles.items():
+                value = fast[key].percentiles[q]
+                assert (isnan(value) and isnan(expected)) or \
+                    math.fabs(value - expected) < 1e-9
@@ -0,0 +1,170 @@
+"""
+    Testmodule for keynoteapi.store
+"""
+import os
+import keynoteapi.cachebackend
+import keynoteapi.keynotecli
+import keynoteapi.store
+from tests import TempDirTestCase
+from tests.test_export import CountingFile
+
+
+def dashboarddata(avail, products=('P',)):
+    """ list layout response, avail: {alias: last_one_hour availability} """
+    def cells(value, unit):
+        return [{'name': 'last_one_hour', 'value': value, 'unit': unit,
+                 'duration': '3600'}]
+    return {'product': [{'id': product, 'name': product, 'measurement': [
+        {'id': alias, 'alias': alias, 'avail_data': cells(value, 'percent'),
+         'perf_data': cells('1.5', 'seconds'), 'threshold_data': []}
+        for alias, value in sorted(avail.items())]} for product in products],
+        'remaining_api_calls': {'hour_call_remaining': 100,
+                                'day_call_remaining': 1000}}
+
+
+AVAIL = {'a': '100', 'b': '98.5', 'c': '99', 'd': '-', 'WPT_x': '97'}
+
+
+class SnapshotStoreTest(TempDirTestCase):
+    """indexed queries on stored snapshots"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.store = keynoteapi.store.SnapshotStore(
+            os.path.join(self.tmpdir, 'snapshots.sqlite'))
+        self.snapshot_id = self.store.append(dashboarddata(AVAIL), 'acc',
+                                             1000.0)
+
+    def tearDown(self):
+        self.store.close()
+        TempDirTestCase.tearDown(self)
+
+    def aliases(self, **kwargs):
+        return [row[0] for row in self.store.select(self.snapshot_id,
+                                                    **kwargs)]
+
+    def test_select_below(self):
+        assert self.aliases(below=99) == ['WPT_x', 'b']
+        assert self.aliases(below=99, inclusive=True) == ['WPT_x', 'b', 'c']
+        assert self.store.select(self.snapshot_id, below=98)[0] == \
+            ('WPT_x', 'P', 97.0, 'percent')
+
+    def test_select_sorted(self):
+        # missing values last
+        assert self.aliases() == ['WPT_x', 'b', 'c', 'a', 'd']
+        assert self.aliases(reverse=True) == ['a', 'c', 'b', 'WPT_x', 'd']
+        assert self.aliases(sort='alias') == ['WPT_x', 'a', 'b', 'c', 'd']
+        assert self.aliases(above=98, limit=2) == ['b', 'c']
+        self.assertRaises(ValueError, self.aliases, sort='x')
+
+    def test_select_filters(self):
+        assert self.aliases(patterns=['WPT_*', 'a']) == ['WPT_x', 'a']
+        assert self.aliases(product='other') == []
+        assert self.aliases(data_type='perf_data', above=1) == \
+            ['WPT_x', 'a', 'b', 'c', 'd']
+
+    def test_uses_indexes(self):
+        plan = ' '.join(str(row) for row in self.store.connection.execute(
+            'EXPLAIN QUERY PLAN SELECT alias FROM slot_values WHERE'
+            ' snapshot_id = ? AND data_type = ? AND timerange = ?'
+            ' AND value < ?', (1, 'avail_data', 'last_one_hour', 99)))
+        assert 'slot_values_timerange' in plan
+
+    def test_latest_and_history(self):
+        newer = self.store.append(dashboarddata(dict(AVAIL, b='99.9')),
+                                  'acc', 2000.0)
+        self.store.append(dashboarddata(AVAIL), 'other', 3000.0)
+        assert self.store.latest('acc') == (newer, 2000.0)
+        assert self.store.history('b', 'avail_data', account='acc') == \
+            [(1000.0, 98.5), (2000.0, 99.9)]
+        assert [row[1] for row in self.store.snapshots('acc', start=1500)] \
+            == [2000.0]
+
+    def test_retention(self):
+        self.store.retention = 500
+        self.store.append(dashboarddata(AVAIL), 'acc', 2000.0)
+        assert [row[1] for row in self.store.snapshots('acc')] == [2000.0]
+        assert self.store.connection.execute(
+            'SELECT COUNT(*) FROM slot_values WHERE snapshot_id = ?',
+            (self.snapshot_id,)).fetchone()[0] == 0
+
+    def test_products(self):
+        snapshot_id = self.store.append(
+            dashboarddata({'a': '90'}, products=('P', 'Q')), 'acc')
+        assert [row[1] for row in self.store.select(snapshot_id)] == \
+            ['P', 'Q']
+
+    def test_parse_condition(self):
+        parse = keynoteapi.store.parse_condition
+        assert parse('avail:last_one_hour<99') == \
+            ('avail_data', 'last_one_hour', {'below': 99.0,
+                                             'inclusive': False})
+        assert parse('perf_data:last_24_hours >= 2.5') == \
+            ('perf_data', 'last_24_hours', {'above': 2.5, 'inclusive': True})
+        for condition in ('avail<99', 'foo:last_one_hour<1',
+                          'avail:last_one_hour=99'):
+            self.assertRaises(ValueError, parse, condition)
+
+
+class KeynoteApiStoreTest(TempDirTestCase):
+    """KeynoteApi query methods on the snapshot store"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.calls = []
+
+    def api(self, avail=AVAIL):
+        kapi = TempDirTestCase.api(self)
+        kapi.memory_cache = keynoteapi.cachebackend.MemoryBackend()
+        kapi.snapshot_db = os.path.join(self.tmpdir, 'snapshots.sqlite')
+
+        def fetch(api_cmd):
+            self.calls.append(api_cmd)
+            return dashboarddata(avail)
+        kapi.fetch_api_response = fetch
+        return kapi
+
+    def test_fetch_is_stored(self):
+        kapi = self.api()
+        kapi.get_dashboarddata()
+        assert kapi.get_snapshot_store().latest(
+            kapi.key_namespace(kapi.api_key)) is not None
+        assert [row[0] for row in kapi.select_slots(below=99)] == \
+            ['WPT_x', 'b']
+        assert len(kapi.get_snapshot_store().snapshots(
+            kapi.key_namespace(kapi.api_key))) == 1
+
+    def test_fresh_cache_is_not_loaded(self):
+        self.api().get_dashboarddata()
+        kapi = self.api()
+        assert [row[0] for row in kapi.select_slots(above=99.5)] == ['a']
+        assert kapi.dashboarddata is None
+        assert self.calls == ['getdashboarddata']
+
+    def test_cache_written_before_the_store(self):
+        kapi = self.api()
+        kapi.snapshot_db = None
+        kapi.get_dashboarddata()
+        kapi = self.api()
+        assert len(kapi.select_slots()) == 5
+        assert kapi.select_slots() == kapi.select_slots()
+        assert len(kapi.get_snapshot_store().snapshots(
+            kapi.key_namespace(kapi.api_key))) == 1
+
+    def test_new_fetches(self):
+        kapi = self.api()
+        kapi.cache_usage = False
+        kapi.get_api_response('getdashboarddata')
+        kapi.fetch_api_response = lambda api_cmd: dashboarddata({'b': '50'})
+        kapi.dashboarddata = None
+        assert kapi.select_slots(below=99) == \
+            [('b', 'P', 50.0, 'percent')]
+        assert [value for _, value in kapi.select_slot_history(
+            'b', 'avail_data')] == [98.5, 50.0]
+
+    def test_without_snapshot_db(self):
+        kcli = keynoteapi.keynotecli.KeynoteCli(
+            'test-api-key', mockinput='tests/json/getdashboarddata_list.json')
+        outfile = CountingFile()
+        assert kcli.query('avail:last_one_hour<99', outfile=outfile) == 1
+        assert outfile.getvalue() == 'WPT_Ford\t98.193 percent\n'
+        assert kcli.query('avail:last_one_hour<98', outfile=outfile) == 0
+        assert kcli.kapi.get_snapshot_store().filename == ':memory:'
@@ -0,0 +1,243 @@
+"""
+    Testmodule for keynoteapi.streaming
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import keynoteapi.keynoteapi
+import keynoteapi.streaming
+from tests import TempDirTestCase, write_large_dashboard
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+
+def cells(**values):
+    return [{'name': name, 'value': value, 'duration': '300',
+             'unit': 'seconds'} for name, value in sorted(values.items())]
+
+
+# the alias 'dup' occurs in two products, later values win
+DUPLICATED = {'product': [
+    {'id': 'P1', 'name': 'P1', 'measurement': [
+        {'id': '1', 'alias': 'dup', 'perf_data': cells(a='1', b='2'),
+         'avail_data': [], 'threshold_data': []}]},
+    {'id': 'P2', 'name': 'P2', 'measurement': [
+        {'id': '2', 'alias': 'dup', 'perf_data': cells(b='3'),
+         'avail_data': [], 'threshold_data': []}]}],
+    'remaining_api_calls': {'hour_call_remaining': 1,
+                            'day_call_remaining': 2}}
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+class StreamingTest(unittest.TestCase):
+    """incremental parsing of the fixtures"""
+    def iter_file(self, filename, mode='rb', chunk_size=65536):
+        with open(filename, mode) as infile:
+            return list(keynoteapi.streaming.iter_measurements(infile,
+                                                               chunk_size))
+
+    def test_list_layout(self):
+        items = self.iter_file('tests/json/getdashboarddata_list.json')
+        assert len(items) == 1
+        assert items[0]['alias'] == 'WPT_Ford'
+        assert items[0]['perf_data'][2]['value'] == '28.465'
+
+    def test_grid_layout(self):
+        items = self.iter_file('tests/json/getdashboarddata_grid.json')
+        assert len(items) == 6
+        assert items[1]['y-alias'] == 'USA - West'
+
+    def test_small_chunks(self):
+        for filename in ('tests/json/getdashboarddata_list.json',
+                         'tests/json/getdashboarddata_grid.json'):
+            with open(filename) as infile:
+                data = json.load(infile)
+            expected = [m for p in data.get('product', [])
+                        for m in p['measurement']] + data.get('grid-rows', [])
+            for chunk_size in (1, 7, 100):
+                assert self.iter_file(filename, 'r', chunk_size) == expected
+
+    def test_no_measurements(self):
+        assert self.iter_file('tests/json/getdashboarddata_noresponse.json') \
+            == []
+        assert self.iter_file('tests/json/empty.json') == []
+
+    def test_truncated(self):
+        infile = io.BytesIO(b'{"product": [{"measurement": [{"alias": "a"}, '
+                            b'{"alias": ')
+        self.assertRaises(ValueError, list,
+                          keynoteapi.streaming.iter_measurements(infile, 4))
+
+    def test_find_measurement(self):
+        with open('tests/json/getdashboarddata_list.json', 'rb') as infile:
+            item = keynoteapi.streaming.find_measurement(infile, 'WPT_Ford')
+        assert item['id'] == '687588'
+        with open('tests/json/getdashboarddata_list.json', 'rb') as infile:
+            assert keynoteapi.streaming.find_measurement(infile, 'x') is None
+
+    def test_find_measurement_grid_prefers_aggregate(self):
+        with open('tests/json/getdashboarddata_grid.json', 'rb') as infile:
+            item = keynoteapi.streaming.find_measurement(infile, 'WPT_Ford')
+        assert item['y-alias'] == 'All'
+
+    def test_find_measurement_duplicated_alias(self):
+        infile = io.BytesIO(json.dumps(DUPLICATED).encode('utf-8'))
+        found = keynoteapi.streaming.find_measurements(infile, 'dup', 8)
+        assert [item['id'] for item in found] == ['1', '2']
+        infile.seek(0)
+        assert keynoteapi.streaming.find_measurement(infile, 'dup')['id'] \
+            == '2'
+
+    def test_remaining_api_calls(self):
+        for chunk_size in (1, 7, 65536):
+            extras = {}
+            with open('tests/json/getdashboarddata_list.json') as infile:
+                keynoteapi.streaming.find_measurements(
+                    infile, 'WPT_Ford', chunk_size, extras=extras)
+            assert extras['remaining_api_calls'] == {
+                'hour_call_remaining': 3596, 'day_call_remaining': 21596}
+
+    def test_stops_early(self):
+        # grid rows of a slot are contiguous, list layout aliases are not
+        infile = io.BytesIO(b'{"grid-rows": [{"x-alias": "a", "y-alias": '
+                            b'"All"}, {"x-alias": "b"}, garbage')
+        item = keynoteapi.streaming.find_measurement(infile, 'a', 8)
+        assert item == {'x-alias': 'a', 'y-alias': 'All'}
+
+
+class KeynoteapiStreamingTest(TempDirTestCase):
+    """KeynoteApi getters in streaming mode"""
+    def setUp(self):
+        TempDirTestCase.setUp(self)
+        self.keyapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+        self.keyapi.set_mockinput('tests/json/getdashboarddata_list.json')
+        self.keyapi.streaming = True
+
+    def test_getters(self):
+        assert self.keyapi.get_perf_data('WPT_Ford')['last_one_hour'] == \
+            '28.465'
+        assert self.keyapi.get_avail_data('WPT_Ford')['last_24_hours'] == \
+            '97.658'
+        assert self.keyapi.get_avail_data('invalid product') == {}
+        assert self.keyapi.get_remaining_api_calls() == [3596, 21596]
+        assert self.keyapi.dashboarddata is None
+
+    def test_duplicated_alias(self):
+        mockinput = os.path.join(self.tmpdir, 'getdashboarddata.json')
+        with open(mockinput, 'w') as outfile:
+            json.dump(DUPLICATED, outfile)
+        self.keyapi.set_mockinput(mockinput)
+        assert self.keyapi.get_perf_data('dup') == {'a': '1', 'b': '3'}
+        assert self.keyapi.find_measurement('dup')['id'] == '2'
+        assert self.keyapi.dashboarddata is None
+        # the same as with the loaded response
+        self.keyapi.get_dashboarddata()
+        assert self.keyapi.get_perf_data('dup') == {'a': '1', 'b': '3'}
+        assert self.keyapi.find_measurement('dup')['id'] == '2'
+
+    def test_compact_getters(self):
+        self.keyapi.compact = True
+        assert self.keyapi.get_perf_data('WPT_Ford')['last_one_hour'] == \
+            28.465
+        assert self.keyapi.dashboarddata is None
+
+    def test_iter_measurements(self):
+        aliases = [m['alias'] for m in self.keyapi.iter_measurements()]
+        assert aliases == ['WPT_Ford']
+        self.keyapi.get_dashboarddata()
+        aliases = [m['alias'] for m in self.keyapi.iter_measurements()]
+        assert aliases == ['WPT_Ford']
+
+    def cached_api(self, remaining, age):
+        """ streaming KeynoteApi with DUPLICATED cached age seconds ago """
+        response = dict(DUPLICATED, remaining_api_calls=remaining)
+        kapi = self.api()
+        kapi.write_cache(response, kapi.cache_filename + 'getdashboarddata')
+        old = time.time() - age
+        for suffix in ('', '.meta'):
+            os.utime(kapi.cache_filename + 'getdashboarddata' + suffix,
+                     (old, old))
+        kapi = self.api()
+        kapi.streaming = True
+        kapi.memory_cache = None
+        kapi.cache_maxage = 1
+        kapi.api_base = 'http://127.0.0.1:1/keynote/api'
+        kapi.api_retries = 0
+        return kapi
+
+    def test_cached_budget_stretches_ttl(self):
+        # expired by cache_maxage, but not with the tight cached budget
+        kapi = self.cached_api({'hour_call_remaining': 1,
+                                'day_call_remaining': 1}, 5)
+        assert kapi.get_perf_data('dup') == {'a': '1', 'b': '3'}
+        assert kapi.dashboarddata is None
+        assert 'cache_read' not in kapi.metrics.timings
+        assert kapi.api_error is None
+
+    def test_expired_cache_is_parsed_once(self):
+        kapi = self.cached_api({'hour_call_remaining': 3000,
+                                'day_call_remaining': 20000}, 3600)
+        assert kapi.get_perf_data('dup') == {'a': '1', 'b': '3'}
+        assert kapi.api_error is not None
+        # the stale copy served on the failed fetch is kept
+        assert kapi.dashboarddata is not None
+        assert kapi.metrics.timings['cache_read'][0] == 1
+
+
+@unittest.skipIf(tracemalloc is None, 'needs tracemalloc')
+class StreamingMemoryTest(unittest.TestCase):
+    """peak memory of streaming stays flat in the number of slots"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp(prefix='keynoteapi-test-')
+        cls.small = os.path.join(cls.tmpdir, 'small.json')
+        cls.large = os.path.join(cls.tmpdir, 'large.json')
+        write_large_dashboard(cls.small, 1000)
+        write_large_dashboard(cls.large, 20000)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @staticmethod
+    def stream_all(filename):
+        with open(filename, 'rb') as infile:
+            for _ in keynoteapi.streaming.iter_measurements(infile):
+                pass
+
+    @staticmethod
+    def load_all(filename):
+        with open(filename, 'rb') as infile:
+            json.load(infile)
+
+    def test_constant_peak_memory(self):
+        small = peak_memory(self.stream_all, self.small)
+        large = peak_memory(self.stream_all, self.large)
+        assert large < 1.5 * small, (small, large)
+        assert large < 1024 * 1024, large
+
+    def test_less_memory_than_full_load(self):
+        streamed = peak_memory(self.stream_all, self.large)
+        loaded = peak_memory(self.load_all, self.large)
+        assert streamed * 20 < loaded, (streamed, loaded)
+
+    def test_find_first_slot_reads_little(self):
+        def find(filename):
+            with open(filename, 'rb') as infile:
+                keynoteapi.streaming.find_measurement(infile, 'SLOT_000000')
+        assert peak_memory(find, self.large) < 512 * 1024
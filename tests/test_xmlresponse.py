@@ -0,0 +1,158 @@
+"""
+    Testmodule for keynoteapi.xmlresponse
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import keynoteapi.keynoteapi
+import keynoteapi.streaming
+import keynoteapi.xmlresponse
+from keynoteapi.snapshot import Snapshot
+from tests import TempDirTestCase, write_large_dashboard
+from tests.stub_server import StubServer
+from tests.test_streaming import peak_memory, tracemalloc
+
+
+def parse(filename):
+    with open(filename, 'rb') as infile:
+        return keynoteapi.xmlresponse.parse(infile)
+
+
+class XmlResponseTest(unittest.TestCase):
+    """parse the XML fixtures"""
+    def test_list_layout(self):
+        response = parse('tests/xml/getdashboarddata_list.xml')
+        product = response['product'][0]
+        assert (product['id'], product['name']) == ('TxP', 'TxP')
+        measurement = product['measurement'][0]
+        assert (measurement['id'], measurement['alias']) == \
+            ('687588', 'WPT_Ford')
+        assert measurement['perf_data'][2] == {
+            'name': 'last_one_hour', 'value': '28.465', 'duration': '3600',
+            'unit': 'seconds'}
+        assert len(measurement['threshold_data']) == 4
+
+    def test_grid_layout(self):
+        response = parse('tests/xml/getdashboarddata_grid.xml')
+        assert response['grid_dimension']['y-axis'] == {'name': 'agent',
+                                                        'rows': '6'}
+        rows = response['grid-rows']
+        assert len(rows) == 6
+        assert rows[0]['x-alias'] == 'WPT_Ford'
+        assert rows[4]['y-alias'] == 'AT&T'
+        snapshot = Snapshot(response)
+        assert snapshot.index['WPT_Ford'][0].agent == 'All'
+
+    def test_same_data_model_as_json(self):
+        xml = Snapshot(parse('tests/xml/getdashboarddata_list.xml'))
+        with open('tests/json/getdashboarddata_list.json') as infile:
+            json_ = Snapshot(json.load(infile))
+        assert sorted(xml.index) == sorted(json_.index)
+        for data_type in ('perf_data', 'avail_data', 'threshold_data'):
+            assert sorted(xml.measurements[0].get_data(data_type)) == \
+                sorted(json_.measurements[0].get_data(data_type))
+        assert xml.measurements[0].get_unit('perf_data') == 'seconds'
+
+    def test_remaining_api_calls(self):
+        response = keynoteapi.xmlresponse.parse(io.BytesIO(
+            b'<dashboard_list_data><remaining_api_calls>'
+            b'<hour_call_remaining>10</hour_call_remaining>'
+            b'<day_call_remaining>20</day_call_remaining>'
+            b'</remaining_api_calls></dashboard_list_data>'))
+        assert response['remaining_api_calls'] == {
+            'hour_call_remaining': 10, 'day_call_remaining': 20}
+
+    def test_find_measurement_grid_prefers_aggregate(self):
+        with open('tests/xml/getdashboarddata_grid.xml', 'rb') as infile:
+            item = keynoteapi.xmlresponse.find_measurement(infile,
+                                                           'WPT_Ford')
+        assert item['y-alias'] == 'All'
+
+    def test_find_measurement_duplicated_alias(self):
+        infile = io.BytesIO(
+            b'<dashboard_list_data>'
+            b'<product id="P1"><measurement id="1"><alias>dup</alias>'
+            b'</measurement></product>'
+            b'<product id="P2"><measurement id="2"><alias>dup</alias>'
+            b'</measurement></product>'
+            b'<remaining_api_calls hour_call_remaining="10" '
+            b'day_call_remaining="20" /></dashboard_list_data>')
+        extras = {}
+        found = keynoteapi.xmlresponse.find_measurements(infile, 'dup',
+                                                         extras=extras)
+        assert [item['id'] for item in found] == ['1', '2']
+        assert extras['remaining_api_calls'] == {
+            'hour_call_remaining': 10, 'day_call_remaining': 20}
+
+    def test_is_xml(self):
+        with open('tests/xml/getdashboarddata_list.xml', 'rb') as infile:
+            assert keynoteapi.streaming.is_xml(infile)
+            assert infile.tell() == 0
+        with open('tests/json/getdashboarddata_list.json', 'rb') as infile:
+            assert not keynoteapi.streaming.is_xml(infile)
+
+
+class KeynoteapiXmlTest(TempDirTestCase):
+    """KeynoteApi on XML responses"""
+    def api(self):
+        kapi = keynoteapi.keynoteapi.KeynoteApi('test-api-key')
+        kapi.set_mockinput('tests/xml/getdashboarddata_list.xml')
+        return kapi
+
+    def test_getters(self):
+        kapi = self.api()
+        assert kapi.get_measurement_slots() == {'WPT_Ford': '687588'}
+        assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == '28.465'
+        assert kapi.get_threshold_data('WPT_Ford')['perfwarning'] == '-1.0'
+
+    def test_streaming_getters(self):
+        kapi = self.api()
+        kapi.streaming = True
+        kapi.compact = True
+        assert kapi.get_perf_data('WPT_Ford')['last_one_hour'] == 28.465
+        assert kapi.dashboarddata is None
+
+    def test_fetch_xml(self):
+        with open('tests/xml/getdashboarddata_grid.xml', 'rb') as infile:
+            body = infile.read()
+        with StubServer(body) as server:
+            kapi = TempDirTestCase.api(self, compact=True)
+            kapi.api_base = server.api_base
+            kapi.api_format = 'xml'
+            assert kapi.get_measurement_slots() == {'WPT_Ford': '1'}
+            assert server.requests[0].endswith('format=xml')
+        # cached in the shared data model
+        kapi = TempDirTestCase.api(self, compact=True)
+        kapi.cache_maxage = 3600
+        assert kapi.get_avail_data('WPT_Ford')['last_7_days'] == 99.405
+
+
+@unittest.skipIf(tracemalloc is None, 'needs tracemalloc')
+class XmlMemoryTest(unittest.TestCase):
+    """peak memory of iterparse with element clearing stays flat"""
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp(prefix='keynoteapi-test-')
+        cls.small = os.path.join(cls.tmpdir, 'small.xml')
+        cls.large = os.path.join(cls.tmpdir, 'large.xml')
+        write_large_dashboard(cls.small, 1000, 'xml')
+        write_large_dashboard(cls.large, 20000, 'xml')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    @staticmethod
+    def stream_all(filename):
+        with open(filename, 'rb') as infile:
+            for _ in keynoteapi.xmlresponse.iter_measurements(infile):
+                pass
+
+    def test_constant_peak_memory(self):
+        small = peak_memory(self.stream_all, self.small)
+        large = peak_memory(self.stream_all, self.large)
+        assert large < 1.5 * small, (small, large)
+        assert large < 1024 * 1024, large